@@ -0,0 +1,106 @@
+"""Persisted record of LLM features each provider/model pair has rejected."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+CAPABILITIES = ("structured", "tools")
+
+# An error body has to mention one of these before a 400/422 counts as rejecting structured outputs
+_STRUCTURED_MARKERS = ("response_format", "json_schema", "structured")
+
+
+def mentions_structured_outputs(error_text: str) -> bool:
+    """Return True when a provider error body refers to structured outputs."""
+    text = (error_text or "").lower()
+    return any(marker in text for marker in _STRUCTURED_MARKERS)
+
+
+class CapabilityRegistry:
+    """Remember which request features a ``(provider, model)`` rejected, with a TTL.
+
+    Entries live in a small JSON file so the knowledge survives restarts and is
+    shared by every agent process using the same working directory; the file
+    is reloaded whenever its modification time changes, so a rejection one
+    process records is seen by the others on their next lookup. Only
+    rejections are stored; anything unknown or expired is assumed supported,
+    so a provider that fixes support is retried once the TTL lapses.
+    """
+
+    def __init__(self, path: str = "llm_capabilities.json", ttl_seconds: float = 86400.0):
+        """Load existing entries from ``path``; missing or corrupt files start empty."""
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(provider: str, model: str) -> str:
+        return f"{provider}|{model}"
+
+    def _mtime_ns(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> dict:
+        self._mtime = self._mtime_ns()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning("Ignoring unreadable capability cache %s: %s", self.path, e)
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._mtime = self._mtime_ns()
+        except OSError as e:
+            logging.warning("Could not persist capability cache %s: %s", self.path, e)
+
+    def get(self, provider: str, model: str) -> dict:
+        """Return ``{"structured": bool, "tools": bool}`` for the pair, honouring the TTL."""
+        now = time.time()
+        with self._lock:
+            if self._mtime_ns() != self._mtime:
+                # Another process recorded something; what is on disk already includes its merge
+                self._entries.update(self._load())
+            entry = self._entries.get(self._key(provider, model), {})
+            result = {}
+            for capability in CAPABILITIES:
+                record = entry.get(capability)
+                rejected = (
+                    isinstance(record, dict)
+                    and record.get("supported") is False
+                    and now - float(record.get("recorded_at", 0)) < self.ttl_seconds
+                )
+                result[capability] = not rejected
+        return result
+
+    def record_rejection(self, provider: str, model: str, capability: str, reason: str = ""):
+        """Persist that ``capability`` was rejected by ``(provider, model)``."""
+        with self._lock:
+            # Merge with what other processes may have written since we loaded
+            for key, entry in self._load().items():
+                self._entries[key] = {**entry, **self._entries.get(key, {})}
+            entry = self._entries.setdefault(self._key(provider, model), {})
+            entry[capability] = {
+                "supported": False,
+                "recorded_at": time.time(),
+                "reason": reason[:300],
+            }
+            self._save()
+        logging.info("Recorded %s/%s as not supporting %s", provider, model, capability)
@@ -0,0 +1,156 @@
+"""Pre-LLM gate that skips the decision call when nothing material has changed."""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from src.utils.prompt_utils import safe_float
+
+
+class ChangeDetectionGate:
+    """Fingerprint quantized per-asset state and reuse the last decision while it is stable.
+
+    Each asset is reduced to a coarse tuple: the mid price, the RSI band, MACD
+    sign on both timeframes, price vs. EMA20, the position side and size, and
+    whether price sits close to one of the asset's TP/SL triggers. Fingerprints
+    are compared against the ones recorded at the last *successful* LLM
+    decision: price counts as moved once it leaves a band of
+    ``price_move_pct`` around that decision's price (so slow drift still
+    accumulates and a price hovering on a fixed bucket edge cannot flap), and
+    every other field must match exactly. A refresh is forced after
+    ``max_skips`` consecutive skipped cycles.
+    """
+
+    def __init__(
+        self,
+        price_move_pct: float = 0.25,
+        rsi_band: float = 10.0,
+        trigger_proximity_pct: float = 0.5,
+        max_skips: int = 6,
+    ):
+        """Configure quantization thresholds and the forced-refresh cadence.
+
+        Args:
+            price_move_pct: Price move (percent) from the last decision's price
+                that counts as material.
+            rsi_band: Width of an RSI14 band in RSI points (0 compares exact values).
+            trigger_proximity_pct: Distance (percent of price) at which a TP/SL
+                trigger counts as "near" and forces a fresh decision.
+            max_skips: Consecutive skipped cycles before an LLM call is forced.
+        """
+        self.price_move_pct = price_move_pct
+        self.rsi_band = rsi_band
+        self.trigger_proximity_pct = trigger_proximity_pct
+        self.max_skips = max_skips
+        self.skips = 0
+        self._baseline: dict[str, tuple] | None = None
+        self._last_decisions: dict[str, dict] = {}
+
+    @staticmethod
+    def _sign(value: Any) -> int:
+        numeric = safe_float(value)
+        if numeric is None or numeric == 0:
+            return 0
+        return 1 if numeric > 0 else -1
+
+    def fingerprint(self, section: dict, position: dict | None = None, trigger_prices: Iterable[Any] = ()) -> tuple:
+        """Reduce one asset's market section, position and triggers to a comparable tuple.
+
+        Args:
+            section: Per-asset entry from ``market_sections``.
+            position: Raw Hyperliquid position dict for the asset, if any.
+            trigger_prices: Trigger prices of the asset's resting TP/SL orders.
+
+        Returns:
+            Fingerprint tuple; compare two of them with :meth:`evaluate`.
+        """
+        price = safe_float(section.get("current_price"))
+        intraday = section.get("intraday") or {}
+        long_term = section.get("long_term") or {}
+        lt_macd = (long_term.get("macd_series") or [None])[-1]
+
+        rsi = safe_float(intraday.get("rsi14"))
+        if rsi is None:
+            rsi_band = None
+        else:
+            # A zero band width means any RSI change is material
+            rsi_band = int(rsi // self.rsi_band) if self.rsi_band else rsi
+        ema20 = safe_float(intraday.get("ema20"))
+        above_ema = self._sign(price - ema20) if price is not None and ema20 is not None else 0
+
+        size = safe_float((position or {}).get("szi")) or 0.0
+        position_state = (self._sign(size), round(abs(size), 6))
+
+        near_trigger = False
+        if price:
+            for trigger in trigger_prices:
+                trigger_px = safe_float(trigger)
+                if trigger_px and abs(price - trigger_px) / price * 100.0 <= self.trigger_proximity_pct:
+                    near_trigger = True
+                    break
+
+        return (
+            price,
+            rsi_band,
+            self._sign(intraday.get("macd")),
+            self._sign(lt_macd),
+            above_ema,
+            position_state,
+            near_trigger,
+        )
+
+    def _is_material(self, baseline: tuple, current: tuple) -> bool:
+        """Return True when ``current`` differs materially from ``baseline``."""
+        if baseline[1:] != current[1:]:
+            return True
+        base_px, px = baseline[0], current[0]
+        if not base_px or not px:
+            return base_px != px
+        return abs(px - base_px) / base_px * 100.0 > self.price_move_pct
+
+    def evaluate(self, fingerprints: dict[str, tuple]) -> tuple[bool, list[str]]:
+        """Decide whether the LLM must be called for this cycle.
+
+        Returns:
+            ``(should_call, changed_assets)``. When ``should_call`` is False the
+            skip counter has been advanced and :meth:`held_outputs` should be
+            used in place of a fresh decision.
+        """
+        if self._baseline is None or set(fingerprints) != set(self._baseline):
+            return True, sorted(fingerprints)
+        changed = [asset for asset, fp in fingerprints.items() if self._is_material(self._baseline[asset], fp)]
+        if changed:
+            return True, changed
+        if self.skips >= self.max_skips:
+            return True, []
+        self.skips += 1
+        return False, []
+
+    def commit(self, fingerprints: dict[str, tuple], outputs: dict):
+        """Record the state a successful LLM decision was made on."""
+        self._baseline = dict(fingerprints)
+        self._last_decisions = {
+            d.get("asset"): d for d in outputs.get("trade_decisions", []) if isinstance(d, dict)
+        }
+        self.skips = 0
+
+    def held_outputs(self, assets: Iterable[str]) -> dict:
+        """Return the previous decisions re-issued as holds for a skipped cycle."""
+        decisions = []
+        for asset in assets:
+            prev = self._last_decisions.get(asset) or {}
+            prev_action = prev.get("action", "hold")
+            decisions.append({
+                "asset": asset,
+                "action": "hold",
+                "allocation_usd": 0.0,
+                "tp_price": None,
+                "sl_price": None,
+                "exit_plan": prev.get("exit_plan", ""),
+                "rationale": f"No material change since last decision ({prev_action}): {prev.get('rationale', '')}".strip(),
+            })
+        return {
+            "reasoning": f"Change gate: state unchanged for {self.skips} cycle(s); reusing previous decision",
+            "summary": "Nothing material moved since my last look, so I'm sticking with the current plan.",
+            "trade_decisions": decisions,
+        }
@@ -3,51 +3,497 @@
 import requests
 from src.config_loader import CONFIG
 from src.indicators.local_indicators import LocalIndicatorCalculator
+from src.agent.stream_parser import TradeDecisionStreamParser
+from src.agent.latency import LatencyTracker
+from src.agent.capabilities import CapabilityRegistry, mentions_structured_outputs
+from src.agent.json_repair import RepairStats, repair_decisions
+from src.agent.metrics import LLMMetrics
+from src.agent.effort import ReasoningController, market_activity
+from src.agent.ensemble import ENSEMBLE_RULES, agreement, merge_votes, usable_decisions
+from src.agent.thesis import THESIS_SCHEMA, valid_thesis
+from src.utils.rotating_log import Blob, config_options, open_log
+import contextvars
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 
+FETCH_INDICATOR_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "fetch_indicator",
+        "description": ("Calculate technical indicator from live Binance data. Available: ema, sma, rsi, macd, atr, "
+            "bbands, stochastic, adx, and other common indicators. "
+            "Specify indicator name, symbol (e.g. 'BTC/USDT'), interval (e.g. '5m', '1h', '4h'), and optional period."),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "indicator": {"type": "string"},
+                "symbol": {"type": "string"},
+                "interval": {"type": "string"},
+                "period": {"type": "integer"},
+                "backtrack": {"type": "integer"},
+                "other_params": {"type": "object", "additionalProperties": {"type": ["string", "number", "boolean"]}},
+            },
+            "required": ["indicator", "symbol", "interval"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+KNOWN_PROVIDERS = ("openai", "openrouter")
+
+
+class RequestCancelled(requests.RequestException):
+    """Raised when an in-flight LLM request is abandoned, e.g. after losing a hedge race."""
+
+
+class DeadlineExceeded(RequestCancelled):
+    """Raised when the cycle deadline passed before a decision was produced."""
+
+
+# Absolute ``time.monotonic()`` deadline of the decide_trade() call running in this context
+_cycle_deadline = contextvars.ContextVar("llm_cycle_deadline", default=None)
+
+
+RETRY_INSTRUCTION = (
+    "Your previous reply could not be used: it was not a valid JSON object per the schema. "
+    "Reply again with ONLY that JSON object, one trade_decisions entry per asset, and no prose."
+)
+
+# Portfolio-wide notional cap (x available balance) applied when merging sharded decisions
+MAX_PORTFOLIO_LEVERAGE = {"conservative": 5, "moderate": 10, "high": 20, "debug": 1}
+
+
 class TradingAgent:
     """High-level trading agent that delegates reasoning to an LLM service."""
 
-    def __init__(self, risk_profile="conservative"):
-        """Initialize LLM configuration, metadata headers, and indicator helper."""
+    def __init__(self, risk_profile="conservative", metrics_path=None):
+        """Initialize LLM configuration, metadata headers, and indicator helper.
+
+        Args:
+            risk_profile: Risk profile name used for prompt guidance and budgets.
+            metrics_path: JSONL file for per-call/per-decision LLM metrics;
+                defaults to ``LLM_METRICS_LOG``.
+        """
         self.model = CONFIG["llm_model"]
         self.provider = CONFIG.get("llm_provider", "openai")
-
-        if self.provider == "openai":
-            self.api_key = CONFIG["openai_api_key"]
-            self.base_url = "https://api.openai.com/v1/chat/completions"
-            self.referer = None
-            self.app_title = None
-        else:  # openrouter
-            self.api_key = CONFIG["openrouter_api_key"]
-            base = CONFIG["openrouter_base_url"]
-            self.base_url = f"{base}/chat/completions"
-            self.referer = CONFIG.get("openrouter_referer")
-            self.app_title = CONFIG.get("openrouter_app_title")
+        self.endpoint = self._resolve_endpoint(self.provider)
 
         self.indicator_calc = LocalIndicatorCalculator()
         self.risk_profile = risk_profile
         # Fast/cheap sanitizer model to normalize outputs on parse failures
         self.sanitize_model = CONFIG.get("sanitize_model") or "gpt-4o-mini"
+        # Stream completions over SSE so decisions can be acted on before the reply finishes
+        self.stream = bool(CONFIG.get("llm_stream"))
+        # "latency" puts trade_decisions first and defers long-form reasoning to explain_decisions()
+        self.decision_mode = (CONFIG.get("llm_decision_mode") or "standard").lower()
+        self.rationale_model = CONFIG.get("llm_rationale_model") or self.sanitize_model
+        # Split large asset lists into concurrent per-shard calls (0 = single call)
+        self.shard_size = CONFIG.get("llm_shard_size") or 0
+        # Per-model request latency; drives the adaptive hedge delay
+        self.latency = LatencyTracker()
+        # Backup "provider:model" raced against a slow primary (unset disables hedging)
+        self.hedge_spec = self._parse_model_spec(CONFIG["llm_hedge_model"]) if CONFIG.get("llm_hedge_model") else None
+        self.hedge_percentile = CONFIG.get("llm_hedge_percentile") or 95
+        self.hedge_default_delay = CONFIG.get("llm_hedge_delay_seconds") or 10.0
+        self.hedge_min_delay = CONFIG.get("llm_hedge_min_delay_seconds") or 1.0
+        # Corrective retries continue the same conversation, capped in count and in tokens per decision
+        self.max_retries = CONFIG.get("llm_max_retries")
+        if self.max_retries is None:
+            self.max_retries = 1
+        self.retry_token_budget = CONFIG.get("llm_retry_token_budget") or 20000
+        # Tokens, latency and cost per call and per decision
+        self.metrics = LLMMetrics(
+            metrics_path if metrics_path is not None else CONFIG.get("llm_metrics_log"),
+            pricing=CONFIG.get("llm_pricing"),
+            log_options=config_options(CONFIG, "request_log_sample_rate"),
+        )
+        # Full request payloads for debugging, written by a background thread
+        self.request_log = open_log("llm_requests.log", **config_options(CONFIG, "request_log_sample_rate"))
+        # Reasoning effort and output cap chosen per call from market activity and time left
+        self.reasoning = ReasoningController(
+            max_effort=(CONFIG.get("reasoning_effort") or "high").lower(),
+            token_caps=CONFIG.get("reasoning_token_caps"),
+            calm_move_pct=CONFIG.get("reasoning_calm_move_pct") or 0.3,
+            active_move_pct=CONFIG.get("reasoning_active_move_pct") or 1.0,
+        )
+        # Success rate of the local JSON repair stage that runs before the sanitizer model
+        self.repair_stats = RepairStats()
+        # Features (structured outputs, tools) each provider/model has rejected before
+        self.capabilities = CapabilityRegistry(
+            CONFIG.get("llm_capability_cache") or "llm_capabilities.json",
+            ttl_seconds=(CONFIG.get("llm_capability_ttl_hours") or 24.0) * 3600,
+        )
+        # Two-stage mode: shared per-asset thesis model, then a cheap per-account sizing model
+        self.thesis_spec = self._parse_model_spec(CONFIG.get("thesis_model") or f"{self.provider}:{self.model}")
+        self.sizing_spec = self._parse_model_spec(CONFIG.get("thesis_sizing_model") or self.sanitize_model)
+        # Models decided concurrently and merged per asset; the primary always votes first
+        self.ensemble = [(self.provider, self.model)]
+        for spec in CONFIG.get("llm_ensemble_models") or []:
+            member = self._parse_model_spec(spec)
+            if member not in self.ensemble:
+                self.ensemble.append(member)
+        self.ensemble_rule = (CONFIG.get("llm_ensemble_rule") or "majority").lower()
+        if self.ensemble_rule not in ENSEMBLE_RULES:
+            logging.warning("Unknown LLM_ENSEMBLE_RULE %r; using majority", self.ensemble_rule)
+            self.ensemble_rule = "majority"
+        self.ensemble_timeout = CONFIG.get("llm_ensemble_timeout_seconds") or 60.0
+        self.ensemble_quorum = max(1, CONFIG.get("llm_ensemble_quorum") or 1)
+        if self.hedge_spec and self.stream:
+            logging.warning("LLM hedging is not applied to streamed decision rounds (LLM_STREAM is on)")
+        if len(self.ensemble) > 1 and (self.stream or self.shard_size):
+            logging.warning("Ensemble mode decides all assets per member and emits decisions only after the vote")
+
+    @staticmethod
+    def _resolve_endpoint(provider):
+        """Return URL and credentials for ``provider`` ("openai" or "openrouter").
+
+        ``LLM_BASE_URL`` replaces the provider's base URL, e.g. to target the
+        offline stub in ``src/llm_stub.py``.
+        """
+        base_url = (CONFIG.get("llm_base_url") or "").rstrip("/")
+        if provider == "openai":
+            return {
+                "provider": "openai",
+                "url": f"{base_url or 'https://api.openai.com/v1'}/chat/completions",
+                "api_key": CONFIG["openai_api_key"],
+                "referer": None,
+                "app_title": None,
+            }
+        # openrouter
+        return {
+            "provider": "openrouter",
+            "url": f"{base_url or CONFIG['openrouter_base_url']}/chat/completions",
+            "api_key": CONFIG["openrouter_api_key"],
+            "referer": CONFIG.get("openrouter_referer"),
+            "app_title": CONFIG.get("openrouter_app_title"),
+        }
+
+    def _parse_model_spec(self, spec):
+        """Split ``"provider:model"`` into ``(provider, model)``; bare names use the primary provider."""
+        prefix, sep, rest = spec.partition(":")
+        if sep and prefix in KNOWN_PROVIDERS:
+            return prefix, rest
+        return self.provider, spec
 
-    def decide_trade(self, assets, context):
+    def decide_trade(self, assets, context, on_decision=None, deadline=None, theses=None):
         """Decide for multiple assets in one call.
 
         Args:
             assets: Iterable of asset tickers to score.
             context: Structured market/account state forwarded to the LLM.
+            on_decision: Optional callback invoked with each normalized decision
+                as soon as it is fully streamed. Only used when streaming is
+                enabled and the call is not sharded; the complete result is
+                still returned at the end.
+            deadline: Optional absolute ``time.monotonic()`` value. HTTP reads,
+                tool calls, retries and sanitizer calls stop once it passes.
+            theses: Optional ``{asset: entry}`` from :meth:`market_theses`.
+                When given, only the cheap sizing stage runs: ``context`` then
+                needs the account state and current prices, not indicators.
 
         Returns:
             List of trade decision payloads, one per asset.
+
+        Raises:
+            DeadlineExceeded: If ``deadline`` passed before a decision was made.
         """
-        return self._decide(context, assets=assets)
+        assets = list(assets)
+        trace, token = self.metrics.begin_decision(self.model, len(assets))
+        deadline_token = _cycle_deadline.set(deadline)
+        result = None
+        try:
+            if theses is not None:
+                result = self._decide_sized(context, assets, theses)
+            elif len(self.ensemble) > 1:
+                result = self._decide_ensemble(context, assets)
+            elif self.shard_size and len(assets) > self.shard_size:
+                result = self._decide_sharded(context, assets, on_decision=on_decision)
+            else:
+                result = self._decide(context, assets=assets, on_decision=on_decision)
+            return result
+        finally:
+            _cycle_deadline.reset(deadline_token)
+            self.metrics.end_decision(trace, token, failed=self.is_failed_output(result))
+
+    @staticmethod
+    def _remaining_budget():
+        """Seconds left before the cycle deadline, or ``None`` without a deadline."""
+        deadline = _cycle_deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _check_deadline(self, stage):
+        """Raise :class:`DeadlineExceeded` if the cycle deadline has passed."""
+        remaining = self._remaining_budget()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"Cycle deadline passed before {stage}")
+
+    def _request_timeout(self):
+        """HTTP timeout for an LLM call, shortened to the time left before the deadline."""
+        remaining = self._remaining_budget()
+        if remaining is None:
+            return 60
+        self._check_deadline("LLM request")
+        return min(60, max(0.5, remaining))
+
+    @staticmethod
+    def is_failed_output(result):
+        """Return True when ``result`` is missing decisions or is an all-hold parse-error fallback."""
+        if not isinstance(result, dict):
+            return True
+        decisions = result.get("trade_decisions")
+        if not isinstance(decisions, list) or not decisions:
+            return True
+        return all(
+            isinstance(d, dict)
+            and d.get("action") == "hold"
+            and "parse error" in (d.get("rationale") or "").lower()
+            for d in decisions
+        )
+
+    def _portfolio_budget(self, payload):
+        """Return the notional allocation budget implied by the context's account balance."""
+        try:
+            balance = float((payload.get("account") or {}).get("balance") or 0.0)
+        except (TypeError, ValueError, AttributeError):
+            return None
+        if balance <= 0:
+            return None
+        return balance * MAX_PORTFOLIO_LEVERAGE.get(self.risk_profile, 5)
+
+    @staticmethod
+    def _shard_context(payload, shard, shard_budget):
+        """Return the JSON context restricted to ``shard``'s market data and budget."""
+        sharded = dict(payload)
+        sharded["market_data"] = [m for m in payload.get("market_data") or [] if m.get("asset") in shard]
+        instructions = dict(payload.get("instructions") or {})
+        instructions["assets"] = list(shard)
+        if shard_budget is not None:
+            instructions["allocation_budget_usd"] = round(shard_budget, 2)
+            instructions["allocation_note"] = (
+                "Other assets are decided in parallel calls; keep the sum of allocation_usd for these assets "
+                "within allocation_budget_usd."
+            )
+        sharded["instructions"] = instructions
+        return json.dumps(sharded)
+
+    def _decide_shard(self, context, shard):
+        """Decide one shard; unusable output is retried inside :meth:`_decide`."""
+        try:
+            return self._decide(context, assets=shard)
+        except DeadlineExceeded:
+            raise
+        except requests.RequestException as e:
+            logging.error("Shard %s request failed: %s", shard, e)
+            return self._hold_all(shard, "Parse error", "")
+        except Exception as e:
+            # Hold only this shard; the other shards' decisions still apply
+            logging.exception("Shard %s failed: %s", shard, e)
+            return self._hold_all(shard, "Parse error", "")
+
+    def _decide_sharded(self, context, assets, on_decision=None):
+        """Fan ``assets`` out over concurrent shard calls and merge the results.
+
+        The merged allocations are held to one portfolio-wide notional budget:
+        if the shards together overshoot it, every buy/sell allocation is
+        scaled down proportionally. Decisions are therefore not streamed to
+        ``on_decision`` from the shards: executing one before the merge would
+        bypass that scaling. The callback only applies to the unsharded
+        fallback.
+        """
+        try:
+            payload = json.loads(context)
+        except (json.JSONDecodeError, TypeError):
+            payload = None
+        if not isinstance(payload, dict):
+            logging.warning("Context is not a JSON object; skipping sharding")
+            return self._decide(context, assets=assets, on_decision=on_decision)
+
+        shards = [assets[i:i + self.shard_size] for i in range(0, len(assets), self.shard_size)]
+        budget = self._portfolio_budget(payload)
+        logging.info("Deciding %s assets in %s concurrent shards", len(assets), len(shards))
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._decide_shard,
+                    self._shard_context(payload, shard, budget * len(shard) / len(assets) if budget else None),
+                    shard,
+                )
+                for shard in shards
+            ]
+            results = [f.result() for f in futures]
+
+        by_asset = {}
+        summaries = []
+        reasoning = []
+        for shard, result in zip(shards, results):
+            for d in result.get("trade_decisions", []):
+                if isinstance(d, dict) and d.get("asset") in shard:
+                    by_asset.setdefault(d["asset"], d)
+            if result.get("summary"):
+                summaries.append(result["summary"])
+            if result.get("reasoning"):
+                reasoning.append(f"[{', '.join(shard)}] {result['reasoning']}")
+        decisions = [by_asset[a] for a in assets if a in by_asset]
+
+        if budget:
+            requested = sum(
+                float(d.get("allocation_usd") or 0.0) for d in decisions if d.get("action") in ("buy", "sell")
+            )
+            if requested > budget:
+                scale = budget / requested
+                logging.warning("Shard allocations $%.2f exceed portfolio budget $%.2f; scaling by %.3f", requested, budget, scale)
+                for d in decisions:
+                    if d.get("action") in ("buy", "sell"):
+                        d["allocation_usd"] = round(float(d.get("allocation_usd") or 0.0) * scale, 2)
+
+        return {"reasoning": "\n\n".join(reasoning), "summary": " ".join(summaries), "trade_decisions": decisions}
+
+    def _decide_sized(self, context, assets, theses):
+        """Second stage: size and direct this account's trades from the shared theses."""
+        try:
+            payload = json.loads(context)
+        except (json.JSONDecodeError, TypeError):
+            payload = None
+        if not isinstance(payload, dict):
+            logging.warning("Context is not a JSON object; cannot attach market theses")
+            return self._decide(context, assets=assets)
+        payload["market_theses"] = [
+            {**theses[a]["thesis"], "assessed_at": theses[a].get("created_at")} for a in assets if a in theses
+        ]
+        missing = [a for a in assets if a not in theses]
+        if missing:
+            logging.warning("No market thesis for %s; those assets will be held", missing)
+        return self._decide(
+            json.dumps(payload),
+            assets=assets,
+            model_spec=self.sizing_spec,
+            system_prompt=self._build_sizing_prompt(assets),
+            tools=False,
+        )
+
+    def _decide_member(self, context, assets, member, deadline):
+        """Run one ensemble member with its cycle deadline capped at ``deadline``."""
+        cycle_deadline = _cycle_deadline.get()
+        _cycle_deadline.set(deadline if cycle_deadline is None else min(deadline, cycle_deadline))
+        started = time.monotonic()
+        return self._decide(context, assets=assets, model_spec=member), time.monotonic() - started
+
+    def _decide_ensemble(self, context, assets):
+        """Ask every ensemble member concurrently and merge the answers by vote.
+
+        Members run in parallel, so the round takes as long as the slowest
+        member that answers before ``LLM_ENSEMBLE_TIMEOUT_SECONDS`` (or the
+        cycle deadline, if sooner). Later answers are not waited for. Fewer
+        than ``LLM_ENSEMBLE_QUORUM`` usable answers holds every asset.
+        """
+        started = time.monotonic()
+        deadline = started + self.ensemble_timeout
+        remaining = self._remaining_budget()
+        if remaining is not None:
+            deadline = min(deadline, started + remaining)
+        names = [model for _, model in self.ensemble]
+
+        pool = ThreadPoolExecutor(max_workers=len(self.ensemble))
+        try:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._decide_member, context, assets, member, deadline)
+                for member in self.ensemble
+            ]
+            wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            pool.shutdown(wait=False)
+
+        answers = []
+        members = {}
+        for name, fut in zip(names, futures):
+            if not fut.done() or isinstance(fut.exception(), DeadlineExceeded):
+                fut.cancel()
+                members[name] = {"status": "late", "latency": None, "agreement": None}
+                continue
+            if fut.exception() is not None:
+                logging.error("Ensemble member %s failed: %s", name, fut.exception())
+                members[name] = {"status": "error", "latency": None, "agreement": None}
+                continue
+            result, latency = fut.result()
+            by_asset = usable_decisions(result, assets)
+            members[name] = {"status": "counted" if by_asset else "invalid", "latency": round(latency, 4),
+                             "agreement": None}
+            if by_asset:
+                answers.append((name, by_asset))
+        wall_time = time.monotonic() - started
 
-    def _decide(self, context, assets):
-        """Dispatch decision request to the LLM and enforce output contract."""
+        if len(answers) < self.ensemble_quorum:
+            self.metrics.record_ensemble(self.ensemble_rule, wall_time, members)
+            self._check_deadline("ensemble vote")
+            logging.warning("Ensemble quorum not met (%d/%d usable answers)", len(answers), self.ensemble_quorum)
+            return self._hold_all(assets, "Parse error", f"Only {len(answers)} of {len(names)} models answered usably.")
 
-        # Risk-profile specific guidance
+        weights = self.metrics.ensemble_agreement() if self.ensemble_rule == "confidence" else None
+        decisions, votes = merge_votes(answers, assets, rule=self.ensemble_rule, weights=weights)
+        for name, rate in agreement(votes, decisions).items():
+            members[name]["agreement"] = rate
+        self.metrics.record_ensemble(self.ensemble_rule, wall_time, members)
+        logging.info(
+            "Ensemble (%s) merged %d/%d answers in %.2fs: %s",
+            self.ensemble_rule, len(answers), len(names), wall_time,
+            ", ".join(f"{name}={m['status']}" for name, m in members.items()),
+        )
+        counted = [name for name, _ in answers]
+        return {
+            "reasoning": f"Ensemble of {', '.join(counted)} ({self.ensemble_rule} vote).",
+            "summary": " ".join(
+                f"[{name}] {fut.result()[0].get('summary')}"
+                for name, fut in zip(names, futures)
+                if name in counted and fut.result()[0].get("summary")
+            ),
+            "trade_decisions": decisions,
+        }
+
+    def explain_decisions(self, context, result):
+        """Produce the long-form rationale for an already-executed decision set.
+
+        Used in latency mode, where the decision call skips ``reasoning``. This
+        runs on the cheap rationale model, off the trading critical path, and
+        feeds the dashboard and diary only.
+
+        Args:
+            context: The same market/account context the decision was made on.
+            result: The decision payload returned by :meth:`decide_trade`.
+
+        Returns:
+            Reasoning text, or an empty string when the call fails.
+        """
+        payload = {
+            "model": self.rationale_model,
+            "messages": [
+                {"role": "system", "content": (
+                    "You are a QUANTITATIVE TRADER reviewing decisions that were just executed. "
+                    "Given the market/account context and the decisions, write a detailed step-by-step analysis "
+                    "explaining them per asset: structure, momentum, volatility, positioning, and how each exit plan "
+                    "would be invalidated. Plain text, no JSON."
+                )},
+                {"role": "user", "content": json.dumps({
+                    "context": context,
+                    "summary": result.get("summary", ""),
+                    "trade_decisions": result.get("trade_decisions", []),
+                })},
+            ],
+            "temperature": 0,
+        }
+        try:
+            resp = self._post(payload, purpose="rationale")
+            return (resp.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+        except (requests.RequestException, KeyError, IndexError, ValueError, TypeError) as e:
+            logging.error("Rationale follow-up failed: %s", e)
+            return ""
+
+    def _risk_guidance(self):
+        """Return the risk-profile section shared by the decision and sizing prompts."""
         if self.risk_profile == "debug":
             risk_guidance = (
                 "RISK PROFILE: DEBUG - FAST TESTING MODE\n"
@@ -100,7 +546,11 @@ class TradingAgent:
                 "- WIDE STOPS: 1-2% stop losses for room to breathe.\n"
                 "- Take profits at 2-4% gains.\n\n"
             )
+        return risk_guidance
 
+    def _build_system_prompt(self, assets):
+        """Compose the system prompt for ``assets`` under the active risk profile."""
+        risk_guidance = self._risk_guidance()
         system_prompt = (
             "You are a rigorous QUANTITATIVE TRADER and interdisciplinary MATHEMATICIAN-ENGINEER optimizing risk-adjusted returns for perpetual futures under real execution, margin, and funding constraints.\n"
             "You will receive market + account context for SEVERAL assets, including:\n"
@@ -134,157 +584,439 @@ class TradingAgent:
             "Reasoning recipe (first principles)\n"
             "- Structure (trend, EMAs slope/cross, HH/HL vs LH/LL), Momentum (MACD regime, RSI slope), Liquidity/volatility (ATR, volume), Positioning tilt (funding, OI).\n"
             "- Favor alignment across 4h and 5m. Counter-trend scalps require stronger intraday confirmation and tighter risk.\n\n"
-            "Output contract\n"
-            "- Output a STRICT JSON object with exactly three properties in this order:\n"
-            "  • reasoning: long-form string capturing detailed, step-by-step analysis (be verbose, for internal use).\n"
+            f"{self._output_contract()}"
+        )
+        return system_prompt
+
+    def _build_sizing_prompt(self, assets):
+        """Compose the second-stage prompt that turns shared market theses into this account's trades."""
+        return (
+            "You are a POSITION SIZER for perpetual futures. The market analysis is already done: "
+            "you receive one market thesis per asset (bias, conviction 0-1, levels, TP/SL and invalidation), "
+            "plus this account's balance, positions and active trades.\n"
+            f"- assets = {json.dumps(assets)}\n\n"
+            f"{self._risk_guidance()}"
+            "Your job, per asset:\n"
+            "- Decide buy / sell / hold by weighing the thesis bias and conviction against the risk profile's "
+            "confluence requirement and the existing position. Do not redo the technical analysis.\n"
+            "- An asset without a thesis must be held.\n"
+            "- Size allocation_usd from the balance and the risk profile; treat it as notional exposure.\n"
+            "- Start from the thesis TP/SL and adjust them to the risk profile. "
+            "BUY: tp_price > current_price > sl_price. SELL: tp_price < current_price < sl_price.\n"
+            "- exit_plan must include the thesis invalidation trigger.\n"
+            "- Use the 'current time' in the user message for cooldowns and timed exits.\n\n"
+            f"{self._output_contract()}"
+        )
+
+    def _build_thesis_prompt(self):
+        """Compose the first-stage prompt for an account-independent, per-asset market assessment."""
+        return (
+            "You are a rigorous QUANTITATIVE MARKET ANALYST for perpetual futures. You receive public market data "
+            "for ONE asset: price, recent mids, intraday (5m) and higher-timeframe (4h) indicators, funding and "
+            "open interest. There is no account context; your assessment is shared by many traders with different "
+            "risk profiles.\n"
+            "Assess structure (trend, EMA slope/cross), momentum (MACD regime, RSI slope), volatility (ATR) and "
+            "positioning (funding, OI). Favor alignment across 4h and 5m.\n"
+            "Output a STRICT JSON object with keys {asset, bias, conviction, support, resistance, tp_price, sl_price, "
+            "invalidation, analysis}:\n"
+            "- bias: bullish / bearish / neutral; conviction: 0 (none) to 1 (very strong).\n"
+            "- tp_price/sl_price: levels for a trade in the direction of the bias (null when neutral).\n"
+            "- invalidation: the explicit condition that voids the thesis.\n"
+            "- analysis: 2-4 sentences.\n"
+            "Do not emit Markdown or any extra properties."
+        )
+
+    def assess_market(self, asset, market_section):
+        """Produce the shared first-stage thesis for one asset.
+
+        Args:
+            asset: Asset ticker.
+            market_section: The asset's ``market_data`` entry (public data only).
+
+        Returns:
+            Thesis dict matching ``THESIS_SCHEMA``, or ``None`` when the model
+            did not return a usable one.
+        """
+        provider, model = self.thesis_spec
+        allow_structured = self.capabilities.get(provider, model)["structured"]
+        data = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": self._build_thesis_prompt()},
+                {"role": "user", "content": json.dumps(market_section)},
+            ],
+        }
+        if allow_structured:
+            data["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "market_thesis", "strict": True, "schema": THESIS_SCHEMA},
+            }
+        endpoint = self._resolve_endpoint(provider)
+        try:
+            resp_json = self._post(data, endpoint, purpose="thesis")
+        except requests.HTTPError as e:
+            if not allow_structured or e.response is None or e.response.status_code not in (400, 422):
+                raise
+            if mentions_structured_outputs(e.response.text):
+                logging.warning("Provider rejected structured outputs for the thesis; retrying without response_format.")
+                self.capabilities.record_rejection(provider, model, "structured", e.response.text)
+            else:
+                # Possibly unrelated to response_format: retry without it, but do not remember it
+                logging.warning("Thesis request failed with %s; retrying once without response_format.",
+                                e.response.status_code)
+            data.pop("response_format")
+            resp_json = self._post(data, endpoint, purpose="thesis")
+        message = resp_json["choices"][0]["message"]
+        thesis = message.get("parsed")
+        if not isinstance(thesis, dict):
+            try:
+                thesis = json.loads(message.get("content") or "")
+            except (json.JSONDecodeError, TypeError):
+                thesis = None
+        if not valid_thesis(thesis, asset):
+            logging.error("Unusable market thesis for %s: %s", asset, (message.get("content") or "")[:200])
+            return None
+        return thesis
+
+    def market_theses(self, market_sections, cache, interval, interval_seconds, deadline=None):
+        """Fetch (or compute, once across all sessions) the thesis for every asset concurrently.
+
+        Args:
+            market_sections: ``market_data`` entries gathered this cycle.
+            cache: :class:`ThesisCache` shared by the session processes.
+            interval: Interval label used in the cache key.
+            interval_seconds: Bucket length; one thesis per asset per bucket.
+            deadline: Optional absolute ``time.monotonic()`` value.
+
+        Returns:
+            ``{asset: cache entry}`` for the assets with a thesis.
+        """
+        sections = [s for s in market_sections if s.get("asset")]
+        if not sections:
+            return {}
+        deadline_token = _cycle_deadline.set(deadline)
+        try:
+            with ThreadPoolExecutor(max_workers=len(sections)) as pool:
+                futures = {
+                    section["asset"]: pool.submit(
+                        contextvars.copy_context().run,
+                        cache.get_or_compute,
+                        section["asset"],
+                        interval,
+                        interval_seconds,
+                        lambda section=section: self.assess_market(section["asset"], section),
+                        deadline,
+                    )
+                    for section in sections
+                }
+            theses = {}
+            for asset, fut in futures.items():
+                try:
+                    entry = fut.result()
+                except (requests.RequestException, KeyError, IndexError) as e:
+                    logging.error("Market thesis for %s failed: %s", asset, e)
+                    continue
+                if entry is not None:
+                    theses[asset] = entry
+            return theses
+        finally:
+            _cycle_deadline.reset(deadline_token)
+
+    def _output_contract(self):
+        """Return the output-contract section of the system prompt for the active decision mode."""
+        summary_spec = (
             "  • summary: A SHORT (2-4 sentences) first-person conversational summary of your decision. Write like a human trader talking about their positions. Examples:\n"
             "    - \"I'm holding my BTC position - the bearish momentum hasn't reversed yet and I don't see a clear entry signal.\"\n"
             "    - \"I'm adding to my ETH long here. The RSI divergence looks bullish and funding is favorable for longs.\"\n"
             "    - \"Closing my short on BTC - the oversold RSI suggests a bounce is coming and I don't want to fight the trend.\"\n"
+        )
+        if self.decision_mode == "latency":
+            # Decisions first so the executor can act before the summary is written;
+            # long-form reasoning is produced off the critical path by explain_decisions().
+            return (
+                "Output contract\n"
+                "- Output a STRICT JSON object with exactly two properties in this order:\n"
+                "  • trade_decisions: array ordered to match the provided assets list.\n"
+                f"{summary_spec}"
+                "- Each item inside trade_decisions must contain the keys {asset, action, allocation_usd, tp_price, sl_price, exit_plan, rationale}.\n"
+                "- Keep each rationale to ONE short sentence and each exit_plan to one line. Do NOT write step-by-step analysis.\n"
+                "- Do not emit Markdown or any extra properties.\n"
+            )
+        return (
+            "Output contract\n"
+            "- Output a STRICT JSON object with exactly three properties in this order:\n"
+            "  • reasoning: long-form string capturing detailed, step-by-step analysis (be verbose, for internal use).\n"
+            f"{summary_spec}"
             "  • trade_decisions: array ordered to match the provided assets list.\n"
             "- Each item inside trade_decisions must contain the keys {asset, action, allocation_usd, tp_price, sl_price, exit_plan, rationale}.\n"
             "- Do not emit Markdown or any extra properties.\n"
         )
-        user_prompt = context
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-
-        tools = [{
-            "type": "function",
-            "function": {
-                "name": "fetch_indicator",
-                "description": ("Calculate technical indicator from live Binance data. Available: ema, sma, rsi, macd, atr, "
-                    "bbands, stochastic, adx, and other common indicators. "
-                    "Specify indicator name, symbol (e.g. 'BTC/USDT'), interval (e.g. '5m', '1h', '4h'), and optional period."),
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "indicator": {"type": "string"},
-                        "symbol": {"type": "string"},
-                        "interval": {"type": "string"},
-                        "period": {"type": "integer"},
-                        "backtrack": {"type": "integer"},
-                        "other_params": {"type": "object", "additionalProperties": {"type": ["string", "number", "boolean"]}},
-                    },
-                    "required": ["indicator", "symbol", "interval"],
-                    "additionalProperties": False,
-                },
-            },
-        }]
 
+    def _headers(self, endpoint=None):
+        """Return HTTP headers for ``endpoint`` (defaults to the configured provider)."""
+        endpoint = endpoint or self.endpoint
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {endpoint['api_key']}",
             "Content-Type": "application/json",
         }
-        if self.referer:
-            headers["HTTP-Referer"] = self.referer
-        if self.app_title:
-            headers["X-Title"] = self.app_title
-
-        def _post(payload):
-            """Send a POST request to OpenRouter, logging request and response metadata."""
-            # Log the full request payload for debugging
-            logging.info("Sending request to OpenRouter (model: %s)", payload.get('model'))
-            with open("llm_requests.log", "a", encoding="utf-8") as f:
-                f.write(f"\n\n=== {datetime.now()} ===\n")
-                f.write(f"Model: {payload.get('model')}\n")
-                f.write(f"Headers: {json.dumps({k: v for k, v in headers.items() if k != 'Authorization'})}\n")
-                f.write(f"Payload:\n{json.dumps(payload, indent=2)}\n")
-            resp = requests.post(self.base_url, headers=headers, json=payload, timeout=60)
-            logging.info("Received response from OpenRouter (status: %s)", resp.status_code)
-            if resp.status_code != 200:
-                logging.error("OpenRouter error: %s - %s", resp.status_code, resp.text)
-                with open("llm_requests.log", "a", encoding="utf-8") as f:
-                    f.write(f"ERROR Response: {resp.status_code} - {resp.text}\n")
-            resp.raise_for_status()
-            return resp.json()
-
-        def _sanitize_output(raw_content: str, assets_list):
-            """Coerce arbitrary LLM output into the required reasoning + summary + decisions schema."""
+        if endpoint.get("referer"):
+            headers["HTTP-Referer"] = endpoint["referer"]
+        if endpoint.get("app_title"):
+            headers["X-Title"] = endpoint["app_title"]
+        return headers
+
+    def _log_request(self, payload, headers):
+        """Queue the outgoing payload for ``llm_requests.log``.
+
+        The message list is copied because later rounds append to it while the
+        writer thread may still be serializing this record. System prompts are
+        written once per log segment and referenced by hash after that.
+        """
+        messages = [
+            dict(m, content=Blob(m["content"])) if m.get("role") == "system" and isinstance(m.get("content"), str) else m
+            for m in payload.get("messages") or []
+        ]
+        self.request_log.write({
+            "timestamp": datetime.now().isoformat(),
+            "type": "request",
+            "model": payload.get("model"),
+            "headers": {k: v for k, v in headers.items() if k != "Authorization"},
+            "payload": dict(payload, messages=messages),
+        })
+
+    def _log_error_response(self, resp):
+        """Record a non-200 provider response in the process and request logs."""
+        logging.error("OpenRouter error: %s - %s", resp.status_code, resp.text)
+        self.request_log.write({
+            "timestamp": datetime.now().isoformat(),
+            "type": "error_response",
+            "status": resp.status_code,
+            "body": resp.text,
+        }, force=True)
+
+    def _post(self, payload, endpoint=None, cancel_event=None, purpose="decision"):
+        """Send a POST request to OpenRouter, logging request and response metadata.
+
+        Args:
+            payload: Chat completion request body.
+            endpoint: Provider endpoint from :meth:`_resolve_endpoint`; defaults
+                to the configured provider.
+            cancel_event: Optional ``threading.Event``; when given, the body is
+                read in chunks and the request is abandoned with
+                :class:`RequestCancelled` once the event is set.
+            purpose: Label for the metrics record ("decision", "hedge",
+                "sanitize", "rationale").
+        """
+        endpoint = endpoint or self.endpoint
+        headers = self._headers(endpoint)
+        model = payload.get("model")
+        # Log the full request payload for debugging
+        logging.info("Sending request to OpenRouter (model: %s)", model)
+        self._log_request(payload, headers)
+        started = time.monotonic()
+        try:
+            resp = requests.post(endpoint["url"], headers=headers, json=payload, timeout=self._request_timeout(), stream=cancel_event is not None)
+        except requests.RequestException as e:
+            self.metrics.record_call(model, endpoint["provider"], purpose, type(e).__name__, time.monotonic() - started)
+            if isinstance(e, requests.Timeout):
+                self._check_deadline("LLM response")
+            raise
+        # requests measures elapsed up to the response headers, i.e. time to first byte
+        ttfb = resp.elapsed.total_seconds()
+        logging.info("Received response from OpenRouter (status: %s)", resp.status_code)
+        if resp.status_code != 200:
+            self._log_error_response(resp)
+            self.metrics.record_call(model, endpoint["provider"], purpose, resp.status_code, time.monotonic() - started, ttfb)
+        resp.raise_for_status()
+        if cancel_event is None:
+            result = resp.json()
+        else:
+            chunks = []
             try:
-                schema = {
-                    "type": "object",
-                    "properties": {
-                        "reasoning": {"type": "string"},
-                        "summary": {"type": "string"},
-                        "trade_decisions": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "asset": {"type": "string", "enum": assets_list},
-                                    "action": {"type": "string", "enum": ["buy", "sell", "hold"]},
-                                    "allocation_usd": {"type": "number"},
-                                    "tp_price": {"type": ["number", "null"]},
-                                    "sl_price": {"type": ["number", "null"]},
-                                    "exit_plan": {"type": "string"},
-                                    "rationale": {"type": "string"},
-                                },
-                                "required": ["asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale"],
-                                "additionalProperties": False,
-                            },
-                            "minItems": 1,
-                        }
-                    },
-                    "required": ["reasoning", "summary", "trade_decisions"],
-                    "additionalProperties": False,
-                }
-                payload = {
-                    "model": self.sanitize_model,
-                    "messages": [
-                        {"role": "system", "content": (
-                            "You are a strict JSON normalizer. Return ONLY a JSON array matching the provided JSON Schema. "
-                            "If input is wrapped or has prose/markdown, fix it. Do not add fields."
-                        )},
-                        {"role": "user", "content": raw_content},
-                    ],
-                    "response_format": {
-                        "type": "json_schema",
-                        "json_schema": {
-                            "name": "trade_decisions",
-                            "strict": True,
-                            "schema": schema,
-                        },
-                    },
-                    "temperature": 0,
-                }
-                resp = _post(payload)
-                msg = resp.get("choices", [{}])[0].get("message", {})
-                parsed = msg.get("parsed")
-                if isinstance(parsed, dict):
-                    if "trade_decisions" in parsed:
-                        return parsed
-                # fallback: try content
-                content = msg.get("content") or "[]"
+                for chunk in resp.iter_content(chunk_size=16384):
+                    if cancel_event.is_set():
+                        self.metrics.record_call(model, endpoint["provider"], purpose, "cancelled", time.monotonic() - started, ttfb)
+                        raise RequestCancelled(f"Request to {model} cancelled")
+                    chunks.append(chunk)
+            finally:
+                resp.close()
+            result = json.loads(b"".join(chunks))
+        elapsed = time.monotonic() - started
+        self.latency.record(model, elapsed)
+        self.metrics.record_call(model, endpoint["provider"], purpose, 200, elapsed, ttfb, result)
+        return result
+
+    def _hedge_delay(self):
+        """Seconds to wait on the primary model before firing the hedge request."""
+        if self.latency.count(self.model) < 5:
+            return self.hedge_default_delay
+        observed = self.latency.percentile(self.model, self.hedge_percentile)
+        return max(self.hedge_min_delay, observed)
+
+    def _is_usable_response(self, resp_json):
+        """Return True for a tool-call round or content that parses to the decisions object."""
+        try:
+            message = resp_json["choices"][0]["message"]
+        except (KeyError, IndexError, TypeError):
+            return False
+        if message.get("tool_calls"):
+            return True
+        if isinstance(message.get("parsed"), dict):
+            return "trade_decisions" in message["parsed"]
+        try:
+            parsed = json.loads(message.get("content") or "")
+        except (json.JSONDecodeError, TypeError):
+            return False
+        return isinstance(parsed, dict) and isinstance(parsed.get("trade_decisions"), list)
+
+    def _post_hedged(self, payload):
+        """Race the primary model against the hedge model once the primary looks slow.
+
+        The primary request starts immediately. If it has not produced a usable
+        answer within :meth:`_hedge_delay` (or fails outright, e.g. with a 5xx),
+        the same payload is sent to the hedge model. The first usable answer
+        wins and the other request is cancelled. When neither answer is usable
+        the primary's result (or error) is surfaced so the caller's normal
+        fallback handling applies.
+        """
+        hedge_provider, hedge_model = self.hedge_spec
+        hedge_endpoint = self._resolve_endpoint(hedge_provider)
+        hedge_payload = dict(payload, model=hedge_model)
+        if hedge_provider != self.provider:
+            # Provider routing preferences only make sense for the primary provider
+            hedge_payload.pop("provider", None)
+
+        primary_cancel = threading.Event()
+        hedge_cancel = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = pool.submit(contextvars.copy_context().run, self._post, payload, None, primary_cancel)
+            delay = self._hedge_delay()
+            done, _ = wait([primary], timeout=delay)
+            if primary in done and primary.exception() is None and self._is_usable_response(primary.result()):
+                return primary.result()
+
+            logging.warning("Hedging %s -> %s after %.2fs", self.model, hedge_model, delay)
+            hedge = pool.submit(
+                contextvars.copy_context().run, self._post, hedge_payload, hedge_endpoint, hedge_cancel, "hedge"
+            )
+            pending = {primary, hedge} - done
+            finished = set(done)
+            while True:
+                for fut in (primary, hedge):
+                    if fut in finished and fut.exception() is None and self._is_usable_response(fut.result()):
+                        winner_name = self.model if fut is primary else hedge_model
+                        logging.info("Hedge race won by %s", winner_name)
+                        (hedge_cancel if fut is primary else primary_cancel).set()
+                        return fut.result()
+                if not pending:
+                    break
+                newly_done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finished |= newly_done
+            # Neither answer was usable: fall back to the primary's outcome
+            return primary.result()
+        finally:
+            pool.shutdown(wait=False)
+
+    def _post_stream(self, payload, on_content=None):
+        """Send a streaming (SSE) request and assemble the chunks into a completion.
+
+        Args:
+            payload: Chat completion request body; ``stream`` is forced on.
+            on_content: Optional callback receiving each content delta as it
+                arrives.
+
+        Returns:
+            A response dict shaped like a non-streamed completion so callers can
+            treat both paths identically.
+        """
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        headers = self._headers()
+        logging.info("Sending streaming request to OpenRouter (model: %s)", payload.get('model'))
+        self._log_request(payload, headers)
+        model = payload.get("model")
+        provider = self.endpoint["provider"]
+        started = time.monotonic()
+        try:
+            resp = requests.post(self.endpoint["url"], headers=headers, json=payload, timeout=self._request_timeout(), stream=True)
+        except requests.RequestException as e:
+            self.metrics.record_call(model, provider, "decision", type(e).__name__, time.monotonic() - started, stream=True)
+            if isinstance(e, requests.Timeout):
+                self._check_deadline("LLM response")
+            raise
+        logging.info("Received response from OpenRouter (status: %s)", resp.status_code)
+        if resp.status_code != 200:
+            self._log_error_response(resp)
+            self.metrics.record_call(model, provider, "decision", resp.status_code, time.monotonic() - started, stream=True)
+        resp.raise_for_status()
+
+        content_parts = []
+        tool_calls = {}
+        finish_reason = None
+        usage = None
+        ttfb = None
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                self._check_deadline("end of LLM stream")
+                # SSE comments (e.g. provider keep-alives) start with ':'
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+                if ttfb is None:
+                    ttfb = time.monotonic() - started
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
                 try:
-                    loaded = json.loads(content)
-                    if isinstance(loaded, dict) and "trade_decisions" in loaded:
-                        return loaded
-                except (json.JSONDecodeError, KeyError, ValueError, TypeError):
-                    pass
-                return {"reasoning": "", "summary": "", "trade_decisions": []}
-            except (requests.RequestException, json.JSONDecodeError, KeyError, ValueError, TypeError) as se:
-                logging.error("Sanitize failed: %s", se)
-                return {"reasoning": "", "summary": "", "trade_decisions": []}
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logging.warning("Skipping malformed stream chunk: %s", data[:200])
+                    continue
+                if chunk.get("error"):
+                    raise requests.RequestException(f"Stream error: {chunk['error']}")
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices") or []:
+                    delta = choice.get("delta") or {}
+                    if choice.get("finish_reason"):
+                        finish_reason = choice["finish_reason"]
+                    text = delta.get("content")
+                    if text:
+                        content_parts.append(text)
+                        if on_content:
+                            on_content(text)
+                    for tc in delta.get("tool_calls") or []:
+                        slot = tool_calls.setdefault(tc.get("index", 0), {
+                            "id": None,
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        })
+                        if tc.get("id"):
+                            slot["id"] = tc["id"]
+                        fn = tc.get("function") or {}
+                        if fn.get("name"):
+                            slot["function"]["name"] += fn["name"]
+                        if fn.get("arguments"):
+                            slot["function"]["arguments"] += fn["arguments"]
+        except requests.RequestException:
+            # A read timeout shortened by the cycle deadline surfaces as a deadline miss
+            self._check_deadline("end of LLM stream")
+            raise
+        finally:
+            resp.close()
 
-        allow_tools = True
-        allow_structured = True
-
-        def _build_schema():
-            """Assemble the JSON schema used for structured LLM responses."""
-            base_properties = {
-                "asset": {"type": "string", "enum": assets},
-                "action": {"type": "string", "enum": ["buy", "sell", "hold"]},
-                "allocation_usd": {"type": "number", "minimum": 0},
-                "tp_price": {"type": ["number", "null"]},
-                "sl_price": {"type": ["number", "null"]},
-                "exit_plan": {"type": "string"},
-                "rationale": {"type": "string"},
-            }
-            required_keys = ["asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale"]
-            return {
+        message = {"role": "assistant", "content": "".join(content_parts)}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        result = {"choices": [{"message": message, "finish_reason": finish_reason}]}
+        if usage:
+            result["usage"] = usage
+        self.metrics.record_call(model, provider, "decision", 200, time.monotonic() - started, ttfb, result, stream=True)
+        return result
+
+    def _sanitize_output(self, raw_content: str, assets_list):
+        """Coerce arbitrary LLM output into the required reasoning + summary + decisions schema."""
+        try:
+            schema = {
                 "type": "object",
                 "properties": {
                     "reasoning": {"type": "string"},
@@ -293,8 +1025,16 @@ class TradingAgent:
                         "type": "array",
                         "items": {
                             "type": "object",
-                            "properties": base_properties,
-                            "required": required_keys,
+                            "properties": {
+                                "asset": {"type": "string", "enum": assets_list},
+                                "action": {"type": "string", "enum": ["buy", "sell", "hold"]},
+                                "allocation_usd": {"type": "number"},
+                                "tp_price": {"type": ["number", "null"]},
+                                "sl_price": {"type": ["number", "null"]},
+                                "exit_plan": {"type": "string"},
+                                "rationale": {"type": "string"},
+                            },
+                            "required": ["asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale"],
                             "additionalProperties": False,
                         },
                         "minItems": 1,
@@ -303,170 +1043,403 @@ class TradingAgent:
                 "required": ["reasoning", "summary", "trade_decisions"],
                 "additionalProperties": False,
             }
+            payload = {
+                "model": self.sanitize_model,
+                "messages": [
+                    {"role": "system", "content": (
+                        "You are a strict JSON normalizer. Return ONLY a JSON array matching the provided JSON Schema. "
+                        "If input is wrapped or has prose/markdown, fix it. Do not add fields."
+                    )},
+                    {"role": "user", "content": raw_content},
+                ],
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "trade_decisions",
+                        "strict": True,
+                        "schema": schema,
+                    },
+                },
+                "temperature": 0,
+            }
+            resp = self._post(payload, purpose="sanitize")
+            msg = resp.get("choices", [{}])[0].get("message", {})
+            parsed = msg.get("parsed")
+            if isinstance(parsed, dict):
+                if "trade_decisions" in parsed:
+                    return parsed
+            # fallback: try content
+            content = msg.get("content") or "[]"
+            try:
+                loaded = json.loads(content)
+                if isinstance(loaded, dict) and "trade_decisions" in loaded:
+                    return loaded
+            except (json.JSONDecodeError, KeyError, ValueError, TypeError):
+                pass
+            return {"reasoning": "", "summary": "", "trade_decisions": []}
+        except (requests.RequestException, json.JSONDecodeError, KeyError, ValueError, TypeError) as se:
+            logging.error("Sanitize failed: %s", se)
+            return {"reasoning": "", "summary": "", "trade_decisions": []}
+
+    @staticmethod
+    def _build_schema(assets, decisions_first=False):
+        """Assemble the JSON schema used for structured LLM responses.
+
+        With ``decisions_first`` the ``reasoning`` property is dropped and
+        ``trade_decisions`` leads, so strict-mode providers emit it first.
+        """
+        base_properties = {
+            "asset": {"type": "string", "enum": assets},
+            "action": {"type": "string", "enum": ["buy", "sell", "hold"]},
+            "allocation_usd": {"type": "number", "minimum": 0},
+            "tp_price": {"type": ["number", "null"]},
+            "sl_price": {"type": ["number", "null"]},
+            "exit_plan": {"type": "string"},
+            "rationale": {"type": "string"},
+        }
+        required_keys = ["asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale"]
+        decisions_schema = {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": base_properties,
+                "required": required_keys,
+                "additionalProperties": False,
+            },
+            "minItems": 1,
+        }
+        if decisions_first:
+            return {
+                "type": "object",
+                "properties": {
+                    "trade_decisions": decisions_schema,
+                    "summary": {"type": "string"},
+                },
+                "required": ["trade_decisions", "summary"],
+                "additionalProperties": False,
+            }
+        return {
+            "type": "object",
+            "properties": {
+                "reasoning": {"type": "string"},
+                "summary": {"type": "string"},
+                "trade_decisions": decisions_schema,
+            },
+            "required": ["reasoning", "summary", "trade_decisions"],
+            "additionalProperties": False,
+        }
+
+    @staticmethod
+    def _normalize_decision(item):
+        """Fill defaults on a decision dict or convert the legacy list shape; ``None`` if unusable."""
+        if isinstance(item, dict):
+            item.setdefault("allocation_usd", 0.0)
+            item.setdefault("tp_price", None)
+            item.setdefault("sl_price", None)
+            item.setdefault("exit_plan", "")
+            item.setdefault("rationale", "")
+            return item
+        if isinstance(item, list) and len(item) >= 7:
+            return {
+                "asset": item[0],
+                "action": item[1],
+                "allocation_usd": float(item[2]) if item[2] else 0.0,
+                "tp_price": float(item[3]) if item[3] and item[3] != "null" else None,
+                "sl_price": float(item[4]) if item[4] and item[4] != "null" else None,
+                "exit_plan": item[5] if len(item) > 5 else "",
+                "rationale": item[6] if len(item) > 6 else ""
+            }
+        return None
+
+    @staticmethod
+    def _hold_all(assets, reason, summary):
+        """Build a hold-everything result used when no usable decision is available."""
+        return {
+            "reasoning": reason,
+            "summary": summary,
+            "trade_decisions": [{
+                "asset": a,
+                "action": "hold",
+                "allocation_usd": 0.0,
+                "tp_price": None,
+                "sl_price": None,
+                "exit_plan": "",
+                "rationale": reason
+            } for a in assets]
+        }
+
+    def _run_tool_calls(self, tool_calls, messages):
+        """Execute ``fetch_indicator`` tool calls and append their results to ``messages``."""
+        for tc in tool_calls:
+            self._check_deadline("tool call")
+            if tc.get("type") == "function" and tc.get("function", {}).get("name") == "fetch_indicator":
+                args = json.loads(tc["function"].get("arguments") or "{}")
+                try:
+                    indicator = args["indicator"]
+                    symbol = args["symbol"]
+                    interval = args["interval"]
+                    params = {}
+                    if args.get("period") is not None:
+                        params["period"] = args["period"]
+                    if isinstance(args.get("other_params"), dict):
+                        params.update(args["other_params"])
+
+                    # Calculate indicator locally using Binance data
+                    value = self.indicator_calc.fetch_value(indicator, symbol, interval, params=params)
+                    ind_resp = {"value": value, "indicator": indicator, "symbol": symbol, "interval": interval}
+
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tc.get("id"),
+                        "name": "fetch_indicator",
+                        "content": json.dumps(ind_resp),
+                    })
+                except (KeyError, ValueError, Exception) as ex:
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tc.get("id"),
+                        "name": "fetch_indicator",
+                        "content": f"Error: {str(ex)}",
+                    })
+
+    def _decide(self, context, assets, on_decision=None, model_spec=None, system_prompt=None, tools=True):
+        """Dispatch decision request to the LLM and enforce output contract.
+
+        ``model_spec`` is a ``(provider, model)`` pair for an ensemble member or
+        the sizing stage; other models than the primary are called directly,
+        without streaming or hedging. ``system_prompt`` replaces the full
+        analysis prompt and ``tools=False`` withholds ``fetch_indicator``.
+        """
+        provider, model = model_spec or (self.provider, self.model)
+        primary = (provider, model) == (self.provider, self.model)
+        endpoint = self.endpoint if primary else self._resolve_endpoint(provider)
+        messages = [
+            {"role": "system", "content": system_prompt or self._build_system_prompt(assets)},
+            {"role": "user", "content": context},
+        ]
+
+        capabilities = self.capabilities.get(provider, model)
+        allow_tools = capabilities["tools"] and tools
+        allow_structured = capabilities["structured"]
+        retries = 0
+        retry_tokens = 0
+        last_call_tokens = 0
+        adaptive = CONFIG.get("reasoning_enabled") and CONFIG.get("reasoning_adaptive")
+        if adaptive:
+            try:
+                activity = market_activity(json.loads(context))
+            except (TypeError, ValueError):
+                activity = market_activity(None)
 
         for _ in range(6):
-            data = {"model": self.model, "messages": messages}
+            self._check_deadline("LLM round")
+            data = {"model": model, "messages": messages}
             if allow_structured:
                 data["response_format"] = {
                     "type": "json_schema",
                     "json_schema": {
                         "name": "trade_decisions",
                         "strict": True,
-                        "schema": _build_schema(),
+                        "schema": self._build_schema(assets, decisions_first=self.decision_mode == "latency"),
                     },
                 }
             if allow_tools:
-                data["tools"] = tools
+                data["tools"] = [FETCH_INDICATOR_TOOL]
                 data["tool_choice"] = "auto"
-            if CONFIG.get("reasoning_enabled"):
+            effort = None
+            if adaptive:
+                effort, max_tokens, reason = self.reasoning.choose(activity, self._remaining_budget())
+                logging.info("Reasoning effort %s, max %d output tokens (%s)", effort, max_tokens, reason)
+                data["reasoning"] = {"enabled": True, "effort": effort, "exclude": False}
+                data["max_completion_tokens" if provider == "openai" else "max_tokens"] = max_tokens
+            elif CONFIG.get("reasoning_enabled"):
                 data["reasoning"] = {
                     "enabled": True,
                     "effort": CONFIG.get("reasoning_effort") or "high",
                     # "max_tokens": CONFIG.get("reasoning_max_tokens") or 100000,
                     "exclude": False,
                 }
-            if CONFIG.get("provider_config") or CONFIG.get("provider_quantizations"):
+            if provider == self.provider and (CONFIG.get("provider_config") or CONFIG.get("provider_quantizations")):
                 provider_payload = dict(CONFIG.get("provider_config") or {})
                 quantizations = CONFIG.get("provider_quantizations")
                 if quantizations:
                     provider_payload["quantizations"] = quantizations
                 data["provider"] = provider_payload
+            started = time.monotonic()
             try:
-                resp_json = _post(data)
+                if not primary:
+                    resp_json = self._post(data, endpoint)
+                elif self.stream:
+                    resp_json = self._post_stream(data, on_content=self._stream_emitter(assets, on_decision))
+                elif self.hedge_spec:
+                    resp_json = self._post_hedged(data)
+                else:
+                    resp_json = self._post(data)
             except requests.HTTPError as e:
                 try:
                     err = e.response.json()
                 except (json.JSONDecodeError, ValueError, AttributeError):
                     err = {}
                 raw = (err.get("error", {}).get("metadata", {}) or {}).get("raw", "")
-                provider = (err.get("error", {}).get("metadata", {}) or {}).get("provider_name", "")
-                if e.response.status_code == 422 and provider.lower().startswith("xai") and "deserialize" in raw.lower():
+                upstream = (err.get("error", {}).get("metadata", {}) or {}).get("provider_name", "")
+                if e.response.status_code == 422 and upstream.lower().startswith("xai") and "deserialize" in raw.lower():
                     logging.warning("xAI rejected tool schema; retrying without tools.")
                     if allow_tools:
                         allow_tools = False
+                        self.capabilities.record_rejection(provider, model, "tools", raw)
                         continue
                 # Provider may not support structured outputs / response_format
-                err_text = json.dumps(err)
-                if allow_structured and ("response_format" in err_text or "structured" in err_text or e.response.status_code in (400, 422)):
-                    logging.warning("Provider rejected structured outputs; retrying without response_format.")
+                err_text = json.dumps(err) if err else (e.response.text or "")
+                rejected = mentions_structured_outputs(err_text)
+                if allow_structured and (rejected or e.response.status_code in (400, 422)):
                     allow_structured = False
+                    if rejected:
+                        logging.warning("Provider rejected structured outputs; retrying without response_format.")
+                        self.capabilities.record_rejection(provider, model, "structured", err_text)
+                    else:
+                        # Context length, bad parameters or a transient 400: only this call drops response_format
+                        logging.warning("Request failed with %s; retrying once without response_format.",
+                                        e.response.status_code)
                     continue
                 raise
 
+            if effort:
+                # Tool-call rounds are a few dozen tokens; only final answers show the model's output rate
+                final = not (resp_json["choices"][0]["message"].get("tool_calls") and allow_tools)
+                completion = (resp_json.get("usage") or {}).get("completion_tokens") if final else None
+                self.reasoning.observe(effort, time.monotonic() - started, completion)
+            call_tokens = self._usage_tokens(resp_json, messages)
+            if retries:
+                retry_tokens += call_tokens
+            last_call_tokens = call_tokens
+
             choice = resp_json["choices"][0]
             message = choice["message"]
             messages.append(message)
 
             tool_calls = message.get("tool_calls") or []
             if allow_tools and tool_calls:
-                for tc in tool_calls:
-                    if tc.get("type") == "function" and tc.get("function", {}).get("name") == "fetch_indicator":
-                        args = json.loads(tc["function"].get("arguments") or "{}")
-                        try:
-                            indicator = args["indicator"]
-                            symbol = args["symbol"]
-                            interval = args["interval"]
-                            params = {}
-                            if args.get("period") is not None:
-                                params["period"] = args["period"]
-                            if isinstance(args.get("other_params"), dict):
-                                params.update(args["other_params"])
-
-                            # Calculate indicator locally using Binance data
-                            value = self.indicator_calc.fetch_value(indicator, symbol, interval, params=params)
-                            ind_resp = {"value": value, "indicator": indicator, "symbol": symbol, "interval": interval}
-
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": tc.get("id"),
-                                "name": "fetch_indicator",
-                                "content": json.dumps(ind_resp),
-                            })
-                        except (KeyError, ValueError, Exception) as ex:
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": tc.get("id"),
-                                "name": "fetch_indicator",
-                                "content": f"Error: {str(ex)}",
-                            })
+                trace = self.metrics.active_trace()
+                if trace is not None:
+                    trace.incr("tool_rounds")
+                self._run_tool_calls(tool_calls, messages)
                 continue
 
-            try:
-                # Prefer parsed field from structured outputs if present
-                if isinstance(message.get("parsed"), dict):
-                    parsed = message.get("parsed")
-                else:
-                    content = message.get("content") or "{}"
-                    parsed = json.loads(content)
-
-                if not isinstance(parsed, dict):
-                    logging.error("Expected dict payload, got: %s; attempting sanitize", type(parsed))
-                    sanitized = _sanitize_output(content if 'content' in locals() else json.dumps(parsed), assets)
-                    if sanitized.get("trade_decisions"):
-                        return sanitized
-                    return {"reasoning": "", "summary": "", "trade_decisions": []}
-
-                reasoning_text = parsed.get("reasoning", "") or ""
-                summary_text = parsed.get("summary", "") or ""
-                decisions = parsed.get("trade_decisions")
-
-                if isinstance(decisions, list):
-                    normalized = []
-                    for item in decisions:
-                        if isinstance(item, dict):
-                            item.setdefault("allocation_usd", 0.0)
-                            item.setdefault("tp_price", None)
-                            item.setdefault("sl_price", None)
-                            item.setdefault("exit_plan", "")
-                            item.setdefault("rationale", "")
-                            normalized.append(item)
-                        elif isinstance(item, list) and len(item) >= 7:
-                            normalized.append({
-                                "asset": item[0],
-                                "action": item[1],
-                                "allocation_usd": float(item[2]) if item[2] else 0.0,
-                                "tp_price": float(item[3]) if item[3] and item[3] != "null" else None,
-                                "sl_price": float(item[4]) if item[4] and item[4] != "null" else None,
-                                "exit_plan": item[5] if len(item) > 5 else "",
-                                "rationale": item[6] if len(item) > 6 else ""
-                            })
-                    return {"reasoning": reasoning_text, "summary": summary_text, "trade_decisions": normalized}
-
-                logging.error("trade_decisions missing or invalid; attempting sanitize")
-                sanitized = _sanitize_output(content if 'content' in locals() else json.dumps(parsed), assets)
-                if sanitized.get("trade_decisions"):
-                    return sanitized
-                return {"reasoning": reasoning_text, "summary": summary_text, "trade_decisions": []}
-            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
-                logging.error("JSON parse error: %s, content: %s", e, content[:200])
-                # Try sanitizer as last resort
-                sanitized = _sanitize_output(content, assets)
-                if sanitized.get("trade_decisions"):
-                    return sanitized
-                return {
-                    "reasoning": "Parse error",
-                    "summary": "Having trouble processing the market data. Staying flat until next cycle.",
-                    "trade_decisions": [{
-                        "asset": a,
-                        "action": "hold",
-                        "allocation_usd": 0.0,
-                        "tp_price": None,
-                        "sl_price": None,
-                        "exit_plan": "",
-                        "rationale": "Parse error"
-                    } for a in assets]
-                }
+            result = self._parse_message(message, assets)
+            if not self.is_failed_output(result) or retries >= self.max_retries:
+                return result
+            # The next call resends the same prefix plus a short turn, so it costs about as much as this one
+            if retry_tokens + last_call_tokens > self.retry_token_budget:
+                logging.warning(
+                    "Skipping corrective retry: %d + ~%d tokens would exceed the %d retry token budget",
+                    retry_tokens, last_call_tokens, self.retry_token_budget,
+                )
+                return result
+            retries += 1
+            trace = self.metrics.active_trace()
+            if trace is not None:
+                trace.incr("retries")
+            logging.warning("Unusable decision output; asking the model to correct it (retry %d/%d)", retries, self.max_retries)
+            messages.append({"role": "user", "content": RETRY_INSTRUCTION})
+
+        return self._hold_all(assets, "tool loop cap", "Analysis taking too long. Staying flat until next cycle.")
+
+    @staticmethod
+    def _usage_tokens(resp_json, messages):
+        """Return total tokens for a completion, estimated from message sizes when usage is missing."""
+        usage = resp_json.get("usage") or {}
+        total = usage.get("total_tokens")
+        if total is None and (usage.get("prompt_tokens") is not None or usage.get("completion_tokens") is not None):
+            total = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+        if total is not None:
+            return int(total)
+        # Roughly four characters per token
+        reply = ((resp_json.get("choices") or [{}])[0].get("message") or {}).get("content") or ""
+        return (len(json.dumps(messages)) + len(reply)) // 4
+
+    def _parse_message(self, message, assets):
+        """Parse a final assistant message into a normalized result, repairing it if needed."""
+        content = message.get("content") or "{}"
+        try:
+            # Prefer parsed field from structured outputs if present
+            if isinstance(message.get("parsed"), dict):
+                parsed = message.get("parsed")
+            else:
+                parsed = json.loads(content)
 
+            if not isinstance(parsed, dict):
+                logging.error("Expected dict payload, got: %s; attempting repair", type(parsed))
+                recovered = self._recover_output(content, assets)
+                if recovered:
+                    return recovered
+                return {"reasoning": "", "summary": "", "trade_decisions": []}
+
+            if isinstance(parsed.get("trade_decisions"), list):
+                return self._finalize_output(parsed)
+
+            logging.error("trade_decisions missing or invalid; attempting repair")
+            recovered = self._recover_output(content, assets)
+            if recovered:
+                return recovered
+            return {"reasoning": parsed.get("reasoning", "") or "", "summary": parsed.get("summary", "") or "", "trade_decisions": []}
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+            logging.error("JSON parse error: %s, content: %s", e, content[:200])
+            recovered = self._recover_output(content, assets)
+            if recovered:
+                return recovered
+            return self._hold_all(assets, "Parse error", "Having trouble processing the market data. Staying flat until next cycle.")
+
+    def _finalize_output(self, parsed):
+        """Normalize a parsed decisions object into the result shape returned to callers."""
+        normalized = []
+        for item in parsed.get("trade_decisions") or []:
+            decision = self._normalize_decision(item)
+            if decision is not None:
+                normalized.append(decision)
         return {
-            "reasoning": "tool loop cap",
-            "summary": "Analysis taking too long. Staying flat until next cycle.",
-            "trade_decisions": [{
-                "asset": a,
-                "action": "hold",
-                "allocation_usd": 0.0,
-                "tp_price": None,
-                "sl_price": None,
-                "exit_plan": "",
-                "rationale": "tool loop cap"
-            } for a in assets]
+            "reasoning": parsed.get("reasoning", "") or "",
+            "summary": parsed.get("summary", "") or "",
+            "trade_decisions": normalized,
         }
+
+    def _recover_output(self, content, assets):
+        """Salvage unparsable output: local repair first, the sanitizer model only if that fails.
+
+        Returns:
+            A normalized result, or ``None`` when neither stage produced decisions.
+        """
+        repaired, stage = repair_decisions(content, assets)
+        self.repair_stats.record(stage)
+        trace = self.metrics.active_trace()
+        if trace is not None:
+            trace.add_repair(stage)
+        if repaired is not None:
+            return self._finalize_output(repaired)
+        # Sanitizer model as last resort, unless the cycle deadline already passed
+        remaining = self._remaining_budget()
+        if remaining is not None and remaining <= 0:
+            return None
+        if trace is not None:
+            trace.incr("sanitize_calls")
+        sanitized = self._sanitize_output(content, assets)
+        if sanitized.get("trade_decisions"):
+            return sanitized
+        return None
+
+    def _stream_emitter(self, assets, on_decision):
+        """Return a content-delta callback that forwards completed decisions to ``on_decision``."""
+        if on_decision is None:
+            return None
+        parser = TradeDecisionStreamParser()
+
+        def _on_content(text):
+            for item in parser.feed(text):
+                decision = self._normalize_decision(item)
+                if decision is None or decision.get("asset") not in assets:
+                    continue
+                try:
+                    on_decision(decision)
+                except Exception as exc:
+                    logging.error("Streamed decision callback failed for %s: %s", decision.get("asset"), exc)
+
+        return _on_content
@@ -0,0 +1,149 @@
+"""Per-call choice of reasoning effort and output token cap."""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any
+
+from src.agent.latency import percentile
+from src.utils.prompt_utils import safe_float
+
+EFFORT_LEVELS = ("low", "medium", "high")
+DEFAULT_TOKEN_CAPS = {"low": 2000, "medium": 6000, "high": 16000}
+# Assumed p95 latency per level until enough calls have been observed
+DEFAULT_LATENCY_SECONDS = {"low": 8.0, "medium": 20.0, "high": 45.0}
+
+
+def market_activity(payload: Any, trigger_proximity_pct: float = 0.5) -> dict:
+    """Summarize how much the decision context is moving.
+
+    Args:
+        payload: Decoded context JSON (``market_data``, ``account`` sections).
+        trigger_proximity_pct: Distance (percent of price) at which a resting
+            TP/SL trigger counts as near.
+
+    Returns:
+        ``{"max_move_pct", "near_trigger", "open_positions"}`` where
+        ``max_move_pct`` is the largest high/low range of recent mid prices
+        across assets, as a percent of the latest price.
+    """
+    if not isinstance(payload, dict):
+        return {"max_move_pct": None, "near_trigger": False, "open_positions": 0}
+    prices = {}
+    max_move = None
+    for section in payload.get("market_data") or []:
+        price = safe_float(section.get("current_price"))
+        prices[section.get("asset")] = price
+        mids = [m for m in (safe_float(v) for v in section.get("recent_mid_prices") or []) if m]
+        if price and len(mids) >= 2:
+            move = (max(mids) - min(mids)) / price * 100.0
+            max_move = move if max_move is None else max(max_move, move)
+
+    account = payload.get("account") or {}
+    near_trigger = False
+    for order in account.get("open_orders") or []:
+        price = prices.get(order.get("coin"))
+        trigger = safe_float(order.get("trigger_price"))
+        if price and trigger and abs(price - trigger) / price * 100.0 <= trigger_proximity_pct:
+            near_trigger = True
+            break
+    open_positions = sum(1 for p in account.get("positions") or [] if safe_float(p.get("quantity")))
+    return {"max_move_pct": max_move, "near_trigger": near_trigger, "open_positions": open_positions}
+
+
+class ReasoningController:
+    """Pick a reasoning effort and ``max_tokens`` for each LLM call.
+
+    The market decides how much reasoning is wanted: quiet, flat books get
+    ``low``; open positions or a moderate move get ``medium``; a large move or
+    price near a resting TP/SL gets ``high``. The time budget then decides how
+    much is affordable: the level is stepped down while its observed p95
+    latency, or the time its token cap takes at the model's observed output
+    rate, would not fit in the remaining cycle budget. ``max_tokens`` is
+    always the chosen level's configured cap, never a trimmed value, so a
+    verbose answer is not cut off mid-JSON. Throughput is measured on final
+    answers only; tool-call rounds are short and would understate it.
+    """
+
+    def __init__(
+        self,
+        max_effort: str = "high",
+        token_caps: dict | None = None,
+        calm_move_pct: float = 0.3,
+        active_move_pct: float = 1.0,
+        budget_safety: float = 0.8,
+        window: int = 30,
+    ):
+        """Configure the effort ceiling, per-level token caps and movement thresholds.
+
+        Args:
+            max_effort: Highest level the controller may choose.
+            token_caps: Output token cap per level; missing levels use defaults.
+            calm_move_pct: Recent mid-price range (percent) below which a
+                market without positions counts as quiet.
+            active_move_pct: Range (percent) at which full reasoning is wanted.
+            budget_safety: Fraction of the remaining cycle budget a call may use.
+            window: Calls kept per level for latency/throughput estimates.
+        """
+        self.max_effort = max_effort if max_effort in EFFORT_LEVELS else "high"
+        self.token_caps = dict(DEFAULT_TOKEN_CAPS, **(token_caps or {}))
+        self.calm_move_pct = calm_move_pct
+        self.active_move_pct = active_move_pct
+        self.budget_safety = budget_safety
+        self._latency = {level: deque(maxlen=window) for level in EFFORT_LEVELS}
+        self._throughput = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, effort: str, seconds: float, completion_tokens: int | None = None):
+        """Record a finished call made at ``effort``.
+
+        Pass ``completion_tokens`` only for a final answer, not a tool-call round.
+        """
+        with self._lock:
+            if effort in self._latency:
+                self._latency[effort].append(seconds)
+            if completion_tokens and seconds > 0:
+                self._throughput.append(completion_tokens / seconds)
+
+    def expected_latency(self, effort: str) -> float:
+        """Observed p95 latency for ``effort``, or a default until 3 calls are seen."""
+        with self._lock:
+            samples = list(self._latency.get(effort, ()))
+        if len(samples) < 3:
+            return DEFAULT_LATENCY_SECONDS[effort]
+        return percentile(samples, 95)
+
+    def choose(self, activity: dict, remaining: float | None) -> tuple[str, int, str]:
+        """Return ``(effort, max_tokens, reason)`` for the next call.
+
+        Args:
+            activity: Output of :func:`market_activity`.
+            remaining: Seconds left in the cycle budget, or ``None`` if unbounded.
+        """
+        move = activity.get("max_move_pct")
+        if activity.get("near_trigger"):
+            wanted, reason = "high", "price near a TP/SL trigger"
+        elif move is not None and move >= self.active_move_pct:
+            wanted, reason = "high", f"recent range {move:.2f}%"
+        elif activity.get("open_positions") or (move is not None and move >= self.calm_move_pct):
+            wanted, reason = "medium", f"{activity.get('open_positions', 0)} open position(s), range {move or 0:.2f}%"
+        else:
+            wanted, reason = "low", "quiet market, no positions"
+
+        level = min(EFFORT_LEVELS.index(wanted), EFFORT_LEVELS.index(self.max_effort))
+        if remaining is not None:
+            usable = remaining * self.budget_safety
+            with self._lock:
+                rates = list(self._throughput)
+            rate = percentile(rates, 50) if len(rates) >= 3 else None
+            wanted_level = level
+            while level > 0 and (
+                self.expected_latency(EFFORT_LEVELS[level]) > usable
+                or (rate and self.token_caps[EFFORT_LEVELS[level]] / rate > usable)
+            ):
+                level -= 1
+            if level < wanted_level:
+                reason += f"; stepped down to fit {remaining:.1f}s left"
+        effort = EFFORT_LEVELS[level]
+        return effort, self.token_caps[effort], reason
@@ -0,0 +1,104 @@
+"""Per-asset vote merging for multi-model ensemble decisions."""
+
+from __future__ import annotations
+
+import statistics
+from typing import Iterable
+
+from src.agent.json_repair import VALID_ACTIONS
+
+ENSEMBLE_RULES = ("majority", "unanimous", "confidence")
+
+
+def usable_decisions(result: dict | None, assets: Iterable[str]) -> dict:
+    """Return ``{asset: decision}`` for the schema-valid decisions in ``result``.
+
+    Items for unknown assets, with an unknown action, or produced by a
+    parse-error fallback are dropped, so a model abstains on those assets.
+    """
+    allowed = set(assets)
+    by_asset = {}
+    for d in (result or {}).get("trade_decisions") or []:
+        if not isinstance(d, dict) or d.get("asset") not in allowed or d.get("action") not in VALID_ACTIONS:
+            continue
+        if d.get("action") == "hold" and "parse error" in (d.get("rationale") or "").lower():
+            continue
+        by_asset.setdefault(d["asset"], d)
+    return by_asset
+
+
+def _hold(asset: str, rationale: str) -> dict:
+    return {
+        "asset": asset,
+        "action": "hold",
+        "allocation_usd": 0.0,
+        "tp_price": None,
+        "sl_price": None,
+        "exit_plan": "",
+        "rationale": rationale,
+    }
+
+
+def merge_votes(answers: list[tuple[str, dict]], assets: Iterable[str], rule: str = "majority",
+                weights: dict | None = None) -> tuple[list[dict], dict]:
+    """Merge per-model answers into one decision per asset.
+
+    Args:
+        answers: ``(model, {asset: decision})`` pairs in member priority order.
+        assets: Assets to decide, in output order.
+        rule: ``"majority"`` needs more than half of the voting weight on one
+            action, ``"unanimous"`` needs every voter to agree, and
+            ``"confidence"`` is a weighted majority where ``weights`` carries
+            each model's recent agreement with the ensemble.
+        weights: Vote weight per model; missing models weigh 1.
+
+    Returns:
+        ``(decisions, votes)`` where ``votes`` maps each asset to
+        ``{model: action}``. Assets without a winning action are held. The
+        winning decision comes from the highest-priority model that voted for
+        it, with ``allocation_usd`` set to the median of the winning voters.
+    """
+    weights = weights or {}
+    decisions = []
+    votes = {}
+    for asset in assets:
+        ballots = [(model, by_asset[asset]) for model, by_asset in answers if asset in by_asset]
+        votes[asset] = {model: d["action"] for model, d in ballots}
+        if not ballots:
+            decisions.append(_hold(asset, "Ensemble: no model returned a usable decision"))
+            continue
+
+        tally = {}
+        for model, d in ballots:
+            tally[d["action"]] = tally.get(d["action"], 0.0) + weights.get(model, 1.0)
+        total = sum(tally.values())
+        action, weight = max(tally.items(), key=lambda item: item[1])
+        split = ", ".join(f"{a} {w:g}" for a, w in sorted(tally.items()))
+        if rule == "unanimous":
+            agreed = len(tally) == 1
+        else:
+            agreed = weight > total / 2
+        if not agreed:
+            decisions.append(_hold(asset, f"Ensemble split ({split}); holding"))
+            continue
+
+        winners = [d for _, d in ballots if d["action"] == action]
+        merged = dict(winners[0])
+        if action in ("buy", "sell"):
+            allocations = [float(d.get("allocation_usd") or 0.0) for d in winners]
+            merged["allocation_usd"] = round(statistics.median(allocations), 2)
+        merged["rationale"] = f"[ensemble {split}] {merged.get('rationale') or ''}".strip()
+        decisions.append(merged)
+    return decisions, votes
+
+
+def agreement(votes: dict, decisions: list[dict]) -> dict:
+    """Return ``{model: fraction of its votes matching the merged action}``."""
+    final = {d["asset"]: d["action"] for d in decisions}
+    matched = {}
+    cast = {}
+    for asset, ballot in votes.items():
+        for model, action in ballot.items():
+            cast[model] = cast.get(model, 0) + 1
+            matched[model] = matched.get(model, 0) + (action == final.get(asset))
+    return {model: round(matched[model] / cast[model], 4) for model in cast}
@@ -0,0 +1,224 @@
+"""Local, network-free repair of malformed LLM decision payloads."""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+from typing import Any, Iterable
+
+VALID_ACTIONS = {"buy", "sell", "hold"}
+REQUIRED_KEYS = ("asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale")
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _strip_fences(text: str) -> str:
+    """Return the body of the first fenced code block, or ``text`` unchanged."""
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1)
+    # Unterminated fence (truncated reply)
+    if text.lstrip().startswith("```"):
+        return text.lstrip()[3:].lstrip("json").lstrip("JSON")
+    return text
+
+
+def _extract_json_span(text: str) -> str:
+    """Drop prose before the first ``{``/``[`` and after the last ``}``/``]``."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    if end < start:
+        return text[start:]
+    return text[start:end + 1]
+
+
+def _scan(text: str) -> tuple[str, list[str], bool, list[tuple[int, list[str]]]]:
+    """Normalize quoting/literals/trailing commas and record structural state.
+
+    Converts single-quoted strings to double-quoted ones, Python literals to
+    JSON, and drops commas directly before a closing bracket.
+
+    Returns:
+        ``(normalized, open_stack, in_string, boundaries)`` where ``open_stack``
+        lists unclosed ``{``/``[`` at the end of input and ``boundaries`` holds
+        ``(offset, stack)`` after every completed nested value, used to cut a
+        truncated document back to its last complete element.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    boundaries: list[tuple[int, list[str]]] = []
+    quote = None
+    escape = False
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            # Remove a trailing comma left before the closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            boundaries.append((len(out), list(stack)))
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out), stack, quote is not None, boundaries
+
+
+def _close(text: str, stack: Iterable[str]) -> str:
+    """Append the closers for ``stack`` after trimming a dangling comma/colon."""
+    text = text.rstrip()
+    while text and text[-1] in ",:":
+        text = text[:-1].rstrip()
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(list(stack)))
+
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return None
+
+
+def _coerce_shape(parsed: Any) -> dict | None:
+    """Wrap the legacy bare-array shape into the decisions object."""
+    if isinstance(parsed, dict):
+        return parsed
+    if isinstance(parsed, list):
+        return {"reasoning": "", "summary": "", "trade_decisions": parsed}
+    return None
+
+
+def validate_decisions(payload: Any, assets: Iterable[str]) -> bool:
+    """Return True when ``payload`` satisfies the decision schema closely enough to execute.
+
+    Items may be dicts or the legacy 7-element list shape; every item needs a
+    known asset and a buy/sell/hold action, and at least one item is required.
+    """
+    if not isinstance(payload, dict):
+        return False
+    decisions = payload.get("trade_decisions")
+    if not isinstance(decisions, list) or not decisions:
+        return False
+    allowed = set(assets)
+    for item in decisions:
+        if isinstance(item, dict):
+            asset, action = item.get("asset"), item.get("action")
+        elif isinstance(item, list) and len(item) >= 7:
+            asset, action = item[0], item[1]
+        else:
+            return False
+        if asset not in allowed or action not in VALID_ACTIONS:
+            return False
+    return True
+
+
+def repair_decisions(raw: str, assets: Iterable[str]) -> tuple[dict | None, str | None]:
+    """Try cheap textual fixes until ``raw`` parses into a valid decisions payload.
+
+    Stages are applied cumulatively: markdown fences, surrounding prose,
+    quoting/literal/trailing-comma normalization, closing a truncated document,
+    and finally cutting back to the last complete element before closing.
+
+    Returns:
+        ``(payload, stage)`` on success, where ``stage`` names the step that
+        produced a valid document, otherwise ``(None, None)``.
+    """
+    assets = list(assets)
+    if not isinstance(raw, str) or not raw.strip():
+        return None, None
+
+    candidates = []
+    text = _strip_fences(raw)
+    candidates.append(("fences" if text != raw else "as_is", text))
+    text = _extract_json_span(text)
+    candidates.append(("extract", text))
+    normalized, stack, in_string, boundaries = _scan(text)
+    candidates.append(("normalize", normalized))
+    if in_string:
+        normalized += '"'
+    candidates.append(("close_truncated", _close(normalized, stack)))
+    for offset, open_stack in reversed(boundaries):
+        if open_stack:
+            candidates.append(("cut_truncated", _close(normalized[:offset], open_stack)))
+            break
+
+    for stage, candidate in candidates:
+        parsed = _loads(candidate)
+        payload = _coerce_shape(parsed)
+        if stage.endswith("_truncated") and payload and isinstance(payload.get("trade_decisions"), list):
+            decisions = payload["trade_decisions"]
+            # The element cut off mid-write must not be executed with defaulted TP/SL
+            if decisions and isinstance(decisions[-1], dict) and not all(k in decisions[-1] for k in REQUIRED_KEYS):
+                decisions.pop()
+        if validate_decisions(payload, assets):
+            return payload, "legacy_shape" if isinstance(parsed, list) else stage
+    return None, None
+
+
+class RepairStats:
+    """Thread-safe counters for local repair attempts, reported in the logs."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.by_stage: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str | None):
+        """Count one attempt, successful when ``stage`` is not ``None``, and log the running rate."""
+        with self._lock:
+            self.attempts += 1
+            if stage:
+                self.successes += 1
+                self.by_stage[stage] = self.by_stage.get(stage, 0) + 1
+            attempts, successes = self.attempts, self.successes
+        if stage:
+            logging.info("Local JSON repair succeeded via %s (success rate %d/%d)", stage, successes, attempts)
+        else:
+            logging.warning("Local JSON repair failed; escalating to sanitizer (success rate %d/%d)", successes, attempts)
+
+    def snapshot(self) -> dict:
+        """Return attempt/success counts and the per-stage breakdown."""
+        with self._lock:
+            return {"attempts": self.attempts, "successes": self.successes, "by_stage": dict(self.by_stage)}
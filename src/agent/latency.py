@@ -0,0 +1,55 @@
+"""Rolling per-model latency statistics for LLM calls."""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+
+
+def percentile(values, pct: float) -> float | None:
+    """Return the ``pct`` (0-100) percentile of ``values`` using nearest-rank."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LatencyTracker:
+    """Thread-safe rolling window of request latencies keyed by model name."""
+
+    def __init__(self, window: int = 50):
+        """Keep at most ``window`` samples per model."""
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        """Add one successful request latency for ``model``."""
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, model: str) -> int:
+        """Return how many samples are held for ``model``."""
+        with self._lock:
+            return len(self._samples.get(model, ()))
+
+    def percentile(self, model: str, pct: float) -> float | None:
+        """Return the ``pct`` percentile latency for ``model`` or ``None`` without samples."""
+        with self._lock:
+            values = list(self._samples.get(model, ()))
+        return percentile(values, pct)
+
+    def snapshot(self) -> dict:
+        """Return ``{model: {count, p50, p95}}`` for every tracked model."""
+        with self._lock:
+            items = {model: list(values) for model, values in self._samples.items()}
+        return {
+            model: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+            }
+            for model, values in items.items()
+        }
@@ -0,0 +1,319 @@
+"""Per-call and per-decision LLM accounting: tokens, latency, cost and retries."""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from src.agent.latency import percentile
+from src.utils.rotating_log import open_log
+
+# Decision trace of the decide_trade() call currently running in this context, if any
+_active_trace: contextvars.ContextVar = contextvars.ContextVar("llm_decision_trace", default=None)
+
+
+def usage_fields(resp_json: dict | None) -> dict:
+    """Extract token counts (and provider-reported cost) from a completion's ``usage`` block."""
+    usage = (resp_json or {}).get("usage") or {}
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    completion_details = usage.get("completion_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "cached_tokens": prompt_details.get("cached_tokens"),
+        "reasoning_tokens": completion_details.get("reasoning_tokens"),
+        "cost": usage.get("cost"),
+    }
+
+
+def estimate_cost(model: str, fields: dict, pricing: dict | None) -> float | None:
+    """Price a call from ``pricing`` (USD per 1M tokens) unless the provider already reported cost.
+
+    ``pricing`` maps model names to ``{"input", "output", "cached_input"}``;
+    cached prompt tokens use ``cached_input`` (falling back to ``input``).
+    """
+    if fields.get("cost") is not None:
+        return float(fields["cost"])
+    rates = (pricing or {}).get(model)
+    if not rates or fields.get("prompt_tokens") is None:
+        return None
+    cached = fields.get("cached_tokens") or 0
+    uncached = max(0, (fields.get("prompt_tokens") or 0) - cached)
+    cached_rate = rates.get("cached_input", rates.get("input", 0.0))
+    return (
+        uncached * rates.get("input", 0.0)
+        + cached * cached_rate
+        + (fields.get("completion_tokens") or 0) * rates.get("output", 0.0)
+    ) / 1_000_000
+
+
+class DecisionTrace:
+    """Accumulates the calls, tool rounds, retries and repairs behind one ``decide_trade``."""
+
+    def __init__(self, model: str, assets: int):
+        self.model = model
+        self.assets = assets
+        self.started = time.monotonic()
+        self.counts = {"calls": 0, "tool_rounds": 0, "retries": 0, "sanitize_calls": 0}
+        self.tokens = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self.cost = 0.0
+        self.priced = False
+        self.repair_stages: list[str] = []
+        self._lock = threading.Lock()
+
+    def incr(self, field: str, amount: int = 1):
+        with self._lock:
+            self.counts[field] = self.counts.get(field, 0) + amount
+
+    def add_call(self, record: dict):
+        with self._lock:
+            self.counts["calls"] += 1
+            for key in self.tokens:
+                self.tokens[key] += record.get(key) or 0
+            if record.get("cost") is not None:
+                self.cost += record["cost"]
+                self.priced = True
+
+    def add_repair(self, stage: str | None):
+        with self._lock:
+            self.repair_stages.append(stage or "failed")
+
+    def finish(self, failed: bool) -> dict:
+        """Return the decision-level record."""
+        with self._lock:
+            return {
+                "type": "decision",
+                "ts": datetime.now(timezone.utc).isoformat(),
+                "model": self.model,
+                "assets": self.assets,
+                "latency": round(time.monotonic() - self.started, 4),
+                **self.counts,
+                **self.tokens,
+                "total_tokens": self.tokens["prompt_tokens"] + self.tokens["completion_tokens"],
+                "cost": round(self.cost, 6) if self.priced else None,
+                "repair_stages": list(self.repair_stages),
+                "failed": failed,
+            }
+
+
+class LLMMetrics:
+    """Rolling window of call and decision records with summary aggregates.
+
+    Records are optionally appended to a JSONL file so another process (the
+    multi-session server) can rebuild the same aggregates with :meth:`load`.
+    The file is written by a background :class:`~src.utils.rotating_log.RotatingLog`
+    configured with ``log_options``, so recording never blocks an LLM call on disk I/O.
+    """
+
+    def __init__(self, path: str | None = None, window: int = 500, pricing: dict | None = None,
+                 log_options: dict | None = None):
+        self.path = path
+        self._log = open_log(path, **(log_options or {})) if path else None
+        self.pricing = pricing or {}
+        self.calls: deque = deque(maxlen=window)
+        self.decisions: deque = deque(maxlen=window)
+        self.ensembles: deque = deque(maxlen=window)
+        self.totals = {"calls": 0, "decisions": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                       "cached_tokens": 0, "cost": 0.0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, window: int = 500, max_bytes: int = 2_000_000) -> "LLMMetrics":
+        """Rebuild aggregates from the tail of a metrics JSONL file written by another process."""
+        metrics = cls(window=window)
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - max_bytes))
+                data = f.read()
+        except FileNotFoundError:
+            return metrics
+        lines = data.splitlines()
+        if size > max_bytes and lines:
+            lines = lines[1:]  # first line is likely partial
+        for line in lines:
+            try:
+                metrics._add(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        return metrics
+
+    def _add(self, record: dict):
+        with self._lock:
+            if record.get("type") == "decision":
+                self.decisions.append(record)
+                self.totals["decisions"] += 1
+                return
+            if record.get("type") == "ensemble":
+                self.ensembles.append(record)
+                return
+            self.calls.append(record)
+            self.totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                self.totals[key] += record.get(key) or 0
+            self.totals["cost"] += record.get("cost") or 0.0
+
+    def _emit(self, record: dict):
+        self._add(record)
+        if self._log is not None:
+            # Never sampled: readers rebuild totals from every record
+            self._log.write(record, force=True)
+
+    def record_call(self, model: str, provider: str, purpose: str, status, latency: float,
+                    ttfb: float | None = None, resp_json: dict | None = None, stream: bool = False) -> dict:
+        """Record one HTTP call to an LLM endpoint and add it to the active decision trace."""
+        fields = usage_fields(resp_json)
+        fields["cost"] = estimate_cost(model, fields, self.pricing)
+        record = {
+            "type": "call",
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "model": model,
+            "provider": provider,
+            "purpose": purpose,
+            "stream": stream,
+            "status": status,
+            "latency": round(latency, 4),
+            "ttfb": round(ttfb, 4) if ttfb is not None else None,
+            **fields,
+        }
+        self._emit(record)
+        trace = _active_trace.get()
+        if trace is not None:
+            trace.add_call(record)
+        logging.info(
+            "LLM call %s/%s (%s): status=%s latency=%.2fs ttfb=%s prompt=%s completion=%s cached=%s",
+            provider, model, purpose, status, latency,
+            f"{ttfb:.2f}s" if ttfb is not None else "n/a",
+            fields["prompt_tokens"], fields["completion_tokens"], fields["cached_tokens"],
+        )
+        return record
+
+    def begin_decision(self, model: str, assets: int):
+        """Start a decision trace for the current context; pass the token to :meth:`end_decision`."""
+        trace = DecisionTrace(model, assets)
+        return trace, _active_trace.set(trace)
+
+    def end_decision(self, trace: DecisionTrace, token, failed: bool) -> dict:
+        _active_trace.reset(token)
+        record = trace.finish(failed)
+        self._emit(record)
+        return record
+
+    def record_ensemble(self, rule: str, wall_time: float, members: dict) -> dict:
+        """Record one ensemble round.
+
+        ``members`` maps each model to ``{"status", "latency", "agreement"}``
+        where status is ``"counted"``, ``"invalid"``, ``"error"`` or ``"late"``.
+        """
+        record = {
+            "type": "ensemble",
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "rule": rule,
+            "wall_time": round(wall_time, 4),
+            "members": members,
+        }
+        self._emit(record)
+        return record
+
+    def ensemble_agreement(self) -> dict:
+        """Return each model's mean agreement with the merged ensemble decision."""
+        with self._lock:
+            ensembles = list(self.ensembles)
+        rates = {}
+        for record in ensembles:
+            for model, member in (record.get("members") or {}).items():
+                if member.get("agreement") is not None:
+                    rates.setdefault(model, []).append(member["agreement"])
+        return {model: sum(values) / len(values) for model, values in rates.items()}
+
+    @staticmethod
+    def active_trace() -> DecisionTrace | None:
+        return _active_trace.get()
+
+    @staticmethod
+    def _stats(values) -> dict:
+        values = [v for v in values if v is not None]
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "avg": round(sum(values) / len(values), 4) if values else None,
+        }
+
+    def snapshot(self) -> dict:
+        """Return rolling aggregates per model and per decision cycle."""
+        with self._lock:
+            calls = list(self.calls)
+            decisions = list(self.decisions)
+            ensembles = list(self.ensembles)
+            totals = dict(self.totals)
+
+        by_model = {}
+        for record in calls:
+            by_model.setdefault(record.get("model"), []).append(record)
+        models = {}
+        for model, records in by_model.items():
+            prompt = sum(r.get("prompt_tokens") or 0 for r in records)
+            cached = sum(r.get("cached_tokens") or 0 for r in records)
+            models[model] = {
+                "calls": len(records),
+                "errors": sum(1 for r in records if r.get("status") != 200),
+                "latency": self._stats(r.get("latency") for r in records if r.get("status") == 200),
+                "ttfb": self._stats(r.get("ttfb") for r in records if r.get("status") == 200),
+                "prompt_tokens": self._stats(r.get("prompt_tokens") for r in records),
+                "completion_tokens": self._stats(r.get("completion_tokens") for r in records),
+                "cached_tokens": cached,
+                "cache_hit_ratio": round(cached / prompt, 4) if prompt else None,
+                "cost": round(sum(r.get("cost") or 0.0 for r in records), 6),
+            }
+
+        cost_per_asset_per_day = None
+        priced = [d for d in decisions if d.get("cost") is not None and d.get("assets")]
+        if len(priced) >= 2:
+            span = (datetime.fromisoformat(priced[-1]["ts"]) - datetime.fromisoformat(priced[0]["ts"])).total_seconds()
+            if span > 0:
+                # Spend between the first and last decision, normalized per asset
+                per_asset = sum(d["cost"] / d["assets"] for d in priced[1:])
+                cost_per_asset_per_day = round(per_asset * 86400 / span, 6)
+
+        members = {}
+        for record in ensembles:
+            for model, member in (record.get("members") or {}).items():
+                members.setdefault(model, []).append(member)
+        ensemble = {
+            "rounds": len(ensembles),
+            "wall_time": self._stats(r.get("wall_time") for r in ensembles),
+            "members": {
+                model: {
+                    "rounds": len(entries),
+                    **{status: sum(1 for e in entries if e.get("status") == status)
+                       for status in ("counted", "invalid", "error", "late")},
+                    "agreement": self._stats(e.get("agreement") for e in entries)["avg"],
+                    "latency": self._stats(e.get("latency") for e in entries if e.get("status") == "counted"),
+                }
+                for model, entries in members.items()
+            },
+        }
+
+        return {
+            "totals": totals,
+            "models": models,
+            "decisions": {
+                "count": len(decisions),
+                "latency": self._stats(d.get("latency") for d in decisions),
+                "tokens_per_cycle": self._stats(d.get("total_tokens") for d in decisions),
+                "calls_per_cycle": self._stats(d.get("calls") for d in decisions),
+                "tool_rounds": self._stats(d.get("tool_rounds") for d in decisions),
+                "retries": sum(d.get("retries") or 0 for d in decisions),
+                "sanitize_calls": sum(d.get("sanitize_calls") or 0 for d in decisions),
+                "failed": sum(1 for d in decisions if d.get("failed")),
+            },
+            "cost_per_asset_per_day": cost_per_asset_per_day,
+            "ensemble": ensemble,
+        }
@@ -0,0 +1,86 @@
+"""Incremental JSON scanning for streamed LLM decision payloads."""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+
+class TradeDecisionStreamParser:
+    """Extract complete ``trade_decisions`` items from a partially streamed JSON object.
+
+    The parser is fed raw text deltas as they arrive over SSE. It tracks string,
+    escape and nesting state character by character and, once the top-level
+    ``trade_decisions`` array has been entered, emits each array element as soon
+    as its closing bracket arrives. The rest of the document (``reasoning``,
+    ``summary``) is ignored here; the full buffer is still parsed normally once
+    the stream completes.
+    """
+
+    TARGET_KEY = "trade_decisions"
+
+    def __init__(self):
+        """Reset scanner state for a fresh document."""
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._array_depth = None
+        self._item_start = None
+        self._done = False
+
+    def feed(self, text: str) -> list[Any]:
+        """Append ``text`` to the buffer and return any newly completed items."""
+        if not text:
+            return []
+        self.buffer += text
+        completed = []
+        buf = self.buffer
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._array_depth is None:
+                        self._last_key = buf[self._string_start + 1:self._pos]
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+                if (
+                    ch == "["
+                    and self._array_depth is None
+                    and not self._done
+                    and self._depth == 2
+                    and self._last_key == self.TARGET_KEY
+                ):
+                    self._array_depth = self._depth
+                elif self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = self._pos
+            elif ch in "}]":
+                if self._array_depth is not None:
+                    if self._depth == self._array_depth + 1 and self._item_start is not None:
+                        raw_item = buf[self._item_start:self._pos + 1]
+                        self._item_start = None
+                        try:
+                            completed.append(json.loads(raw_item))
+                        except json.JSONDecodeError as exc:
+                            logging.debug("Skipping unparsable streamed item: %s", exc)
+                    elif self._depth == self._array_depth:
+                        self._array_depth = None
+                        self._done = True
+                self._depth -= 1
+            self._pos += 1
+        return completed
@@ -0,0 +1,138 @@
+"""Per-asset market theses shared by every session process through a file cache."""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import pathlib
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+THESIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "asset": {"type": "string"},
+        "bias": {"type": "string", "enum": ["bullish", "bearish", "neutral"]},
+        "conviction": {"type": "number"},
+        "support": {"type": ["number", "null"]},
+        "resistance": {"type": ["number", "null"]},
+        "tp_price": {"type": ["number", "null"]},
+        "sl_price": {"type": ["number", "null"]},
+        "invalidation": {"type": "string"},
+        "analysis": {"type": "string"},
+    },
+    "required": ["asset", "bias", "conviction", "support", "resistance", "tp_price", "sl_price", "invalidation",
+                 "analysis"],
+    "additionalProperties": False,
+}
+
+
+def valid_thesis(thesis, asset: str) -> bool:
+    """Return True when ``thesis`` is a usable assessment of ``asset``."""
+    return (
+        isinstance(thesis, dict)
+        and thesis.get("asset") == asset
+        and thesis.get("bias") in ("bullish", "bearish", "neutral")
+        and isinstance(thesis.get("conviction"), (int, float))
+    )
+
+
+class ThesisCache:
+    """One thesis per ``(asset, interval)`` per interval bucket, shared across processes.
+
+    Buckets are aligned to the wall clock (``time() // interval``), so every
+    session trading the same asset on the same interval reads the same entry.
+    The first process to need an entry computes it while holding an exclusive
+    ``flock``; the others wait for the file to appear instead of calling the
+    LLM themselves.
+    """
+
+    def __init__(self, directory, keep_buckets: int = 2):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_buckets = keep_buckets
+
+    def _path(self, asset: str, interval: str, bucket: int) -> pathlib.Path:
+        safe_asset = "".join(ch for ch in asset if ch.isalnum() or ch in "-_")
+        return self.directory / f"{safe_asset}_{interval}_{bucket}.json"
+
+    @staticmethod
+    def _read(path: pathlib.Path) -> dict | None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get_or_compute(self, asset: str, interval: str, interval_seconds: float,
+                       compute: Callable[[], dict | None], deadline: float | None = None) -> dict | None:
+        """Return this bucket's entry for ``asset``, calling ``compute`` only if no process has yet.
+
+        Args:
+            asset: Asset ticker.
+            interval: Interval label, part of the cache key (e.g. ``"5m"``).
+            interval_seconds: Bucket length in seconds.
+            compute: Produces the thesis dict; ``None`` means it failed and
+                nothing is cached, so the next caller retries.
+            deadline: Optional ``time.monotonic()`` value after which waiting
+                for another process's result is abandoned.
+
+        Returns:
+            The cache entry ``{"asset", "interval", "bucket", "created_at",
+            "thesis"}``, or ``None`` when no thesis could be obtained.
+        """
+        bucket = int(time.time() // interval_seconds)
+        path = self._path(asset, interval, bucket)
+        entry = self._read(path)
+        if entry is not None:
+            return entry
+
+        with open(path.with_suffix(".lock"), "a") as lock:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Another session is computing this entry
+                    if deadline is not None and time.monotonic() >= deadline:
+                        logging.warning("Timed out waiting for shared %s thesis", asset)
+                        return None
+                    time.sleep(0.2)
+            try:
+                entry = self._read(path)
+                if entry is not None:
+                    return entry
+                thesis = compute()
+                if thesis is None:
+                    return None
+                entry = {
+                    "asset": asset,
+                    "interval": interval,
+                    "bucket": bucket,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "thesis": thesis,
+                }
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(tmp, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._prune(asset, interval, bucket)
+        return entry
+
+    def _prune(self, asset: str, interval: str, bucket: int):
+        """Delete entries and lock files older than ``keep_buckets`` buckets."""
+        for old in self.directory.glob(f"{self._path(asset, interval, 0).stem[:-1]}*"):
+            try:
+                old_bucket = int(old.name.split("_")[-1].split(".")[0])
+            except ValueError:
+                continue
+            if old_bucket <= bucket - self.keep_buckets:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
@@ -32,6 +32,16 @@ def _get_int(name: str, default: int | None = None) -> int | None:
         raise RuntimeError(f"Invalid integer for {name}: {raw}") from exc
 
 
+def _get_float(name: str, default: float | None = None) -> float | None:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError as exc:
+        raise RuntimeError(f"Invalid number for {name}: {raw}") from exc
+
+
 def _get_json(name: str, default: dict | None = None) -> dict | None:
     raw = os.getenv(name)
     if raw is None or raw.strip() == "":
@@ -85,9 +95,54 @@ CONFIG = {
     "openrouter_referer": _get_env("OPENROUTER_REFERER"),
     "openrouter_app_title": _get_env("OPENROUTER_APP_TITLE", "trading-agent"),
     "llm_model": _get_env("LLM_MODEL", "gpt-4o-mini"),
+    # Override the provider's API base URL, e.g. http://127.0.0.1:8765/v1 for src/llm_stub.py
+    "llm_base_url": _get_env("LLM_BASE_URL"),
+    # Stream completions (SSE) and act on each trade decision as soon as it is parsed
+    "llm_stream": _get_bool("LLM_STREAM", False),
+    # "standard" (reasoning first) or "latency" (decisions first, reasoning via background call)
+    "llm_decision_mode": _get_env("LLM_DECISION_MODE", "standard"),
+    "llm_rationale_model": _get_env("LLM_RATIONALE_MODEL"),
+    # Assets per concurrent decision call; 0 sends every asset in one prompt
+    "llm_shard_size": _get_int("LLM_SHARD_SIZE", 0),
+    # Hedged requests: race a backup "provider:model" when the primary is slower than its p95
+    "llm_hedge_model": _get_env("LLM_HEDGE_MODEL"),
+    "llm_hedge_percentile": _get_float("LLM_HEDGE_PERCENTILE", 95.0),
+    "llm_hedge_delay_seconds": _get_float("LLM_HEDGE_DELAY_SECONDS", 10.0),
+    "llm_hedge_min_delay_seconds": _get_float("LLM_HEDGE_MIN_DELAY_SECONDS", 1.0),
+    # Two-stage server mode: one shared thesis per asset per interval, then per-account sizing
+    "shared_thesis_enabled": _get_bool("SHARED_THESIS_ENABLED", False),
+    "thesis_model": _get_env("THESIS_MODEL"),
+    "thesis_sizing_model": _get_env("THESIS_SIZING_MODEL"),
+    # Extra "provider:model" members decided concurrently with LLM_MODEL and merged per asset (unset disables)
+    "llm_ensemble_models": _get_list("LLM_ENSEMBLE_MODELS"),
+    "llm_ensemble_rule": _get_env("LLM_ENSEMBLE_RULE", "majority"),
+    "llm_ensemble_timeout_seconds": _get_float("LLM_ENSEMBLE_TIMEOUT_SECONDS", 60.0),
+    "llm_ensemble_quorum": _get_int("LLM_ENSEMBLE_QUORUM", 1),
+    # Remembered structured-output/tool rejections per provider+model
+    "llm_capability_cache": _get_env("LLM_CAPABILITY_CACHE", "llm_capabilities.json"),
+    "llm_capability_ttl_hours": _get_float("LLM_CAPABILITY_TTL_HOURS", 24.0),
+    # Corrective follow-up turns after unusable output, and the token cap they may spend per decision
+    "llm_max_retries": _get_int("LLM_MAX_RETRIES", 1),
+    "llm_retry_token_budget": _get_int("LLM_RETRY_TOKEN_BUDGET", 20000),
+    # Per-call/per-decision token, latency and cost records; pricing is USD per 1M tokens per model,
+    # e.g. {"gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6}}
+    "llm_metrics_log": _get_env("LLM_METRICS_LOG", "llm_metrics.jsonl"),
+    "llm_pricing": _get_json("LLM_PRICING"),
+    # prompts.log / llm_requests.log: sampled, written off the hot path, rotated and compressed
+    "prompt_log_sample_rate": _get_float("PROMPT_LOG_SAMPLE_RATE", 1.0),
+    "request_log_sample_rate": _get_float("REQUEST_LOG_SAMPLE_RATE", 1.0),
+    "debug_log_max_bytes": _get_int("DEBUG_LOG_MAX_BYTES", 50_000_000),
+    "debug_log_max_age_seconds": _get_float("DEBUG_LOG_MAX_AGE_SECONDS", 86400.0),
+    "debug_log_backups": _get_int("DEBUG_LOG_BACKUPS", 5),
+    "debug_log_compression": _get_env("DEBUG_LOG_COMPRESSION", "gzip"),  # gzip, zstd or none
     # Reasoning tokens
     "reasoning_enabled": _get_bool("REASONING_ENABLED", False),
     "reasoning_effort": _get_env("REASONING_EFFORT", "high"),
+    # Pick effort/max_tokens per call from market activity and cycle budget; REASONING_EFFORT is the ceiling
+    "reasoning_adaptive": _get_bool("REASONING_ADAPTIVE", False),
+    "reasoning_token_caps": _get_json("REASONING_TOKEN_CAPS", None),
+    "reasoning_calm_move_pct": _get_float("REASONING_CALM_MOVE_PCT", 0.3),
+    "reasoning_active_move_pct": _get_float("REASONING_ACTIVE_MOVE_PCT", 1.0),
     # Provider routing
     "provider_config": _get_json("PROVIDER_CONFIG"),
     "provider_quantizations": _get_list("PROVIDER_QUANTIZATIONS"),
@@ -95,6 +150,37 @@ CONFIG = {
     "assets": _get_env("ASSETS"),  # e.g., "BTC ETH SOL" or "BTC,ETH,SOL"
     "interval": _get_env("INTERVAL"),  # e.g., "5m", "1h"
     "risk_profile": _get_env("RISK_PROFILE", "conservative"),  # conservative, moderate, high
+    # Assets whose market data is gathered concurrently each cycle
+    "gather_concurrency": _get_int("GATHER_CONCURRENCY", 20),
+    # Decisions that may wait per asset behind a slow execution before the loop blocks
+    "execution_queue_size": _get_int("EXECUTION_QUEUE_SIZE", 4),
+    # Diary entries are buffered and written (with their index records) this often
+    "diary_flush_seconds": _get_float("DIARY_FLUSH_SECONDS", 0.5),
+    # /events replay buffer, and events a slow client may fall behind before it is disconnected
+    "event_history": _get_int("EVENT_HISTORY", 1000),
+    "event_client_queue": _get_int("EVENT_CLIENT_QUEUE", 256),
+    # Round-trip statistics computed from fills, persisted across restarts
+    "performance_state_path": _get_env("PERFORMANCE_STATE_PATH", "performance.json"),
+    # Seconds after each interval boundary (candle close) at which a cycle fires
+    "cycle_offset_seconds": _get_float("CYCLE_OFFSET_SECONDS", 2.0),
+    # Fetch the next cycle's account state and market data this long before its tick (0 disables)
+    "prefetch_lead_seconds": _get_float("PREFETCH_LEAD_SECONDS", 1.5),
+    "prefetch_max_age_seconds": _get_float("PREFETCH_MAX_AGE_SECONDS", 30.0),
+    # Step the interval between CADENCE_MIN_INTERVAL and CADENCE_MAX_INTERVAL from volatility and TP/SL proximity
+    "cadence_adaptive": _get_bool("CADENCE_ADAPTIVE", False),
+    "cadence_min_interval": _get_env("CADENCE_MIN_INTERVAL", "1m"),
+    "cadence_max_interval": _get_env("CADENCE_MAX_INTERVAL", "15m"),
+    "cadence_active_vol_ratio": _get_float("CADENCE_ACTIVE_VOL_RATIO", 1.5),
+    "cadence_quiet_vol_ratio": _get_float("CADENCE_QUIET_VOL_RATIO", 0.5),
+    "cadence_trigger_proximity_pct": _get_float("CADENCE_TRIGGER_PROXIMITY_PCT", 0.5),
+    # Time budget for gather + decide + execute per cycle; unset = 90% of the interval, 0 disables
+    "cycle_deadline_seconds": _get_float("CYCLE_DEADLINE_SECONDS"),
+    # Skip the LLM call when quantized market/account state is unchanged since the last decision
+    "change_gate_enabled": _get_bool("CHANGE_GATE_ENABLED", False),
+    "change_gate_price_move_pct": _get_float("CHANGE_GATE_PRICE_MOVE_PCT", 0.25),
+    "change_gate_rsi_band": _get_float("CHANGE_GATE_RSI_BAND", 10.0),
+    "change_gate_trigger_proximity_pct": _get_float("CHANGE_GATE_TRIGGER_PROXIMITY_PCT", 0.5),
+    "change_gate_max_skips": _get_int("CHANGE_GATE_MAX_SKIPS", 6),
     # API server
     "api_host": _get_env("API_HOST", "0.0.0.0"),
     "api_port": _get_env("APP_PORT") or _get_env("API_PORT") or "3000",
@@ -14,6 +14,28 @@ class LocalIndicatorCalculator:
         """Initialize Binance API client."""
         self.base_url = "https://api.binance.com/api/v3"
 
+    def _fetch_kline_rows(self, symbol: str, interval: str, limit: int = 100) -> list:
+        """Fetch raw Binance kline arrays (the JSON rows, unparsed).
+
+        Args:
+            symbol: Trading pair (e.g., 'BTCUSDT')
+            interval: Candle interval (e.g., '5m', '1h', '4h')
+            limit: Number of candles to fetch (max 1000)
+
+        Returns:
+            List of kline rows as returned by the Binance API.
+        """
+        url = f"{self.base_url}/klines"
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "limit": limit
+        }
+
+        response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
     def _fetch_klines(self, symbol: str, interval: str, limit: int = 100) -> pd.DataFrame:
         """Fetch OHLCV data from Binance and convert to DataFrame.
 
@@ -26,16 +48,7 @@ class LocalIndicatorCalculator:
             DataFrame with columns: timestamp, open, high, low, close, volume
         """
         try:
-            url = f"{self.base_url}/klines"
-            params = {
-                "symbol": symbol,
-                "interval": interval,
-                "limit": limit
-            }
-
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._fetch_kline_rows(symbol, interval, limit)
 
             # Parse Binance kline format
             df = pd.DataFrame(data, columns=[
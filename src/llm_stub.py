@@ -0,0 +1,364 @@
+"""Offline OpenAI/OpenRouter-compatible chat completions stub for load and latency testing.
+
+Point the agent at it with ``LLM_BASE_URL=http://127.0.0.1:8765/v1`` and run::
+
+    python src/llm_stub.py --port 8765 --latency lognormal:0.8,0.4 --malformed-rate 0.05
+
+Replies are deterministic for a given ``--seed`` and request body, so a
+benchmark run can be repeated exactly.
+"""
+
+import sys
+import argparse
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).parent.parent))
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+from aiohttp import web
+from src.agent.latency import percentile
+
+MALFORMED_KINDS = ("fenced", "prose", "single_quotes", "truncated", "legacy_list", "garbage")
+
+
+def parse_latency(spec):
+    """Parse a latency distribution spec into a ``sampler(rng) -> seconds`` callable.
+
+    Supported specs: ``fixed:S``, ``uniform:LO,HI``, ``normal:MEAN,STDDEV``
+    and ``lognormal:MEDIAN,SIGMA``. Samples are clamped at zero.
+    """
+    kind, _, raw = (spec or "fixed:0").partition(":")
+    params = [float(p) for p in raw.split(",") if p.strip()] if raw else []
+    if kind == "fixed":
+        value = params[0] if params else 0.0
+        return lambda rng: max(0.0, value)
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: max(0.0, rng.uniform(params[0], params[1]))
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal" and len(params) == 2:
+        mu = math.log(params[0]) if params[0] > 0 else 0.0
+        return lambda rng: max(0.0, rng.lognormvariate(mu, params[1]))
+    raise ValueError(f"Unsupported latency spec: {spec}")
+
+
+class StubLLM:
+    """Produce chat completions shaped like the real providers' replies.
+
+    Each request gets its own RNG seeded from ``seed`` and a digest of the
+    request body, so identical requests always get identical replies
+    regardless of concurrency or arrival order.
+    """
+
+    def __init__(self, seed=0, latency="fixed:0", ttfb_fraction=0.3, tool_call_rate=0.0,
+                 malformed_rate=0.0, trade_rate=0.3, chunk_chars=24):
+        self.seed = seed
+        self.sample_latency = parse_latency(latency)
+        self.ttfb_fraction = min(max(ttfb_fraction, 0.0), 1.0)
+        self.tool_call_rate = tool_call_rate
+        self.malformed_rate = malformed_rate
+        self.trade_rate = trade_rate
+        self.chunk_chars = max(1, chunk_chars)
+        self.stats = {"requests": 0, "streamed": 0, "tool_calls": 0, "malformed": 0, "rationale": 0, "decisions": 0}
+        self.latencies = []
+
+    def _rng(self, body):
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        return random.Random(f"{self.seed}:{digest}")
+
+    @staticmethod
+    def _context(messages):
+        """Return the first user message that parses as the agent's JSON context."""
+        for message in messages:
+            if message.get("role") != "user":
+                continue
+            try:
+                payload = json.loads(message.get("content") or "")
+            except (json.JSONDecodeError, TypeError):
+                continue
+            if isinstance(payload, dict):
+                # The rationale follow-up nests the context as a JSON string
+                if isinstance(payload.get("context"), str):
+                    try:
+                        return json.loads(payload["context"])
+                    except json.JSONDecodeError:
+                        pass
+                return payload
+        return {}
+
+    @staticmethod
+    def _schema(body):
+        response_format = body.get("response_format") or {}
+        return (response_format.get("json_schema") or {}).get("schema")
+
+    @staticmethod
+    def _assets(schema, context):
+        try:
+            enum = schema["properties"]["trade_decisions"]["items"]["properties"]["asset"]["enum"]
+            if enum:
+                return list(enum)
+        except (KeyError, TypeError):
+            pass
+        assets = (context.get("instructions") or {}).get("assets")
+        if assets:
+            return list(assets)
+        return [m.get("asset") for m in context.get("market_data") or [] if m.get("asset")]
+
+    def _decision(self, rng, asset, price):
+        if not price or rng.random() >= self.trade_rate:
+            return {
+                "asset": asset,
+                "action": "hold",
+                "allocation_usd": 0.0,
+                "tp_price": None,
+                "sl_price": None,
+                "exit_plan": "",
+                "rationale": "Stub: no edge, holding.",
+            }
+        action = rng.choice(["buy", "sell"])
+        tp_pct = rng.uniform(0.005, 0.02)
+        sl_pct = rng.uniform(0.005, 0.01)
+        sign = 1 if action == "buy" else -1
+        return {
+            "asset": asset,
+            "action": action,
+            "allocation_usd": round(rng.uniform(12, 50), 2),
+            "tp_price": round(price * (1 + sign * tp_pct), 2),
+            "sl_price": round(price * (1 - sign * sl_pct), 2),
+            "exit_plan": f"Stub: exit at TP/SL or if price crosses {round(price, 2)} against the trade.",
+            "rationale": f"Stub: {action} signal.",
+        }
+
+    def _decisions_payload(self, rng, schema, context):
+        prices = {m.get("asset"): m.get("current_price") for m in context.get("market_data") or []}
+        decisions = [self._decision(rng, asset, prices.get(asset)) for asset in self._assets(schema, context)]
+        fields = {
+            "reasoning": "Stub reasoning: deterministic synthetic decision.",
+            "summary": "Stub summary.",
+            "trade_decisions": decisions,
+        }
+        order = list((schema or {}).get("properties") or ["reasoning", "summary", "trade_decisions"])
+        return {key: fields[key] for key in order if key in fields}
+
+    @staticmethod
+    def _malform(rng, payload):
+        """Return ``(kind, text)`` with ``payload`` serialized in one of the broken shapes."""
+        kind = rng.choice(MALFORMED_KINDS)
+        text = json.dumps(payload)
+        if kind == "fenced":
+            return kind, f"```json\n{json.dumps(payload, indent=2)}\n```"
+        if kind == "prose":
+            return kind, f"Here are my decisions:\n{text}\nLet me know if you need anything else."
+        if kind == "single_quotes":
+            return kind, repr(payload)
+        if kind == "truncated":
+            return kind, text[: max(1, int(len(text) * rng.uniform(0.5, 0.95)))]
+        if kind == "legacy_list":
+            rows = [[d[k] for k in ("asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale")]
+                    for d in payload.get("trade_decisions", [])]
+            return kind, json.dumps(rows)
+        return kind, "I am unable to produce JSON right now."
+
+    def _tool_call(self, rng, context, schema):
+        assets = self._assets(schema, context) or ["BTC"]
+        indicator, period = rng.choice([("rsi", 14), ("ema", 20), ("atr", 14)])
+        return {
+            "id": f"call_{rng.getrandbits(48):012x}",
+            "type": "function",
+            "function": {
+                "name": "fetch_indicator",
+                "arguments": json.dumps({
+                    "indicator": indicator,
+                    "symbol": f"{rng.choice(assets)}/USDT",
+                    "interval": rng.choice(["5m", "1h", "4h"]),
+                    "period": period,
+                }),
+            },
+        }
+
+    def complete(self, body):
+        """Build the assistant message for ``body``.
+
+        Returns:
+            ``(message, latency_seconds, rng)``.
+        """
+        rng = self._rng(body)
+        latency = self.sample_latency(rng)
+        messages = body.get("messages") or []
+        schema = self._schema(body)
+        context = self._context(messages)
+        self.stats["requests"] += 1
+
+        already_called_tools = any(m.get("role") == "tool" for m in messages)
+        if body.get("tools") and not already_called_tools and rng.random() < self.tool_call_rate:
+            self.stats["tool_calls"] += 1
+            return {"role": "assistant", "content": None, "tool_calls": [self._tool_call(rng, context, schema)]}, latency, rng
+
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        # Plain-text follow-ups (e.g. the latency-mode rationale) carry neither a schema nor tools
+        if schema is None and not body.get("tools") and "trade_decisions" not in system:
+            self.stats["rationale"] += 1
+            try:
+                decisions = json.loads(messages[-1].get("content") or "{}").get("trade_decisions") or []
+            except (json.JSONDecodeError, AttributeError, IndexError):
+                decisions = []
+            text = "Stub rationale: " + ", ".join(f"{d.get('asset')} {d.get('action')}" for d in decisions)
+            return {"role": "assistant", "content": text}, latency, rng
+
+        self.stats["decisions"] += 1
+        payload = self._decisions_payload(rng, schema, context)
+        if rng.random() < self.malformed_rate:
+            kind, content = self._malform(rng, payload)
+            self.stats["malformed"] += 1
+            logging.info("Injecting malformed output (%s)", kind)
+        else:
+            content = json.dumps(payload)
+        return {"role": "assistant", "content": content}, latency, rng
+
+    @staticmethod
+    def usage(body, message):
+        prompt_tokens = len(json.dumps(body.get("messages") or [])) // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+        if len(self.latencies) > 10000:
+            del self.latencies[:5000]
+
+    def snapshot(self):
+        return dict(
+            self.stats,
+            latency_p50=percentile(self.latencies, 50),
+            latency_p95=percentile(self.latencies, 95),
+            latency_p99=percentile(self.latencies, 99),
+        )
+
+
+def create_app(stub):
+    """Return an aiohttp app serving ``stub`` under the OpenAI and OpenRouter paths."""
+
+    async def handle_completions(request):
+        started = time.monotonic()
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"error": {"message": "Invalid JSON body"}}, status=400)
+        message, latency, rng = stub.complete(body)
+        completion_id = f"chatcmpl-stub-{rng.getrandbits(64):016x}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        usage = stub.usage(body, message)
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            stub.record_latency(time.monotonic() - started)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message,
+                             "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+                "usage": usage,
+            })
+
+        stub.stats["streamed"] += 1
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+
+        async def send(delta, finish_reason=None, **extra):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            chunk.update(extra)
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        await asyncio.sleep(latency * stub.ttfb_fraction)
+        await resp.write(b": keep-alive\n\n")
+        if message.get("tool_calls"):
+            pieces = []
+            for index, tc in enumerate(message["tool_calls"]):
+                pieces.append({"tool_calls": [{"index": index, "id": tc["id"], "type": "function",
+                                               "function": {"name": tc["function"]["name"], "arguments": ""}}]})
+                args = tc["function"]["arguments"]
+                for i in range(0, len(args), stub.chunk_chars):
+                    pieces.append({"tool_calls": [{"index": index, "function": {"arguments": args[i:i + stub.chunk_chars]}}]})
+            finish_reason = "tool_calls"
+        else:
+            content = message.get("content") or ""
+            pieces = [{"content": content[i:i + stub.chunk_chars]} for i in range(0, len(content), stub.chunk_chars)]
+            finish_reason = "stop"
+        step = latency * (1 - stub.ttfb_fraction) / max(len(pieces), 1)
+        await send({"role": "assistant", "content": ""})
+        for piece in pieces:
+            await asyncio.sleep(step)
+            await send(piece)
+        await send({}, finish_reason=finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await resp.write(f"data: {json.dumps({'id': completion_id, 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        stub.record_latency(time.monotonic() - started)
+        return resp
+
+    async def handle_models(request):
+        return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+
+    async def handle_stats(request):
+        return web.json_response(stub.snapshot())
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    for prefix in ("", "/v1", "/api/v1"):
+        app.router.add_post(f"{prefix}/chat/completions", handle_completions)
+        app.router.add_get(f"{prefix}/models", handle_models)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible LLM stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="fixed:S | uniform:LO,HI | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument("--ttfb-fraction", type=float, default=0.3,
+                        help="Share of the sampled latency spent before the first streamed byte")
+    parser.add_argument("--tool-call-rate", type=float, default=0.0,
+                        help="Probability of answering a tool-enabled request with a fetch_indicator call")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Probability of returning decisions in a broken shape")
+    parser.add_argument("--trade-rate", type=float, default=0.3,
+                        help="Probability that an asset gets a buy/sell instead of a hold")
+    parser.add_argument("--chunk-chars", type=int, default=24, help="Characters per streamed delta")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stub = StubLLM(
+        seed=args.seed,
+        latency=args.latency,
+        ttfb_fraction=args.ttfb_fraction,
+        tool_call_rate=args.tool_call_rate,
+        malformed_rate=args.malformed_rate,
+        trade_rate=args.trade_rate,
+        chunk_chars=args.chunk_chars,
+    )
+    logging.info("LLM stub listening on http://%s:%s/v1 (latency=%s)", args.host, args.port, args.latency)
+    web.run_app(create_app(stub), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
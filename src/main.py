@@ -4,21 +4,34 @@ import sys
 import argparse
 import pathlib
 sys.path.append(str(pathlib.Path(__file__).parent.parent))
-from src.agent.decision_maker import TradingAgent
+from src.agent.decision_maker import DeadlineExceeded, TradingAgent
+from src.agent.change_gate import ChangeDetectionGate
 from src.indicators.local_indicators import LocalIndicatorCalculator
 from src.trading.hyperliquid_api import HyperliquidAPI
+from src.trading.performance import PerformanceTracker
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import random
+import signal
+import time
 from collections import deque, OrderedDict
 from datetime import datetime, timezone
-import math  # For Sharpe
+import math
 from dotenv import load_dotenv
 import os
 import json
 from aiohttp import web
 from src.utils.formatting import format_number as fmt, format_size as fmt_sz
 from src.utils.prompt_utils import json_default, round_or_none, round_series
+from src.utils.async_utils import gather_bounded
+from src.utils.scheduler import AdaptiveCadence, CycleScheduler, cadence_signals
+from src.utils.pipeline import AssetLanes, StageStats
+from src.utils.diary import DiaryStore
+from src.utils.rotating_log import config_options, open_log
+from src.utils.file_tail import file_etag, read_from, tail_bytes, tail_lines
+from src.utils.events import KEEPALIVE, EventBus, format_sse
+from src.utils.capture import CaptureExhausted, CapturePlayer, CaptureWriter, instrument, parse_cycles
 
 
 def generate_debug_trades(assets, asset_prices, positions):
@@ -89,6 +102,70 @@ def clear_terminal():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 
+# Candle intervals the market sections' indicators are computed on
+INDICATOR_INTERVALS = ("5m", "4h")
+
+# Largest body returned for one ``since=<offset>`` read of a log file
+LOG_CHUNK_BYTES = 1024 * 1024
+
+
+def not_modified(request, etag):
+    """Return True when the request's If-None-Match already names ``etag``."""
+    tags = [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+    return etag in tags or "*" in tags
+
+
+async def serve_text_file(request, path, default_limit=2000, byte_limit=True):
+    """Serve part or all of a growing text file without loading it into memory.
+
+    ``download`` or ``limit=all`` (and any request with a ``Range`` header)
+    stream the file in chunks with Range and conditional-request support, as
+    does a request without ``lines``/``limit``/``since`` when ``default_limit``
+    is None. Otherwise the response is the last ``lines`` lines, the last
+    ``limit`` bytes (when ``byte_limit``), or, with ``since=<byte offset>``,
+    the whole lines after that offset (up to :data:`LOG_CHUNK_BYTES`);
+    ``X-Next-Offset`` carries the cursor for the next poll. Partial responses
+    get a weak ETag from the file's size and mtime, answer a matching
+    ``If-None-Match`` with 304, and are gzipped when the client accepts it.
+    """
+    if not os.path.exists(path):
+        return web.Response(text="", content_type="text/plain")
+    query = request.query
+    limit_param = query.get('limit') if byte_limit else None
+    full = limit_param and (limit_param.lower() == 'all' or limit_param == '-1')
+    if default_limit is None and not (limit_param or query.get('lines') or query.get('since') is not None):
+        full = True
+    if query.get('download') or full or "Range" in request.headers:
+        headers = {"Content-Type": "text/plain"}
+        if query.get('download'):
+            headers["Content-Disposition"] = f"attachment; filename={os.path.basename(path)}"
+        return web.FileResponse(path, headers=headers)
+
+    try:
+        since = int(query['since']) if query.get('since') is not None else None
+        lines = int(query['lines']) if query.get('lines') else None
+        limit = int(limit_param) if limit_param else default_limit
+    except ValueError:
+        raise web.HTTPBadRequest(text="since, lines and limit must be integers")
+
+    etag = f"W/{file_etag(path)}"
+    if not_modified(request, etag):
+        return web.Response(status=304, headers={"ETag": etag})
+    if since is not None:
+        data, start, end = await asyncio.to_thread(read_from, path, since, LOG_CHUNK_BYTES, True)
+        headers = {"X-Start-Offset": str(start)}
+    elif lines:
+        data, end = await asyncio.to_thread(tail_lines, path, lines)
+        headers = {}
+    else:
+        data, end = await asyncio.to_thread(tail_bytes, path, limit)
+        headers = {}
+    headers.update({"ETag": etag, "X-Next-Offset": str(end)})
+    response = web.Response(body=data, content_type="text/plain", charset="utf-8", headers=headers)
+    response.enable_compression()
+    return response
+
+
 def get_interval_seconds(interval_str):
     """Convert interval strings like '5m' or '1h' to seconds."""
     if interval_str.endswith('s'):
@@ -109,6 +186,9 @@ def main():
     parser.add_argument("--assets", type=str, nargs="+", required=False, help="Assets to trade, e.g., BTC ETH")
     parser.add_argument("--interval", type=str, required=False, help="Interval period, e.g., 1h")
     parser.add_argument("--risk-profile", type=str, choices=["conservative", "moderate", "high", "debug"], required=False, help="Risk profile: conservative (default), moderate, high, or debug (for testing)")
+    parser.add_argument("--capture", type=str, required=False, help="Record every cycle's exchange, kline, LLM and tool responses to this JSONL file (.gz to compress)")
+    parser.add_argument("--replay", type=str, required=False, help="Re-run the loop offline at full speed against a capture file")
+    parser.add_argument("--replay-cycles", type=str, required=False, help="Replay only cycle N or cycles N-M of the capture")
     args = parser.parse_args()
 
     # Allow assets/interval/risk-profile via .env (CONFIG) if CLI not provided
@@ -132,21 +212,58 @@ def main():
         parser.error("Please provide --assets and --interval, or set ASSETS and INTERVAL in .env")
 
     taapi = LocalIndicatorCalculator()
-    hyperliquid = HyperliquidAPI()
+    if args.replay:
+        # No credentials or SDK clients needed: every exchange call is served from the capture
+        hyperliquid = HyperliquidAPI.__new__(HyperliquidAPI)
+        hyperliquid._meta_cache = None
+    else:
+        hyperliquid = HyperliquidAPI()
     agent = TradingAgent(risk_profile=args.risk_profile)
-
+    capture_writer = None
+    replay_player = None
+    if args.replay:
+        replay_player = CapturePlayer(args.replay, cycles=parse_cycles(args.replay_cycles))
+        instrument(hyperliquid, taapi, agent, player=replay_player)
+        print(f"Replaying {len(replay_player.cycles)} cycle(s) from {args.replay}")
+    elif args.capture:
+        capture_writer = CaptureWriter(args.capture)
+        instrument(hyperliquid, taapi, agent, writer=capture_writer)
+        print(f"Capturing cycle inputs to {args.capture}")
+    change_gate = None
+    if CONFIG.get("change_gate_enabled"):
+        # An explicit 0 is meaningful here (e.g. re-ask on any price move), so only unset keys default
+        gate_defaults = {"price_move_pct": 0.25, "rsi_band": 10.0, "trigger_proximity_pct": 0.5, "max_skips": 6}
+        change_gate = ChangeDetectionGate(**{
+            name: default if CONFIG.get(f"change_gate_{name}") is None else CONFIG.get(f"change_gate_{name}")
+            for name, default in gate_defaults.items()
+        })
 
     start_time = datetime.now(timezone.utc)
     invocation_count = 0
-    trade_log = []  # For Sharpe: list of returns
     active_trades = []  # {'asset','is_long','amount','entry_price','tp_oid','sl_oid','exit_plan'}
     recent_events = deque(maxlen=200)
     diary_path = "diary.jsonl"
+    if args.replay:
+        # Keep replayed trades out of the live diary
+        diary_path = f"{args.replay.removesuffix('.gz').removesuffix('.jsonl')}_replay_diary.jsonl"
+        open(diary_path, "w").close()
+    diary = DiaryStore(diary_path, CONFIG.get("diary_flush_seconds") or 0.5)
+    # Realized PnL, Sharpe/Sortino, drawdown and win rate, updated from new fills each cycle
+    performance = PerformanceTracker(None if args.replay else CONFIG.get("performance_state_path") or "performance.json")
+    # Decisions, orders, fills, reconciles, cycle timings and log lines pushed to /events clients
+    events = EventBus(CONFIG.get("event_history") or 1000, CONFIG.get("event_client_queue") or 256)
+    # Cycle contexts for the dashboard; the header line format is what it splits on
+    prompt_log = open_log("prompts.log", **config_options(CONFIG, "prompt_log_sample_rate"))
+    replay_cycle_times = []
     initial_account_value = None
     # Perp mid-price history sampled each loop (authoritative, avoids spot/perp basis mismatch)
     price_history = {}
     # Track assets we just traded to avoid immediate reconciliation
     just_traded_assets = set()
+    # Assets whose execution from an earlier cycle was still running when this cycle gathered
+    lagging_assets = set()
+    # Strong references to fire-and-forget tasks (background rationale calls)
+    background_tasks = set()
 
     # Override interval for debug mode - use 30 seconds for rapid testing
     if args.risk_profile == "debug":
@@ -162,24 +279,545 @@ def main():
     }
     print(f"Risk Profile: {args.risk_profile.upper()} - {profile_desc.get(args.risk_profile, 'Unknown')}")
 
+    # Wall-clock budget for gather + decide + execute in one cycle (None disables the deadline)
+    cycle_budget = CONFIG.get("cycle_deadline_seconds")
+    if cycle_budget is None:
+        cycle_budget = get_interval_seconds(args.interval) * 0.9
+    cycle_budget = cycle_budget or None
+
+    # Cycles fire on interval boundaries (candle closes) plus an offset, not interval after the last one ended
+    scheduler = CycleScheduler(get_interval_seconds(args.interval), CONFIG.get("cycle_offset_seconds") or 0.0)
+    # Optional volatility-adaptive cadence: the interval moves between CADENCE_MIN/MAX_INTERVAL
+    cadence = None
+    if CONFIG.get("cadence_adaptive"):
+        cadence = AdaptiveCadence(
+            get_interval_seconds(args.interval),
+            get_interval_seconds(CONFIG.get("cadence_min_interval") or args.interval),
+            get_interval_seconds(CONFIG.get("cadence_max_interval") or args.interval),
+            active_ratio=CONFIG.get("cadence_active_vol_ratio") or 1.5,
+            quiet_ratio=CONFIG.get("cadence_quiet_vol_ratio") or 0.5,
+            trigger_pct=CONFIG.get("cadence_trigger_proximity_pct") or 0.5,
+        )
+
     def add_event(msg: str):
-        """Log an informational event and push it into the recent events deque."""
+        """Log an informational event and push it to live event stream clients."""
         logging.info(msg)
+        events.publish("log", {"message": msg})
+
+    async def pause(seconds):
+        """Sleep between loop steps; a replay runs at full speed instead."""
+        if replay_player is None:
+            await asyncio.sleep(seconds)
+
+    async def execute_decision(output, state, asset_prices):
+        """Execute a single normalized trade decision and record it in the diary."""
+        asset = output.get("asset")
+        try:
+            if not asset or asset not in args.assets:
+                return
+            action = output.get("action")
+            current_price = asset_prices.get(asset, 0)
+            action = output["action"]
+            rationale = output.get("rationale", "")
+            if rationale:
+                add_event(f"Decision rationale for {asset}: {rationale}")
+            if action in ("buy", "sell"):
+                is_buy = action == "buy"
+                alloc_usd = float(output.get("allocation_usd", 0.0))
+                if alloc_usd <= 0:
+                    add_event(f"Holding {asset}: zero/negative allocation")
+                    return
+                # Ensure minimum order value of $12 to avoid exchange rejection ($10 minimum)
+                if alloc_usd < 12:
+                    alloc_usd = 12.0
+                    add_event(f"Bumped allocation to ${alloc_usd} to meet exchange minimum")
+
+                # Check if we have an existing position
+                existing_position = None
+                for pos in state['positions']:
+                    if pos.get('coin') == asset:
+                        existing_position = pos
+                        break
+
+                # Determine amount and action type
+                if existing_position:
+                    existing_size = float(existing_position.get('szi', 0))
+                    existing_is_long = existing_size > 0
+                    abs_size = abs(existing_size)
+
+                    if (is_buy and existing_is_long) or (not is_buy and not existing_is_long):
+                        # Same direction - adding to position
+                        amount = alloc_usd / current_price
+                        add_event(f"Adding to existing {asset} {'LONG' if is_buy else 'SHORT'} position")
+                    else:
+                        # Opposite direction - closing position (possibly flipping)
+                        amount = abs_size  # Use exact position size to close
+                        add_event(f"Closing existing {asset} {'LONG' if existing_is_long else 'SHORT'} position (size: {amount})")
+                else:
+                    # No existing position - opening new
+                    amount = alloc_usd / current_price
+                    add_event(f"Opening new {asset} {'LONG' if is_buy else 'SHORT'} position")
+
+                # Mark asset as traded
+                just_traded_assets.add(asset)
+
+                order = await hyperliquid.place_buy_order(asset, amount) if is_buy else await hyperliquid.place_sell_order(asset, amount)
+                # Confirm by checking recent fills for this asset shortly after placing
+                await pause(1)
+                fills_check = await hyperliquid.get_recent_fills(limit=10)
+                filled = False
+                for fc in reversed(fills_check):
+                    try:
+                        if (fc.get('coin') == asset or fc.get('asset') == asset):
+                            filled = True
+                            break
+                    except Exception:
+                        continue
+                tp_oid = None
+                sl_oid = None
+                if output["tp_price"]:
+                    tp_order = await hyperliquid.place_take_profit(asset, is_buy, amount, output["tp_price"])
+                    tp_oids = hyperliquid.extract_oids(tp_order)
+                    tp_oid = tp_oids[0] if tp_oids else None
+                    add_event(f"TP placed {asset} at {output['tp_price']}")
+                if output["sl_price"]:
+                    sl_order = await hyperliquid.place_stop_loss(asset, is_buy, amount, output["sl_price"])
+                    sl_oids = hyperliquid.extract_oids(sl_order)
+                    sl_oid = sl_oids[0] if sl_oids else None
+                    add_event(f"SL placed {asset} at {output['sl_price']}")
+                # Update active_trades tracking
+                # Remove old tracking for this asset
+                for existing in active_trades[:]:
+                    if existing.get('asset') == asset:
+                        try:
+                            active_trades.remove(existing)
+                        except ValueError:
+                            pass
+
+                # Only add to active_trades if we're opening/adding to a position
+                # If we closed a position (existing_position and opposite direction), don't track it
+                should_track = True
+                if existing_position:
+                    existing_size = float(existing_position.get('szi', 0))
+                    existing_is_long = existing_size > 0
+                    if (is_buy and not existing_is_long) or (not is_buy and existing_is_long):
+                        # We closed the position
+                        should_track = False
+                        add_event(f"Position closed for {asset}")
+
+                if should_track:
+                    active_trades.append({
+                        "asset": asset,
+                        "is_long": is_buy,
+                        "amount": amount,
+                        "entry_price": current_price,
+                        "tp_oid": tp_oid,
+                        "sl_oid": sl_oid,
+                        "tp_price": output.get("tp_price"),
+                        "sl_price": output.get("sl_price"),
+                        "exit_plan": output["exit_plan"],
+                        "opened_at": datetime.now().isoformat()
+                    })
+
+                add_event(f"{action.upper()} {asset} amount {amount:.4f} at ~{current_price}")
+                if rationale:
+                    add_event(f"Post-trade rationale for {asset}: {rationale}")
+                # Write to diary after confirming fills status
+                diary_entry = {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "asset": asset,
+                    "action": action,
+                    "allocation_usd": alloc_usd,
+                    "amount": amount,
+                    "entry_price": current_price,
+                    "tp_price": output.get("tp_price"),
+                    "tp_oid": tp_oid,
+                    "sl_price": output.get("sl_price"),
+                    "sl_oid": sl_oid,
+                    "exit_plan": output.get("exit_plan", ""),
+                    "rationale": output.get("rationale", ""),
+                    "order_result": str(order),
+                    "opened_at": datetime.now(timezone.utc).isoformat(),
+                    "filled": filled
+                }
+                diary.append(diary_entry)
+                events.publish("order", diary_entry)
+                if filled:
+                    events.publish("fill", {"asset": asset, "action": action, "amount": amount, "price": current_price})
+            else:
+                add_event(f"Hold {asset}: {output.get('rationale', '')}")
+                # Write hold to diary
+                diary_entry = {
+                    "timestamp": datetime.now().isoformat(),
+                    "asset": asset,
+                    "action": "hold",
+                    "rationale": output.get("rationale", "")
+                }
+                diary.append(diary_entry)
+        except Exception as e:
+            import traceback
+            add_event(f"Execution error {asset}: {e}")
+
+    # Assets gathered at once; each asset's indicator fetches also run in parallel threads
+    gather_concurrency = CONFIG.get("gather_concurrency") or 20
+
+    async def gather_asset(asset, asset_prices):
+        """Fetch price, OI, funding and indicators for ``asset`` and build its market section."""
+        current_price = await hyperliquid.get_current_price(asset)
+        asset_prices[asset] = current_price
+
+        symbol = f"{asset}/USDT"
+        intraday_tf = "5m"
+        (
+            oi, funding,
+            ema_series, macd_series, rsi7_series, rsi14_series,
+            lt_ema20, lt_ema50, lt_atr3, lt_atr14, lt_macd_series, lt_rsi_series,
+        ) = await asyncio.gather(
+            hyperliquid.get_open_interest(asset),
+            hyperliquid.get_funding_rate(asset),
+            asyncio.to_thread(taapi.fetch_series, "ema", symbol, intraday_tf, results=10, params={"period": 20}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_series, "macd", symbol, intraday_tf, results=10, value_key="valueMACD"),
+            asyncio.to_thread(taapi.fetch_series, "rsi", symbol, intraday_tf, results=10, params={"period": 7}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_series, "rsi", symbol, intraday_tf, results=10, params={"period": 14}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_value, "ema", symbol, "4h", params={"period": 20}, key="value"),
+            asyncio.to_thread(taapi.fetch_value, "ema", symbol, "4h", params={"period": 50}, key="value"),
+            asyncio.to_thread(taapi.fetch_value, "atr", symbol, "4h", params={"period": 3}, key="value"),
+            asyncio.to_thread(taapi.fetch_value, "atr", symbol, "4h", params={"period": 14}, key="value"),
+            asyncio.to_thread(taapi.fetch_series, "macd", symbol, "4h", results=10, value_key="valueMACD"),
+            asyncio.to_thread(taapi.fetch_series, "rsi", symbol, "4h", results=10, params={"period": 14}, value_key="value"),
+        )
+        funding_annualized = round(funding * 24 * 365 * 100, 2) if funding else None
+
+        return {
+            "asset": asset,
+            "current_price": round_or_none(current_price, 2),
+            "intraday": {
+                "ema20": round_or_none(ema_series[-1], 2) if ema_series else None,
+                "macd": round_or_none(macd_series[-1], 2) if macd_series else None,
+                "rsi7": round_or_none(rsi7_series[-1], 2) if rsi7_series else None,
+                "rsi14": round_or_none(rsi14_series[-1], 2) if rsi14_series else None,
+                "series": {
+                    "ema20": round_series(ema_series, 2),
+                    "macd": round_series(macd_series, 2),
+                    "rsi7": round_series(rsi7_series, 2),
+                    "rsi14": round_series(rsi14_series, 2)
+                }
+            },
+            "long_term": {
+                "ema20": round_or_none(lt_ema20, 2),
+                "ema50": round_or_none(lt_ema50, 2),
+                "atr3": round_or_none(lt_atr3, 2),
+                "atr14": round_or_none(lt_atr14, 2),
+                "macd_series": round_series(lt_macd_series, 2),
+                "rsi_series": round_series(lt_rsi_series, 2)
+            },
+            "open_interest": round_or_none(oi, 2),
+            "funding_rate": round_or_none(funding, 8),
+            "funding_annualized_pct": funding_annualized,
+        }
+
+    async def gather_markets():
+        """Gather every asset's market section concurrently; returns ``(asset_prices, market_sections)``."""
+        asset_prices = {}
+        market_sections = await gather_bounded(
+            args.assets,
+            lambda asset: gather_asset(asset, asset_prices),
+            gather_concurrency,
+            on_error=lambda asset, e: add_event(f"Data gather error {asset}: {e}"),
+        )
+        return asset_prices, market_sections
+
+    async def fetch_cycle_inputs():
+        """Fetch everything a cycle reads from the exchange and market data feeds."""
+        fetched_at = time.time()
+        # Executions still running now may not show up in the state fetched below
+        pending_assets = execution_lanes.pending_assets()
+        state = await hyperliquid.get_user_state()
+        coins = [pos.get('coin') for pos in state['positions'] if pos.get('coin')]
+        position_prices = dict(zip(coins, await asyncio.gather(*(hyperliquid.get_current_price(c) for c in coins))))
+        try:
+            open_orders = await hyperliquid.get_open_orders()
+        except Exception:
+            open_orders = []
+        try:
+            fills = await hyperliquid.get_recent_fills(limit=50)
+        except Exception:
+            fills = []
+        asset_prices, market_sections = await gather_markets()
+        return {
+            "fetched_at": fetched_at,
+            "pending_assets": pending_assets,
+            "state": state,
+            "position_prices": position_prices,
+            "open_orders": open_orders,
+            "fills": fills,
+            "asset_prices": asset_prices,
+            "market_sections": market_sections,
+        }
+
+    # Prefetch the next cycle's inputs this long before its tick (0 disables)
+    prefetch_lead = CONFIG.get("prefetch_lead_seconds") or 0.0
+    prefetch_max_age = CONFIG.get("prefetch_max_age_seconds") or 30.0
+    prefetch_task = None
+
+    async def prefetch_at(when):
+        """Sleep until epoch ``when`` and fetch the next cycle's inputs."""
+        await asyncio.sleep(max(0.0, when - time.time()))
+        return await fetch_cycle_inputs()
+
+    async def take_prefetched():
+        """Return the prefetched inputs if still usable, refreshing market data after a candle close."""
+        nonlocal prefetch_task
+        task, prefetch_task = prefetch_task, None
+        if task is None:
+            return None
+        try:
+            inputs = await task
+        except Exception as e:
+            add_event(f"Prefetch failed, gathering now: {e}")
+            return None
+        now = time.time()
+        age = now - inputs["fetched_at"]
+        if age > prefetch_max_age:
+            add_event(f"Prefetched data is {age:.1f}s old; gathering now")
+            return None
+        # Klines count as final CYCLE_OFFSET_SECONDS after a candle's close (the tick's own offset);
+        # data fetched before that point for the latest close may still hold the unfinished candle
+        closed = [
+            tf for tf in INDICATOR_INTERVALS
+            if inputs["fetched_at"] < math.floor(now / get_interval_seconds(tf)) * get_interval_seconds(tf) + scheduler.offset
+        ]
+        if closed:
+            # Indicators depend on the candle that just closed; account state is still fresh
+            add_event(f"{'/'.join(closed)} candle was not final at prefetch; refreshing market data")
+            inputs["asset_prices"], inputs["market_sections"] = await gather_markets()
+            inputs["fetched_at"] = now
+        else:
+            logging.info("Using inputs prefetched %.2fs before the tick", age)
+        return inputs
+
+    # Execution runs in per-asset lanes so a slow order never delays the next cycle's decision
+    execution_lanes = AssetLanes(lambda item: execute_decision(*item), CONFIG.get("execution_queue_size") or 4)
+    stage_stats = {"gather": StageStats(), "decide": StageStats()}
+
+    async def submit_decision(output, state, asset_prices):
+        """Queue a decision on its asset's execution lane.
+
+        A buy/sell for an asset whose previous execution had not finished when
+        this cycle gathered was decided from a position snapshot that may not
+        include that trade, so it is dropped rather than risk doubling up.
+        """
+        asset = output.get("asset")
+        if asset in lagging_assets and output.get("action") in ("buy", "sell"):
+            add_event(f"Skipping {output.get('action')} {asset}: previous execution still in flight when this cycle gathered")
+            return
+        events.publish("decision", {key: output.get(key) for key in (
+            "asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale")})
+        await execution_lanes.submit(asset, (output, state, asset_prices))
+
+    def pipeline_snapshot():
+        """Queue depth and time-in-stage for the gather, decide and execute stages."""
+        lanes = execution_lanes.snapshot()
+        return {
+            "gather": stage_stats["gather"].snapshot(),
+            "decide": stage_stats["decide"].snapshot(),
+            "execute": {
+                "queue_depth": lanes["queue_depth"],
+                "executing": lanes["executing"],
+                "time_queued": lanes["time_queued"],
+                "time_in_stage": lanes["time_executing"],
+            },
+        }
+
+    async def request_decisions(context, state, asset_prices, executed_assets, deadline=None):
+        """Run the blocking agent call in a worker thread.
+
+        When streaming is enabled, each decision the agent finishes parsing is
+        queued for execution immediately instead of waiting for the full
+        completion; those assets are added to ``executed_assets`` so the caller
+        can skip them.
+
+        With a ``deadline`` (``time.monotonic()`` value) the agent stops its own
+        HTTP reads, tool calls and retries at that point; this coroutine stops
+        waiting shortly after and raises :class:`DeadlineExceeded`.
+        """
+        loop = asyncio.get_running_loop()
+        streamed = asyncio.Queue()
+        expired = False
+
+        def on_decision(decision):
+            loop.call_soon_threadsafe(streamed.put_nowait, decision)
+
+        async def consume():
+            while True:
+                decision = await streamed.get()
+                if decision is None:
+                    return
+                asset = decision.get("asset")
+                if expired or asset in executed_assets:
+                    continue
+                executed_assets.add(asset)
+                add_event(f"Streamed decision for {asset} complete; executing before the LLM reply finishes")
+                await submit_decision(decision, state, asset_prices)
+
+        consumer = asyncio.create_task(consume())
+        try:
+            call = asyncio.to_thread(
+                agent.decide_trade, args.assets, context, on_decision if agent.stream else None, deadline
+            )
+            if deadline is None:
+                return await call
+            try:
+                # Short grace so the worker can notice the deadline and return on its own
+                return await asyncio.wait_for(call, timeout=max(0.0, deadline - time.monotonic()) + 1.0)
+            except asyncio.TimeoutError as e:
+                expired = True
+                raise DeadlineExceeded("Cycle deadline passed while waiting for the LLM") from e
+        finally:
+            streamed.put_nowait(None)
+            await consumer
+
+    async def enforce_exit_plans(state, asset_prices):
+        """Close tracked positions whose recorded TP/SL level has been crossed.
+
+        Deterministic stand-in for a decision when the cycle deadline is missed:
+        resting trigger orders normally handle this, but a rejected or
+        cancelled trigger would otherwise leave the exit plan unenforced.
+        """
+        open_assets = {
+            p.get('coin') for p in state['positions'] if abs(float(p.get('szi') or 0)) > 0
+        }
+        for tr in active_trades[:]:
+            asset = tr.get('asset')
+            price = asset_prices.get(asset)
+            if asset not in open_assets or not price:
+                continue
+            is_long = tr.get('is_long')
+            tp_price = tr.get('tp_price')
+            sl_price = tr.get('sl_price')
+            hit = None
+            if tp_price and ((is_long and price >= tp_price) or (not is_long and price <= tp_price)):
+                hit = "take profit"
+            elif sl_price and ((is_long and price <= sl_price) or (not is_long and price >= sl_price)):
+                hit = "stop loss"
+            if not hit:
+                continue
+            add_event(f"Deadline fallback: {asset} at {price} crossed its {hit}; closing position")
+            try:
+                just_traded_assets.add(asset)
+                order = await hyperliquid.market_close(asset)
+                active_trades.remove(tr)
+                entry = {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "asset": asset,
+                    "action": "exit_plan_close",
+                    "reason": hit,
+                    "price": price,
+                    "order_result": str(order),
+                    "opened_at": tr.get('opened_at')
+                }
+                diary.append(entry)
+                events.publish("order", entry)
+            except Exception as e:
+                add_event(f"Deadline fallback close failed for {asset}: {e}")
+
+    async def deadline_fallback(phase, state, asset_prices):
+        """Hold every asset and enforce existing exit plans after a missed cycle deadline."""
+        add_event(f"Cycle deadline exceeded during {phase}; holding and enforcing existing exit plans")
+        await enforce_exit_plans(state, asset_prices)
+        reason = f"Cycle deadline exceeded during {phase}; holding"
+        return {
+            "reasoning": reason,
+            "summary": "Ran out of time this cycle, so I'm holding and letting existing exits do their job.",
+            "trade_decisions": [{
+                "asset": asset,
+                "action": "hold",
+                "allocation_usd": 0.0,
+                "tp_price": None,
+                "sl_price": None,
+                "exit_plan": "",
+                "rationale": reason
+            } for asset in args.assets]
+        }
+
+    def record_deadline_miss(phase, phase_times, elapsed):
+        """Log a missed cycle deadline with the phase that overran."""
+        timings = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in phase_times.items())
+        add_event(f"Cycle deadline missed in {phase} phase: {elapsed:.2f}s of {cycle_budget:.2f}s ({timings})")
+        diary.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "action": "deadline_miss",
+            "phase": phase,
+            "budget_seconds": round(cycle_budget, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in phase_times.items()}
+        })
+
+    async def write_rationale(context, outputs):
+        """Fetch the long-form rationale for a latency-mode cycle and record it in the diary."""
+        try:
+            reasoning = await asyncio.to_thread(agent.explain_decisions, context, outputs)
+        except Exception as e:
+            add_event(f"Rationale follow-up error: {e}")
+            return
+        if not reasoning:
+            return
+        add_event(f"LLM full rationale: {reasoning}")
+        diary.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "action": "reasoning",
+            "assets": [d.get("asset") for d in outputs.get("trade_decisions", [])],
+            "reasoning": reasoning
+        })
 
     async def run_loop():
         """Main trading loop that gathers data, calls the agent, and executes trades."""
-        nonlocal invocation_count, initial_account_value
+        nonlocal invocation_count, initial_account_value, cycle_budget, prefetch_task
+        # The default executor (min(32, cpus + 4) threads) would serialize the concurrent gather
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=gather_concurrency * 12 + 8))
         while True:
+            if replay_player is not None:
+                try:
+                    captured_cycle = replay_player.start_cycle()
+                except CaptureExhausted:
+                    return
+                replay_cycle_times.append((captured_cycle, time.monotonic()))
             invocation_count += 1
+            if capture_writer is not None:
+                capture_writer.start_cycle(invocation_count)
+            cycle_started = time.monotonic()
+            deadline = cycle_started + cycle_budget if cycle_budget else None
+            phase_times = {}
+            # Phase ("gather", "decide", "execute") that ran past the deadline, if any
+            missed_phase = None
             minutes_since_start = (datetime.now(timezone.utc) - start_time).total_seconds() / 60
 
             # Clear just-traded tracking from previous iteration
             just_traded_assets.clear()
+            lagging_assets.clear()
+            lagging_assets.update(execution_lanes.pending_assets())
+            stage_stats["gather"].in_flight = 1
+
+            # Global account state and market data, prefetched before the tick when possible
+            inputs = await take_prefetched() or await fetch_cycle_inputs()
+            # An execution that finished after the prefetch is not reflected in its state either
+            lagging_assets.update(inputs["pending_assets"])
+            if lagging_assets:
+                add_event(f"Executions still in flight from the previous cycle: {', '.join(sorted(lagging_assets))}")
+            state = inputs["state"]
+            open_orders = inputs["open_orders"]
+            asset_prices = inputs["asset_prices"]
+            market_sections = inputs["market_sections"]
+            sampled_at = datetime.fromtimestamp(inputs["fetched_at"], timezone.utc).isoformat()
+            for section in market_sections:
+                history = price_history.setdefault(section["asset"], deque(maxlen=60))
+                history.append({"t": sampled_at, "mid": section["current_price"]})
+                section["recent_mid_prices"] = [entry["mid"] for entry in list(history)[-10:]]
 
-            # Global account state
-            state = await hyperliquid.get_user_state()
             total_value = state.get('total_value') or state['balance'] + sum(p.get('pnl', 0) for p in state['positions'])
-            sharpe = calculate_sharpe(trade_log)
+            for trip in performance.add_fills(inputs["fills"]):
+                add_event(f"Round trip closed on {trip['asset']}: PnL ${trip['pnl']:.2f} ({trip['return_pct']:+.2f}%)")
+            track_record = performance.snapshot()
 
             account_value = total_value
             if initial_account_value is None:
@@ -190,7 +828,7 @@ def main():
             for pos_wrap in state['positions']:
                 pos = pos_wrap
                 coin = pos.get('coin')
-                current_px = await hyperliquid.get_current_price(coin) if coin else None
+                current_px = inputs["position_prices"].get(coin) if coin else None
                 positions.append({
                     "symbol": coin,
                     "quantity": round_or_none(pos.get('szi'), 6),
@@ -203,17 +841,13 @@ def main():
 
             recent_diary = []
             try:
-                with open(diary_path, "r") as f:
-                    lines = f.readlines()
-                    for line in lines[-10:]:
-                        entry = json.loads(line)
-                        recent_diary.append(entry)
+                # Rationale text and deadline bookkeeping are for the dashboard only
+                recent_diary = await diary.tail(10, exclude_actions=("reasoning", "deadline_miss"))
             except Exception:
                 pass
 
             open_orders_struct = []
             try:
-                open_orders = await hyperliquid.get_open_orders()
                 for o in open_orders[:50]:
                     open_orders_struct.append({
                         "coin": o.get('coin'),
@@ -225,7 +859,7 @@ def main():
                         "order_type": o.get('orderType')
                     })
             except Exception:
-                open_orders = []
+                pass
 
             # Reconcile active trades (but skip assets we just traded)
             try:
@@ -239,26 +873,27 @@ def main():
                 assets_with_orders = {o.get('coin') for o in (open_orders or []) if o.get('coin')}
                 for tr in active_trades[:]:
                     asset = tr.get('asset')
-                    # Skip reconciliation for assets we just traded this iteration
-                    if asset in just_traded_assets:
+                    # Skip reconciliation for assets we just traded or are still trading
+                    if asset in just_traded_assets or asset in lagging_assets:
                         continue
                     if asset not in assets_with_positions and asset not in assets_with_orders:
                         add_event(f"Reconciling stale active trade for {asset} (no position, no orders)")
                         active_trades.remove(tr)
-                        with open(diary_path, "a") as f:
-                            f.write(json.dumps({
-                                "timestamp": datetime.now(timezone.utc).isoformat(),
-                                "asset": asset,
-                                "action": "reconcile_close",
-                                "reason": "no_position_no_orders",
-                                "opened_at": tr.get('opened_at')
-                            }) + "\n")
+                        entry = {
+                            "timestamp": datetime.now(timezone.utc).isoformat(),
+                            "asset": asset,
+                            "action": "reconcile_close",
+                            "reason": "no_position_no_orders",
+                            "opened_at": tr.get('opened_at')
+                        }
+                        diary.append(entry)
+                        events.publish("reconcile", entry)
             except Exception:
                 pass
 
             recent_fills_struct = []
             try:
-                fills = await hyperliquid.get_recent_fills(limit=50)
+                fills = inputs["fills"]
                 for f_entry in fills[-20:]:
                     try:
                         t_raw = f_entry.get('time') or f_entry.get('timestamp')
@@ -288,7 +923,10 @@ def main():
                 "total_return_pct": round(total_return_pct, 2),
                 "balance": round_or_none(state['balance'], 2),
                 "account_value": round_or_none(account_value, 2),
-                "sharpe_ratio": round_or_none(sharpe, 3),
+                "sharpe_ratio": track_record["sharpe_ratio"],
+                "track_record": {key: track_record[key] for key in (
+                    "realized_pnl", "round_trips", "win_rate", "avg_trade_pnl", "profit_factor",
+                    "sortino_ratio", "max_drawdown")},
                 "positions": positions,
                 "active_trades": [
                     {
@@ -308,67 +946,6 @@ def main():
                 "recent_fills": recent_fills_struct,
             }
 
-            # Gather data for ALL assets first
-            market_sections = []
-            asset_prices = {}
-            for asset in args.assets:
-                try:
-                    current_price = await hyperliquid.get_current_price(asset)
-                    asset_prices[asset] = current_price
-                    if asset not in price_history:
-                        price_history[asset] = deque(maxlen=60)
-                    price_history[asset].append({"t": datetime.now(timezone.utc).isoformat(), "mid": round_or_none(current_price, 2)})
-                    oi = await hyperliquid.get_open_interest(asset)
-                    funding = await hyperliquid.get_funding_rate(asset)
-
-                    intraday_tf = "5m"
-                    ema_series = taapi.fetch_series("ema", f"{asset}/USDT", intraday_tf, results=10, params={"period": 20}, value_key="value")
-                    macd_series = taapi.fetch_series("macd", f"{asset}/USDT", intraday_tf, results=10, value_key="valueMACD")
-                    rsi7_series = taapi.fetch_series("rsi", f"{asset}/USDT", intraday_tf, results=10, params={"period": 7}, value_key="value")
-                    rsi14_series = taapi.fetch_series("rsi", f"{asset}/USDT", intraday_tf, results=10, params={"period": 14}, value_key="value")
-
-                    lt_ema20 = taapi.fetch_value("ema", f"{asset}/USDT", "4h", params={"period": 20}, key="value")
-                    lt_ema50 = taapi.fetch_value("ema", f"{asset}/USDT", "4h", params={"period": 50}, key="value")
-                    lt_atr3 = taapi.fetch_value("atr", f"{asset}/USDT", "4h", params={"period": 3}, key="value")
-                    lt_atr14 = taapi.fetch_value("atr", f"{asset}/USDT", "4h", params={"period": 14}, key="value")
-                    lt_macd_series = taapi.fetch_series("macd", f"{asset}/USDT", "4h", results=10, value_key="valueMACD")
-                    lt_rsi_series = taapi.fetch_series("rsi", f"{asset}/USDT", "4h", results=10, params={"period": 14}, value_key="value")
-
-                    recent_mids = [entry["mid"] for entry in list(price_history.get(asset, []))[-10:]]
-                    funding_annualized = round(funding * 24 * 365 * 100, 2) if funding else None
-
-                    market_sections.append({
-                        "asset": asset,
-                        "current_price": round_or_none(current_price, 2),
-                        "intraday": {
-                            "ema20": round_or_none(ema_series[-1], 2) if ema_series else None,
-                            "macd": round_or_none(macd_series[-1], 2) if macd_series else None,
-                            "rsi7": round_or_none(rsi7_series[-1], 2) if rsi7_series else None,
-                            "rsi14": round_or_none(rsi14_series[-1], 2) if rsi14_series else None,
-                            "series": {
-                                "ema20": round_series(ema_series, 2),
-                                "macd": round_series(macd_series, 2),
-                                "rsi7": round_series(rsi7_series, 2),
-                                "rsi14": round_series(rsi14_series, 2)
-                            }
-                        },
-                        "long_term": {
-                            "ema20": round_or_none(lt_ema20, 2),
-                            "ema50": round_or_none(lt_ema50, 2),
-                            "atr3": round_or_none(lt_atr3, 2),
-                            "atr14": round_or_none(lt_atr14, 2),
-                            "macd_series": round_series(lt_macd_series, 2),
-                            "rsi_series": round_series(lt_rsi_series, 2)
-                        },
-                        "open_interest": round_or_none(oi, 2),
-                        "funding_rate": round_or_none(funding, 8),
-                        "funding_annualized_pct": funding_annualized,
-                        "recent_mid_prices": recent_mids
-                    })
-                except Exception as e:
-                    add_event(f"Data gather error {asset}: {e}")
-                    continue
-
             # Single LLM call with all assets
             context_payload = OrderedDict([
                 ("invocation", {
@@ -385,217 +962,148 @@ def main():
             ])
             context = json.dumps(context_payload, default=json_default)
             add_event(f"Combined prompt length: {len(context)} chars for {len(args.assets)} assets")
-            with open("prompts.log", "a") as f:
-                f.write(f"\n\n--- {datetime.now()} - ALL ASSETS ---\n{json.dumps(context_payload, indent=2, default=json_default)}\n")
-
-            def _is_failed_outputs(outs):
-                """Return True when outputs are missing or clearly invalid."""
-                if not isinstance(outs, dict):
-                    return True
-                decisions = outs.get("trade_decisions")
-                if not isinstance(decisions, list) or not decisions:
-                    return True
-                try:
-                    return all(
-                        isinstance(o, dict)
-                        and (o.get('action') == 'hold')
-                        and ('parse error' in (o.get('rationale', '').lower()))
-                        for o in decisions
-                    )
-                except Exception:
-                    return True
+            prompt_log.write(f"\n\n--- {datetime.now()} - ALL ASSETS ---\n{context}\n")
+
+            phase_times["gather"] = time.monotonic() - cycle_started
+            stage_stats["gather"].in_flight = 0
+            stage_stats["gather"].record(phase_times["gather"])
+            stage_stats["decide"].in_flight = 1
+            if deadline is not None and time.monotonic() >= deadline:
+                missed_phase = "gather"
+            decide_started = time.monotonic()
+
+            # Assets whose decision already executed mid-stream; the final pass skips them
+            executed_assets = set()
+            # True when the change gate reused the previous decision instead of calling the LLM
+            gated = False
 
             # In debug mode, skip LLM and generate random trades for speed
             if args.risk_profile == "debug":
                 add_event("DEBUG MODE: Generating random trades (skipping LLM)")
                 outputs = generate_debug_trades(args.assets, asset_prices, state['positions'])
             else:
-                try:
-                    outputs = agent.decide_trade(args.assets, context)
-                    if not isinstance(outputs, dict):
-                        add_event(f"Invalid output format (expected dict): {outputs}")
-                        outputs = {}
-                except Exception as e:
-                    import traceback
-                    add_event(f"Agent error: {e}")
-                    add_event(f"Traceback: {traceback.format_exc()}")
-                    outputs = {}
-
-                # Retry once on failure/parse error with a stricter instruction prefix
-                if _is_failed_outputs(outputs):
-                    add_event("Retrying LLM once due to invalid/parse-error output")
-                    context_retry_payload = OrderedDict([
-                        ("retry_instruction", "Return ONLY the JSON array per schema with no prose."),
-                        ("original_context", context_payload)
-                    ])
-                    context_retry = json.dumps(context_retry_payload, default=json_default)
+                gate_fingerprints = None
+                should_call = True
+                if change_gate is not None and missed_phase is None:
+                    positions_by_coin = {p.get('coin'): p for p in state['positions']}
+                    gate_fingerprints = {
+                        section["asset"]: change_gate.fingerprint(
+                            section,
+                            positions_by_coin.get(section["asset"]),
+                            [o.get('triggerPx') for o in (open_orders or []) if o.get('coin') == section["asset"]],
+                        )
+                        for section in market_sections
+                    }
+                    should_call, changed_assets = change_gate.evaluate(gate_fingerprints)
+                    if changed_assets:
+                        add_event(f"Change gate: material change in {', '.join(changed_assets)}")
+                if missed_phase is not None:
+                    outputs = await deadline_fallback(missed_phase, state, asset_prices)
+                elif not should_call:
+                    gated = True
+                    add_event(f"Change gate: no material change (skip {change_gate.skips}/{change_gate.max_skips}); reusing previous decision as hold")
+                    outputs = change_gate.held_outputs(args.assets)
+                else:
+                    # Unusable output is corrected inside the agent by continuing the same
+                    # conversation; only a failed request (no conversation to continue) is re-sent here
+                    request_failed = False
                     try:
-                        outputs = agent.decide_trade(args.assets, context_retry)
+                        outputs = await request_decisions(context, state, asset_prices, executed_assets, deadline)
                         if not isinstance(outputs, dict):
-                            add_event(f"Retry invalid format: {outputs}")
+                            add_event(f"Invalid output format (expected dict): {outputs}")
                             outputs = {}
+                    except DeadlineExceeded as e:
+                        add_event(f"LLM decision abandoned: {e}")
+                        missed_phase = "decide"
                     except Exception as e:
                         import traceback
-                        add_event(f"Retry agent error: {e}")
-                        add_event(f"Retry traceback: {traceback.format_exc()}")
+                        add_event(f"Agent error: {e}")
+                        add_event(f"Traceback: {traceback.format_exc()}")
                         outputs = {}
+                        request_failed = True
+
+                    if request_failed and (deadline is None or time.monotonic() < deadline):
+                        add_event("Retrying LLM request once after agent error")
+                        try:
+                            outputs = await request_decisions(context, state, asset_prices, executed_assets, deadline)
+                            if not isinstance(outputs, dict):
+                                add_event(f"Retry invalid format: {outputs}")
+                                outputs = {}
+                        except DeadlineExceeded as e:
+                            add_event(f"LLM retry abandoned: {e}")
+                            missed_phase = "decide"
+                        except Exception as e:
+                            import traceback
+                            add_event(f"Retry agent error: {e}")
+                            add_event(f"Retry traceback: {traceback.format_exc()}")
+                            outputs = {}
+
+                    # Decisions that arrive after the deadline are stale; fall back instead
+                    if missed_phase is None and deadline is not None and time.monotonic() >= deadline:
+                        missed_phase = "decide"
+                    if missed_phase is not None:
+                        outputs = await deadline_fallback(missed_phase, state, asset_prices)
+                    elif gate_fingerprints is not None and not agent.is_failed_output(outputs):
+                        change_gate.commit(gate_fingerprints, outputs)
 
             summary_text = outputs.get("summary", "") if isinstance(outputs, dict) else ""
             if summary_text:
                 add_event(f"LLM reasoning summary: {summary_text}")
 
-            # Execute trades for each asset
+            phase_times["decide"] = time.monotonic() - decide_started
+            stage_stats["decide"].in_flight = 0
+            stage_stats["decide"].record(phase_times["decide"])
+
+            # Queue trades for each asset (skipping any already queued while streaming); the
+            # lanes run them while the loop moves on, so "execute" here is only the enqueue
+            # time, which grows when a lane is backed up. Orders are never cut off mid-flight,
+            # so an overrun here is only recorded.
+            execute_started = time.monotonic()
             for output in outputs.get("trade_decisions", []) if isinstance(outputs, dict) else []:
-                try:
-                    asset = output.get("asset")
-                    if not asset or asset not in args.assets:
-                        continue
-                    action = output.get("action")
-                    current_price = asset_prices.get(asset, 0)
-                    action = output["action"]
-                    rationale = output.get("rationale", "")
-                    if rationale:
-                        add_event(f"Decision rationale for {asset}: {rationale}")
-                    if action in ("buy", "sell"):
-                        is_buy = action == "buy"
-                        alloc_usd = float(output.get("allocation_usd", 0.0))
-                        if alloc_usd <= 0:
-                            add_event(f"Holding {asset}: zero/negative allocation")
-                            continue
-                        # Ensure minimum order value of $12 to avoid exchange rejection ($10 minimum)
-                        if alloc_usd < 12:
-                            alloc_usd = 12.0
-                            add_event(f"Bumped allocation to ${alloc_usd} to meet exchange minimum")
-
-                        # Check if we have an existing position
-                        existing_position = None
-                        for pos in state['positions']:
-                            if pos.get('coin') == asset:
-                                existing_position = pos
-                                break
-
-                        # Determine amount and action type
-                        if existing_position:
-                            existing_size = float(existing_position.get('szi', 0))
-                            existing_is_long = existing_size > 0
-                            abs_size = abs(existing_size)
-
-                            if (is_buy and existing_is_long) or (not is_buy and not existing_is_long):
-                                # Same direction - adding to position
-                                amount = alloc_usd / current_price
-                                add_event(f"Adding to existing {asset} {'LONG' if is_buy else 'SHORT'} position")
-                            else:
-                                # Opposite direction - closing position (possibly flipping)
-                                amount = abs_size  # Use exact position size to close
-                                add_event(f"Closing existing {asset} {'LONG' if existing_is_long else 'SHORT'} position (size: {amount})")
-                        else:
-                            # No existing position - opening new
-                            amount = alloc_usd / current_price
-                            add_event(f"Opening new {asset} {'LONG' if is_buy else 'SHORT'} position")
-
-                        # Mark asset as traded
-                        just_traded_assets.add(asset)
-
-                        order = await hyperliquid.place_buy_order(asset, amount) if is_buy else await hyperliquid.place_sell_order(asset, amount)
-                        # Confirm by checking recent fills for this asset shortly after placing
-                        await asyncio.sleep(1)
-                        fills_check = await hyperliquid.get_recent_fills(limit=10)
-                        filled = False
-                        for fc in reversed(fills_check):
-                            try:
-                                if (fc.get('coin') == asset or fc.get('asset') == asset):
-                                    filled = True
-                                    break
-                            except Exception:
-                                continue
-                        trade_log.append({"type": action, "price": current_price, "amount": amount, "exit_plan": output["exit_plan"], "filled": filled})
-                        tp_oid = None
-                        sl_oid = None
-                        if output["tp_price"]:
-                            tp_order = await hyperliquid.place_take_profit(asset, is_buy, amount, output["tp_price"])
-                            tp_oids = hyperliquid.extract_oids(tp_order)
-                            tp_oid = tp_oids[0] if tp_oids else None
-                            add_event(f"TP placed {asset} at {output['tp_price']}")
-                        if output["sl_price"]:
-                            sl_order = await hyperliquid.place_stop_loss(asset, is_buy, amount, output["sl_price"])
-                            sl_oids = hyperliquid.extract_oids(sl_order)
-                            sl_oid = sl_oids[0] if sl_oids else None
-                            add_event(f"SL placed {asset} at {output['sl_price']}")
-                        # Update active_trades tracking
-                        # Remove old tracking for this asset
-                        for existing in active_trades[:]:
-                            if existing.get('asset') == asset:
-                                try:
-                                    active_trades.remove(existing)
-                                except ValueError:
-                                    pass
-
-                        # Only add to active_trades if we're opening/adding to a position
-                        # If we closed a position (existing_position and opposite direction), don't track it
-                        should_track = True
-                        if existing_position:
-                            existing_size = float(existing_position.get('szi', 0))
-                            existing_is_long = existing_size > 0
-                            if (is_buy and not existing_is_long) or (not is_buy and existing_is_long):
-                                # We closed the position
-                                should_track = False
-                                add_event(f"Position closed for {asset}")
-
-                        if should_track:
-                            active_trades.append({
-                                "asset": asset,
-                                "is_long": is_buy,
-                                "amount": amount,
-                                "entry_price": current_price,
-                                "tp_oid": tp_oid,
-                                "sl_oid": sl_oid,
-                                "exit_plan": output["exit_plan"],
-                                "opened_at": datetime.now().isoformat()
-                            })
-
-                        add_event(f"{action.upper()} {asset} amount {amount:.4f} at ~{current_price}")
-                        if rationale:
-                            add_event(f"Post-trade rationale for {asset}: {rationale}")
-                        # Write to diary after confirming fills status
-                        with open(diary_path, "a") as f:
-                            diary_entry = {
-                                "timestamp": datetime.now(timezone.utc).isoformat(),
-                                "asset": asset,
-                                "action": action,
-                                "allocation_usd": alloc_usd,
-                                "amount": amount,
-                                "entry_price": current_price,
-                                "tp_price": output.get("tp_price"),
-                                "tp_oid": tp_oid,
-                                "sl_price": output.get("sl_price"),
-                                "sl_oid": sl_oid,
-                                "exit_plan": output.get("exit_plan", ""),
-                                "rationale": output.get("rationale", ""),
-                                "order_result": str(order),
-                                "opened_at": datetime.now(timezone.utc).isoformat(),
-                                "filled": filled
-                            }
-                            f.write(json.dumps(diary_entry) + "\n")
-                    else:
-                        add_event(f"Hold {asset}: {output.get('rationale', '')}")
-                        # Write hold to diary
-                        with open(diary_path, "a") as f:
-                            diary_entry = {
-                                "timestamp": datetime.now().isoformat(),
-                                "asset": asset,
-                                "action": "hold",
-                                "rationale": output.get("rationale", "")
-                            }
-                            f.write(json.dumps(diary_entry) + "\n")
-                except Exception as e:
-                    import traceback
-                    add_event(f"Execution error {asset}: {e}")
+                if output.get("asset") in executed_assets:
+                    continue
+                await submit_decision(output, state, asset_prices)
+            # Captures and replays record exchange calls per cycle, so keep cycles from overlapping
+            if capture_writer is not None or replay_player is not None:
+                await execution_lanes.drain()
+            if capture_writer is not None:
+                capture_writer.flush()
+            phase_times["execute"] = time.monotonic() - execute_started
+            lanes = execution_lanes.snapshot()
+            backlog = {asset: depth for asset, depth in lanes["queue_depth"].items() if depth}
+            logging.info(
+                "Stages: gather %.2fs, decide %.2fs, execute enqueue %.2fs; executing %s, queued %s",
+                phase_times["gather"], phase_times["decide"], phase_times["execute"],
+                ", ".join(lanes["executing"]) or "none", backlog or "none",
+            )
+
+            if missed_phase is None and deadline is not None and time.monotonic() > deadline:
+                missed_phase = "execute"
+            if missed_phase is not None:
+                record_deadline_miss(missed_phase, phase_times, time.monotonic() - cycle_started)
+            events.publish("cycle", {
+                "cycle": invocation_count,
+                "elapsed_seconds": round(time.monotonic() - cycle_started, 3),
+                "phases": {name: round(seconds, 3) for name, seconds in phase_times.items()},
+                "missed_phase": missed_phase,
+                "gated": gated,
+                "executing": lanes["executing"],
+                "queued": backlog,
+            })
+
+            # Latency mode skips reasoning on the decision call; fill it in off the critical path
+            # (debug mode's random trades never went through the LLM, so there is nothing to explain)
+            if (agent.decision_mode == "latency" and args.risk_profile != "debug" and not gated
+                    and missed_phase is None and isinstance(outputs, dict) and outputs.get("trade_decisions")):
+                task = asyncio.create_task(write_rationale(context, outputs))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
 
             # In debug mode, also run rapid mini-trades within the interval
             if args.risk_profile == "debug":
                 add_event("DEBUG: Waiting 30s with mini-trade bursts every 10s")
                 for burst in range(3):  # 3 bursts within the 30s interval
-                    await asyncio.sleep(10)
+                    await pause(10)
                     # Quick state refresh
                     try:
                         burst_state = await hyperliquid.get_user_state()
@@ -644,68 +1152,146 @@ def main():
                                     add_event(f"DEBUG BURST: {action.upper()} {asset} @ {current_price}")
 
                                     # Log to diary
-                                    with open(diary_path, "a") as f:
-                                        diary_entry = {
-                                            "timestamp": datetime.now(timezone.utc).isoformat(),
-                                            "asset": asset,
-                                            "action": action,
-                                            "allocation_usd": alloc_usd,
-                                            "amount": amount,
-                                            "entry_price": current_price,
-                                            "rationale": "Debug burst trade",
-                                            "order_result": str(order),
-                                            "debug_burst": burst + 1
-                                        }
-                                        f.write(json.dumps(diary_entry) + "\n")
+                                    diary_entry = {
+                                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                                        "asset": asset,
+                                        "action": action,
+                                        "allocation_usd": alloc_usd,
+                                        "amount": amount,
+                                        "entry_price": current_price,
+                                        "rationale": "Debug burst trade",
+                                        "order_result": str(order),
+                                        "debug_burst": burst + 1
+                                    }
+                                    diary.append(diary_entry)
                             except Exception as e:
                                 add_event(f"DEBUG BURST error {asset}: {e}")
                     except Exception as e:
                         add_event(f"DEBUG BURST {burst+1} failed: {e}")
-            else:
-                await asyncio.sleep(get_interval_seconds(args.interval))
+            elif replay_player is None:
+                if cadence is not None:
+                    interval_seconds, reason = cadence.update(
+                        cadence_signals(price_history, market_sections, open_orders_struct)
+                    )
+                    if reason:
+                        add_event(f"Cadence {reason}")
+                        scheduler.set_interval(interval_seconds)
+                        if CONFIG.get("cycle_deadline_seconds") is None:
+                            cycle_budget = interval_seconds * 0.9
+                if prefetch_lead and capture_writer is None:
+                    prefetch_task = asyncio.create_task(prefetch_at(scheduler.next_boundary() - prefetch_lead))
+                tick = await scheduler.wait()
+                logging.info(
+                    "Cycle tick %s UTC (jitter %+.3fs%s)",
+                    time.strftime("%H:%M:%S", time.gmtime(tick.scheduled)), tick.jitter,
+                    f", {tick.skipped} missed tick(s) skipped" if tick.skipped else "",
+                )
 
     async def handle_diary(request):
-        """Return diary entries as JSON or newline-delimited text."""
+        """Return diary entries as JSON or newline-delimited text.
+
+        JSON pages are newest-last and can be filtered with ``asset`` and
+        ``action`` (comma-separated) and ``since``/``until`` (ISO time or
+        epoch seconds); pass ``next_cursor`` back as ``cursor`` for older entries.
+        """
         try:
             raw = request.query.get('raw')
             download = request.query.get('download')
+            await diary.flush()
             if raw or download:
-                if not os.path.exists(diary_path):
-                    return web.Response(text="", content_type="text/plain")
-                with open(diary_path, "r") as f:
-                    data = f.read()
-                headers = {}
-                if download:
-                    headers["Content-Disposition"] = f"attachment; filename=diary.jsonl"
-                return web.Response(text=data, content_type="text/plain", headers=headers)
-            limit = int(request.query.get('limit', '200'))
-            with open(diary_path, "r") as f:
-                lines = f.readlines()
-            start = max(0, len(lines) - limit)
-            entries = [json.loads(l) for l in lines[start:]]
-            return web.json_response({"entries": entries})
+                # JSON ``limit`` counts entries, so raw tails are taken with ``lines`` instead
+                return await serve_text_file(request, diary_path, default_limit=None, byte_limit=False)
+
+            etag = f'W/"diary-{len(diary)}"'
+            if not_modified(request, etag):
+                return web.Response(status=304, headers={"ETag": etag})
+
+            def split(name):
+                value = request.query.get(name)
+                return [v for v in value.split(",") if v] if value else None
+
+            def epoch(name):
+                value = request.query.get(name)
+                if not value:
+                    return None
+                try:
+                    return float(value)
+                except ValueError:
+                    return datetime.fromisoformat(value).timestamp()
+
+            cursor = request.query.get('cursor')
+            try:
+                since, until = epoch('since'), epoch('until')
+                limit = int(request.query.get('limit', '200'))
+                cursor = int(cursor) if cursor else None
+            except ValueError:
+                raise web.HTTPBadRequest(text="since/until must be epoch seconds or ISO times; limit and cursor integers")
+            entries, next_cursor = await diary.query(
+                asset=split('asset'),
+                action=split('action'),
+                since=since,
+                until=until,
+                limit=limit,
+                cursor=cursor,
+            )
+            response = web.json_response({"entries": entries, "next_cursor": next_cursor}, headers={"ETag": etag})
+            response.enable_compression()
+            return response
         except FileNotFoundError:
             return web.json_response({"entries": []})
+        except web.HTTPException:
+            raise
         except Exception as e:
             return web.json_response({"error": str(e)}, status=500)
 
+    async def handle_scheduler(request):
+        """Return cycle tick counts, skipped ticks and wake-up jitter."""
+        return web.json_response(scheduler.snapshot())
+
+    async def handle_pipeline(request):
+        """Return per-stage queue depth and time-in-stage statistics."""
+        return web.json_response(pipeline_snapshot())
+
+    async def handle_events(request):
+        """Stream live agent events as server-sent events.
+
+        Reconnecting clients send ``Last-Event-ID`` (or ``?last_event_id=``)
+        and receive the buffered events they missed first.
+        """
+        last_id = request.headers.get("Last-Event-ID") or request.query.get("last_event_id")
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        await response.prepare(request)
+        client = events.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+        try:
+            async for event in client.stream():
+                await response.write(KEEPALIVE if event is None else format_sse(event["id"], event["type"], event))
+        except ConnectionResetError:
+            pass
+        finally:
+            events.unsubscribe(client)
+        return response
+
+    async def handle_performance(request):
+        """Return realized PnL, Sharpe/Sortino, drawdown and win-rate statistics from fills."""
+        return web.json_response(performance.snapshot())
+
+    async def handle_llm_metrics(request):
+        """Return rolling LLM token, latency and cost aggregates."""
+        return web.json_response({
+            **agent.metrics.snapshot(),
+            "json_repair": agent.repair_stats.snapshot(),
+        })
+
     async def handle_logs(request):
-        """Stream log files with optional download or tailing behaviour."""
+        """Tail, page through or download a log file (see :func:`serve_text_file`)."""
         try:
-            path = request.query.get('path', 'llm_requests.log')
-            download = request.query.get('download')
-            limit_param = request.query.get('limit')
-            if not os.path.exists(path):
-                return web.Response(text="", content_type="text/plain")
-            with open(path, "r") as f:
-                data = f.read()
-            if download or (limit_param and (limit_param.lower() == 'all' or limit_param == '-1')):
-                headers = {}
-                if download:
-                    headers["Content-Disposition"] = f"attachment; filename={os.path.basename(path)}"
-                return web.Response(text=data, content_type="text/plain", headers=headers)
-            limit = int(limit_param) if limit_param else 2000
-            return web.Response(text=data[-limit:], content_type="text/plain")
+            return await serve_text_file(request, request.query.get('path', 'llm_requests.log'))
+        except web.HTTPException:
+            raise
         except Exception as e:
             return web.json_response({"error": str(e)}, status=500)
 
@@ -796,11 +1382,34 @@ def main():
         """Register HTTP endpoints for observing diary entries and logs."""
         app.router.add_get('/diary', handle_diary)
         app.router.add_get('/logs', handle_logs)
+        app.router.add_get('/llm-metrics', handle_llm_metrics)
+        app.router.add_get('/scheduler', handle_scheduler)
+        app.router.add_get('/pipeline', handle_pipeline)
+        app.router.add_get('/events', handle_events)
+        app.router.add_get('/performance', handle_performance)
         app.router.add_post('/close-all', handle_close_all)
         app.router.add_post('/close-position', handle_close_position)
 
+    async def run_replay():
+        """Drive ``run_loop`` through the capture and report per-cycle wall time."""
+        started = time.monotonic()
+        await run_loop()
+        await execution_lanes.drain()
+        if background_tasks:
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+        await diary.close()
+        finished = time.monotonic()
+        bounds = [t for _, t in replay_cycle_times] + [finished]
+        print(f"Replayed {len(replay_cycle_times)} cycle(s) in {finished - started:.3f}s "
+              f"({replay_player.served} captured responses served, {replay_player.misses} missing)")
+        for i, (captured_cycle, _) in enumerate(replay_cycle_times):
+            print(f"  cycle {captured_cycle}: {(bounds[i + 1] - bounds[i]) * 1000:.1f} ms")
+
     async def main_async():
         """Start the aiohttp server and kick off the trading loop."""
+        if replay_player is not None:
+            await run_replay()
+            return
         import socket
         import subprocess
 
@@ -840,7 +1449,16 @@ def main():
         site = web.SockSite(runner, sock)
         await site.start()
         logging.info(f"API server started on {host}:{port}")
-        await run_loop()
+        # SIGTERM (e.g. the server stopping this agent) unwinds like Ctrl-C, so shutdown cleanup runs
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+        try:
+            await run_loop()
+        finally:
+            # Entries buffered since the last flush may include the one for a just-executed trade
+            await diary.close()
 
     def calculate_total_return(state, trade_log):
         """Compute percent return relative to an assumed initial balance."""
@@ -848,18 +1466,6 @@ def main():
         current = state['balance'] + sum(p.get('pnl', 0) for p in state.get('positions', []))
         return ((current - initial) / initial) * 100 if initial else 0
 
-    def calculate_sharpe(returns):
-        """Compute a naive Sharpe-like ratio from the trade log."""
-        if not returns:
-            return 0
-        vals = [r.get('pnl', 0) if 'pnl' in r else 0 for r in returns]
-        if not vals:
-            return 0
-        mean = sum(vals) / len(vals)
-        var = sum((v - mean) ** 2 for v in vals) / len(vals)
-        std = math.sqrt(var) if var > 0 else 0
-        return mean / std if std > 0 else 0
-
     async def check_exit_condition(trade, taapi, hyperliquid):
         """Evaluate whether a given trade's exit plan triggers a close."""
         plan = (trade.get("exit_plan") or "").lower()
@@ -878,7 +1484,14 @@ def main():
             return False
         return False
 
-    asyncio.run(main_async())
+    try:
+        asyncio.run(main_async())
+    except asyncio.CancelledError:
+        logging.info("Agent stopped by SIGTERM")
+    finally:
+        if capture_writer is not None:
+            # Ends the gzip stream so the capture replays even after Ctrl-C
+            capture_writer.close()
 
 
 if __name__ == "__main__":
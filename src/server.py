@@ -5,14 +5,17 @@ import os
 import sys
 import pathlib
 import logging
+import time
 from datetime import datetime, timezone
 from typing import Dict, Optional, Any
 from contextlib import asynccontextmanager
 
 sys.path.append(str(pathlib.Path(__file__).parent.parent))
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import multiprocessing
@@ -30,6 +33,12 @@ LOG_DIR.mkdir(exist_ok=True)
 REGISTRY_FILE = LOG_DIR / "agent_registry.json"
 import json as _json
 
+from src.utils.events import EventFile, follow_event_file
+from src.utils.file_tail import file_etag, read_from, tail_lines
+
+# Largest body returned for one ``since=<offset>`` read of a log file
+LOG_CHUNK_BYTES = 1024 * 1024
+
 
 class AgentConfig(BaseModel):
     assets: list[str]
@@ -54,13 +63,12 @@ class AgentInstance:
         return self.process is not None and self.process.is_alive()
 
     def get_logs(self, limit: int = 500) -> list[str]:
-        """Read logs from file."""
+        """Read the last ``limit`` log lines, seeking from the end of the file."""
         if not self.log_file.exists():
             return []
         try:
-            with open(self.log_file, 'r') as f:
-                lines = f.readlines()
-                return [line.strip() for line in lines[-limit:] if line.strip()]
+            data, _ = tail_lines(str(self.log_file), limit)
+            return [line.strip() for line in data.decode("utf-8", "replace").splitlines() if line.strip()]
         except Exception:
             return []
 
@@ -129,6 +137,8 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
 
     # Diary file for trade history (same directory as log file)
     diary_file_path = log_file_path.replace('.log', '_diary.jsonl')
+    # Structured events streamed to dashboards by GET /events/{session_id}
+    event_file = EventFile(log_file_path.replace('.log', '_events.jsonl'))
 
     # Define log function FIRST so we can catch import errors
     def log(msg: str):
@@ -143,6 +153,7 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                 f.flush()
         except Exception as e:
             print(f"Log error: {e}")
+        event_file.emit("log", {"message": msg})
 
     def write_trade(trade_entry: dict):
         """Write trade entry to diary file for stats tracking."""
@@ -155,6 +166,7 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                 f.flush()
         except Exception as e:
             log(f"Failed to write trade: {e}")
+        event_file.emit("fill", trade_entry)
 
     log("Subprocess started, beginning imports...")
 
@@ -171,13 +183,17 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
         config_loader.CONFIG['hyperliquid_account_address'] = config.public_key
 
         log("Importing TradingAgent...")
-        from src.agent.decision_maker import TradingAgent
+        from src.agent.decision_maker import DeadlineExceeded, TradingAgent
+        from src.agent.thesis import ThesisCache
         log("Importing LocalIndicatorCalculator...")
         from src.indicators.local_indicators import LocalIndicatorCalculator
         log("Importing HyperliquidAPI...")
         from src.trading.hyperliquid_api import HyperliquidAPI
         from src.utils.formatting import format_number as fmt
         from src.utils.prompt_utils import json_default, round_or_none, round_series
+        from src.utils.async_utils import gather_bounded
+        from src.utils.scheduler import CycleScheduler
+        from concurrent.futures import ThreadPoolExecutor
         import json
         import math
         from collections import OrderedDict, deque
@@ -203,7 +219,10 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
         log("Initializing Hyperliquid API...")
         hyperliquid = HyperliquidAPI()
         log("Initializing trading agent...")
-        agent = TradingAgent(risk_profile=config.risk_profile)
+        agent = TradingAgent(
+            risk_profile=config.risk_profile,
+            metrics_path=log_file_path.replace('.log', '_llm_metrics.jsonl'),
+        )
     except Exception as e:
         log(f"FATAL: Failed to initialize: {e}")
         import traceback
@@ -223,12 +242,81 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
     log(f"HyperliquidAPI account: {hyperliquid.account_address}")
     log(f"Risk profile: {config.risk_profile}")
 
+    # Wall-clock budget per cycle (None disables the deadline)
+    cycle_budget = config_loader.CONFIG.get("cycle_deadline_seconds")
+    if cycle_budget is None:
+        cycle_budget = get_interval_seconds(config.interval) * 0.9
+    cycle_budget = cycle_budget or None
+
+    # Cycles fire on interval boundaries (candle closes) plus an offset, not interval after the last one ended
+    scheduler = CycleScheduler(get_interval_seconds(config.interval), config_loader.CONFIG.get("cycle_offset_seconds") or 0.0)
+
+    # Per-asset market theses computed once per interval and shared by every session
+    thesis_cache = ThesisCache(LOG_DIR / "theses") if config_loader.CONFIG.get("shared_thesis_enabled") else None
+
+    # Assets gathered at once; each asset's indicator fetches also run in parallel threads
+    gather_concurrency = config_loader.CONFIG.get("gather_concurrency") or 20
+
+    async def gather_asset(asset, asset_prices):
+        """Fetch price, OI, funding and indicators for ``asset`` and build its market section."""
+        current_price = await hyperliquid.get_current_price(asset)
+        asset_prices[asset] = current_price
+
+        if asset not in price_history:
+            price_history[asset] = deque(maxlen=60)
+        price_history[asset].append({"t": datetime.now(timezone.utc).isoformat(), "mid": round_or_none(current_price, 2)})
+
+        symbol = f"{asset}/USDT"
+        intraday_tf = "5m"
+        (
+            oi, funding,
+            ema_series, macd_series, rsi7_series, rsi14_series,
+            lt_ema20, lt_ema50, lt_atr14,
+        ) = await asyncio.gather(
+            hyperliquid.get_open_interest(asset),
+            hyperliquid.get_funding_rate(asset),
+            asyncio.to_thread(taapi.fetch_series, "ema", symbol, intraday_tf, results=10, params={"period": 20}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_series, "macd", symbol, intraday_tf, results=10, value_key="valueMACD"),
+            asyncio.to_thread(taapi.fetch_series, "rsi", symbol, intraday_tf, results=10, params={"period": 7}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_series, "rsi", symbol, intraday_tf, results=10, params={"period": 14}, value_key="value"),
+            asyncio.to_thread(taapi.fetch_value, "ema", symbol, "4h", params={"period": 20}, key="value"),
+            asyncio.to_thread(taapi.fetch_value, "ema", symbol, "4h", params={"period": 50}, key="value"),
+            asyncio.to_thread(taapi.fetch_value, "atr", symbol, "4h", params={"period": 14}, key="value"),
+        )
+
+        funding_annualized = round(funding * 24 * 365 * 100, 2) if funding else None
+
+        rsi_val = f"{rsi14_series[-1]:.1f}" if rsi14_series else "N/A"
+        log(f"{asset}: ${current_price:.2f} | RSI14: {rsi_val}")
+
+        return {
+            "asset": asset,
+            "current_price": round_or_none(current_price, 2),
+            "intraday": {
+                "ema20": round_or_none(ema_series[-1], 2) if ema_series else None,
+                "macd": round_or_none(macd_series[-1], 2) if macd_series else None,
+                "rsi7": round_or_none(rsi7_series[-1], 2) if rsi7_series else None,
+                "rsi14": round_or_none(rsi14_series[-1], 2) if rsi14_series else None,
+            },
+            "long_term": {
+                "ema20": round_or_none(lt_ema20, 2),
+                "ema50": round_or_none(lt_ema50, 2),
+                "atr14": round_or_none(lt_atr14, 2),
+            },
+            "funding_annualized_pct": funding_annualized,
+        }
+
     async def run_loop():
         nonlocal invocation_count, initial_account_value
+        # The default executor (min(32, cpus + 4) threads) would serialize the concurrent gather
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=gather_concurrency * 10 + 8))
 
         while True:
             try:
                 invocation_count += 1
+                cycle_started = time.monotonic()
+                deadline = cycle_started + cycle_budget if cycle_budget else None
+                deadline_missed = False
                 minutes_since_start = (datetime.now(timezone.utc) - start_time).total_seconds() / 60
 
                 # Get account state
@@ -263,57 +351,14 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                             "unrealized_pnl": round_or_none(pos.get('pnl'), 4),
                         })
 
-                # Gather market data for all assets
-                market_sections = []
+                # Gather market data for all assets, concurrently
                 asset_prices = {}
-
-                for asset in config.assets:
-                    try:
-                        current_price = await hyperliquid.get_current_price(asset)
-                        asset_prices[asset] = current_price
-
-                        if asset not in price_history:
-                            price_history[asset] = deque(maxlen=60)
-                        price_history[asset].append({"t": datetime.now(timezone.utc).isoformat(), "mid": round_or_none(current_price, 2)})
-
-                        oi = await hyperliquid.get_open_interest(asset)
-                        funding = await hyperliquid.get_funding_rate(asset)
-
-                        intraday_tf = "5m"
-                        ema_series = taapi.fetch_series("ema", f"{asset}/USDT", intraday_tf, results=10, params={"period": 20}, value_key="value")
-                        macd_series = taapi.fetch_series("macd", f"{asset}/USDT", intraday_tf, results=10, value_key="valueMACD")
-                        rsi7_series = taapi.fetch_series("rsi", f"{asset}/USDT", intraday_tf, results=10, params={"period": 7}, value_key="value")
-                        rsi14_series = taapi.fetch_series("rsi", f"{asset}/USDT", intraday_tf, results=10, params={"period": 14}, value_key="value")
-
-                        lt_ema20 = taapi.fetch_value("ema", f"{asset}/USDT", "4h", params={"period": 20}, key="value")
-                        lt_ema50 = taapi.fetch_value("ema", f"{asset}/USDT", "4h", params={"period": 50}, key="value")
-                        lt_atr14 = taapi.fetch_value("atr", f"{asset}/USDT", "4h", params={"period": 14}, key="value")
-
-                        funding_annualized = round(funding * 24 * 365 * 100, 2) if funding else None
-
-                        market_sections.append({
-                            "asset": asset,
-                            "current_price": round_or_none(current_price, 2),
-                            "intraday": {
-                                "ema20": round_or_none(ema_series[-1], 2) if ema_series else None,
-                                "macd": round_or_none(macd_series[-1], 2) if macd_series else None,
-                                "rsi7": round_or_none(rsi7_series[-1], 2) if rsi7_series else None,
-                                "rsi14": round_or_none(rsi14_series[-1], 2) if rsi14_series else None,
-                            },
-                            "long_term": {
-                                "ema20": round_or_none(lt_ema20, 2),
-                                "ema50": round_or_none(lt_ema50, 2),
-                                "atr14": round_or_none(lt_atr14, 2),
-                            },
-                            "funding_annualized_pct": funding_annualized,
-                        })
-
-                        rsi_val = f"{rsi14_series[-1]:.1f}" if rsi14_series else "N/A"
-                        log(f"{asset}: ${current_price:.2f} | RSI14: {rsi_val}")
-
-                    except Exception as e:
-                        log(f"Data gather error {asset}: {e}")
-                        continue
+                market_sections = await gather_bounded(
+                    config.assets,
+                    lambda asset: gather_asset(asset, asset_prices),
+                    gather_concurrency,
+                    on_error=lambda asset, e: log(f"Data gather error {asset}: {e}"),
+                )
 
                 # Build context for LLM
                 dashboard = {
@@ -338,11 +383,31 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                     })
                 ])
 
-                context = json.dumps(context_payload, default=json_default)
-                log(f"Calling LLM with {len(context)} chars context...")
-
+                # Stage a DeadlineExceeded is attributed to
+                phase = "gather"
                 try:
-                    outputs = agent.decide_trade(config.assets, context)
+                    gather_seconds = time.monotonic() - cycle_started
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise DeadlineExceeded(f"gather phase took {gather_seconds:.2f}s")
+                    phase = "decide"
+                    theses = None
+                    if thesis_cache is not None:
+                        theses = agent.market_theses(
+                            market_sections, thesis_cache, config.interval,
+                            get_interval_seconds(config.interval), deadline=deadline,
+                        )
+                        thesis_summary = ", ".join(f"{a} {e['thesis']['bias']} ({e['created_at']})" for a, e in theses.items())
+                        log(f"Shared market theses: {thesis_summary or 'none'}")
+                        if theses:
+                            # The sizing stage only needs prices; the analysis lives in the theses
+                            context_payload["market_data"] = [
+                                {"asset": m["asset"], "current_price": m["current_price"]} for m in market_sections
+                            ]
+                        else:
+                            theses = None
+                    context = json.dumps(context_payload, default=json_default)
+                    log(f"Calling LLM with {len(context)} chars context...")
+                    outputs = agent.decide_trade(config.assets, context, deadline=deadline, theses=theses)
                     if not isinstance(outputs, dict):
                         log(f"Invalid output format: {outputs}")
                         outputs = {}
@@ -351,6 +416,10 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                         summary = outputs.get("summary", "")
                         if summary:
                             log(f"LLM reasoning summary: {summary}")
+                except DeadlineExceeded as e:
+                    log(f"Cycle deadline missed in {phase} phase ({cycle_budget:.2f}s budget): {e}; holding")
+                    deadline_missed = True
+                    outputs = {}
                 except Exception as e:
                     log(f"Agent error: {e}")
                     outputs = {}
@@ -368,6 +437,8 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
 
                         # Log decision rationale for frontend display
                         log(f"Decision rationale for {asset}: {rationale}")
+                        event_file.emit("decision", {key: output.get(key) for key in (
+                            "asset", "action", "allocation_usd", "tp_price", "sl_price", "exit_plan", "rationale")})
 
                         if action in ("buy", "sell"):
                             is_buy = action == "buy"
@@ -390,6 +461,16 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                                 order = await hyperliquid.place_sell_order(asset, amount)
 
                             log(f"Order result for {asset}: {order}")
+                            event_file.emit("order", {
+                                "asset": asset,
+                                "action": action,
+                                "allocation_usd": alloc_usd,
+                                "amount": amount,
+                                "price": current_price,
+                                "tp_price": tp_price,
+                                "sl_price": sl_price,
+                                "order_result": str(order),
+                            })
 
                             # Check if order was filled
                             order_filled = False
@@ -442,13 +523,24 @@ def run_agent_process(config: AgentConfig, log_file_path: str):
                     except Exception as e:
                         log(f"Execution error {asset}: {e}")
 
+                if not deadline_missed and deadline is not None and time.monotonic() > deadline:
+                    deadline_missed = True
+                    log(f"Cycle deadline missed in execute phase: {time.monotonic() - cycle_started:.2f}s of {cycle_budget:.2f}s budget")
+                event_file.emit("cycle", {
+                    "cycle": invocation_count,
+                    "elapsed_seconds": round(time.monotonic() - cycle_started, 3),
+                    "gather_seconds": round(gather_seconds, 3),
+                    "deadline_missed": deadline_missed,
+                })
+
                 # Debug mode: run every 15 seconds for rapid trading
                 if config.risk_profile == "debug":
                     log("Debug mode: sleeping 15 seconds...")
                     await asyncio.sleep(15)
                 else:
-                    log(f"Sleeping for {config.interval}...")
-                    await asyncio.sleep(get_interval_seconds(config.interval))
+                    tick = await scheduler.wait()
+                    skipped = f", skipped {tick.skipped} missed tick(s)" if tick.skipped else ""
+                    log(f"Cycle tick {datetime.fromtimestamp(tick.scheduled, timezone.utc).strftime('%H:%M:%S')} UTC (jitter {tick.jitter:+.3f}s{skipped})")
 
             except Exception as e:
                 log(f"Loop error: {e}")
@@ -513,6 +605,7 @@ async def lifespan(app: FastAPI):
 app = FastAPI(title="Rez Trading Agent API", lifespan=lifespan)
 
 # CORS for frontend
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -648,39 +741,74 @@ async def get_agent_status(session_id: str):
 
 
 @app.get("/logs/{session_id}")
-async def get_logs(session_id: str, limit: int = 100):
-    """Get logs for an agent."""
+async def get_logs(session_id: str, request: Request, response: Response, limit: int = 100,
+                   since: Optional[int] = None):
+    """Get logs for an agent.
+
+    Returns the last ``limit`` lines, or with ``since=<byte offset>`` (the
+    ``next_offset`` of a previous call) only what was appended after it.
+    Unchanged files answer a matching ``If-None-Match`` with 304.
+    """
     log_file = LOG_DIR / f"{session_id}.log"
+    running = session_id in agent_registry and agent_registry[session_id].is_running()
+    etag = file_etag(str(log_file))
+    if etag is None:
+        return {"logs": [], "session_id": session_id, "running": running, "next_offset": 0}
+    etag = f"W/{etag}"
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
 
-    # Debug: check file status
-    file_exists = log_file.exists()
-    file_size = log_file.stat().st_size if file_exists else 0
-    logger.info(f"GET /logs/{session_id}: file_exists={file_exists}, file_size={file_size}")
-
-    if session_id not in agent_registry:
-        # Check if there's a log file even if no agent registered
-        if file_exists:
-            try:
-                with open(log_file, 'r') as f:
-                    lines = f.readlines()
-                    logs = [line.strip() for line in lines[-limit:] if line.strip()]
-                logger.info(f"GET /logs/{session_id}: returning {len(logs)} logs (no agent)")
-                return {"logs": logs, "session_id": session_id, "running": False}
-            except Exception as e:
-                logger.error(f"GET /logs/{session_id}: error reading file: {e}")
-        return {"logs": [], "session_id": session_id, "running": False}
-
-    agent = agent_registry[session_id]
-    logs = agent.get_logs(limit)
-    logger.info(f"GET /logs/{session_id}: returning {len(logs)} logs (agent running={agent.is_running()})")
-
+    try:
+        if since is not None:
+            data, _, end = await asyncio.to_thread(read_from, str(log_file), since, LOG_CHUNK_BYTES, True)
+        else:
+            data, end = await asyncio.to_thread(tail_lines, str(log_file), limit)
+    except Exception as e:
+        logger.error(f"GET /logs/{session_id}: error reading file: {e}")
+        return {"logs": [], "session_id": session_id, "running": running, "next_offset": 0}
+    logs = [line.strip() for line in data.decode("utf-8", "replace").splitlines() if line.strip()]
+    response.headers["ETag"] = etag
     return {
         "logs": logs,
         "session_id": session_id,
-        "running": agent.is_running(),
+        "running": running,
+        "next_offset": end,
     }
 
 
+@app.get("/events/{session_id}")
+async def stream_events(session_id: str, request: Request, last_event_id: Optional[int] = None):
+    """Stream an agent's decisions, orders, fills, cycle timings and log lines as server-sent events.
+
+    Event ids are byte offsets into the session's event file, so a client
+    reconnecting with ``Last-Event-ID`` resumes exactly where it stopped.
+    Without one the stream starts with the next event.
+    """
+    events_file = LOG_DIR / f"{session_id}_events.jsonl"
+    if session_id not in agent_registry and not events_file.exists():
+        raise HTTPException(status_code=404, detail="Agent not found")
+    header = request.headers.get("last-event-id")
+    offset = int(header) if header and header.isdigit() else last_event_id
+    return StreamingResponse(
+        follow_event_file(str(events_file), offset, request.is_disconnected),
+        media_type="text/event-stream",
+        # "identity" keeps GZipMiddleware from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"},
+    )
+
+
+@app.get("/llm-metrics/{session_id}")
+async def get_llm_metrics(session_id: str):
+    """Get rolling LLM token, latency and cost aggregates for an agent session."""
+    from src.agent.metrics import LLMMetrics
+
+    metrics_file = LOG_DIR / f"{session_id}_llm_metrics.jsonl"
+    if session_id not in agent_registry and not metrics_file.exists():
+        raise HTTPException(status_code=404, detail="Agent not found")
+    metrics = await asyncio.to_thread(LLMMetrics.load, str(metrics_file))
+    return {"session_id": session_id, **metrics.snapshot()}
+
+
 @app.post("/pause-agent")
 async def pause_agent(req: StopAgentRequest):
     """Pause an agent (not fully implemented - would need IPC)."""
@@ -0,0 +1,228 @@
+"""Track-record statistics maintained incrementally from exchange fills."""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from collections import deque
+
+
+class RunningStats:
+    """Welford mean/variance plus the downside second moment, updated in O(1)."""
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0, downside_sq: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.downside_sq = downside_sq
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        if value < 0:
+            self.downside_sq += value * value
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    @property
+    def downside_dev(self) -> float:
+        return math.sqrt(self.downside_sq / self.n) if self.n else 0.0
+
+    def to_dict(self) -> dict:
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "downside_sq": self.downside_sq}
+
+
+def _fill_fields(fill: dict) -> tuple[str, float, float, int, str] | None:
+    """Return ``(asset, signed size, price, time ms, id)`` for a Hyperliquid fill, or None."""
+    try:
+        asset = fill.get("coin") or fill.get("asset")
+        size = float(fill.get("sz") or fill.get("size") or 0)
+        price = float(fill.get("px") or fill.get("price") or 0)
+        t = int(fill.get("time") or fill.get("timestamp") or 0)
+    except (TypeError, ValueError):
+        return None
+    if not asset or size <= 0 or price <= 0:
+        return None
+    is_buy = fill.get("isBuy") if "isBuy" in fill else fill.get("side") == "B"
+    fill_id = str(fill.get("tid") or fill.get("hash") or f"{asset}:{t}:{fill.get('oid')}:{size}:{price}")
+    return asset, size if is_buy else -size, price, t, fill_id
+
+
+class PerformanceTracker:
+    """Match fills FIFO into round trips and keep realized PnL statistics current.
+
+    Every fill either extends the open lots for its asset or closes them
+    oldest-first; each closing fill becomes one round trip whose PnL and
+    return on the closed entry notional update the running statistics. Lots
+    carry their opening fee per unit, so a round trip's PnL is net of both the
+    opening and the closing fee for the quantity it closes, and realized PnL
+    is the sum of the round trips. Work per fill is constant apart from the lots it
+    consumes, and fills already seen (by time watermark and id) are skipped,
+    so the recent-fills window can be fed in every cycle.
+
+    When a fill's ``dir`` says it closes a position but there are not enough
+    open lots to match (the position predates the tracker), the excess is
+    counted in ``unmatched_fills`` instead of opening a phantom position in
+    the other direction.
+
+    Sharpe and Sortino are per round trip, not annualized.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.lots: dict[str, deque] = {}
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.pnl = RunningStats()
+        self.returns = RunningStats()
+        self.peak_equity = 0.0
+        self.max_drawdown = 0.0
+        self.unmatched_fills = 0
+        self.last_time = 0
+        self.last_ids: set[str] = set()
+        if path:
+            self._load()
+
+    def add_fills(self, fills: list[dict]) -> list[dict]:
+        """Apply fills not seen before; returns the round trips they closed."""
+        parsed = []
+        for fill in fills:
+            fields = _fill_fields(fill)
+            if fields:
+                parsed.append((*fields, fill))
+        applied = 0
+        closed = []
+        for asset, signed, price, t, fill_id, fill in sorted(parsed, key=lambda f: f[3]):
+            if t < self.last_time or (t == self.last_time and fill_id in self.last_ids):
+                continue
+            if t > self.last_time:
+                self.last_time, self.last_ids = t, set()
+            self.last_ids.add(fill_id)
+            applied += 1
+            trip = self._apply(asset, signed, price, fill)
+            if trip:
+                closed.append(trip)
+        if applied and self.path:
+            self._save()
+        return closed
+
+    def _apply(self, asset: str, signed: float, price: float, fill: dict) -> dict | None:
+        try:
+            fee = float(fill.get("fee") or 0.0)
+        except (TypeError, ValueError):
+            fee = 0.0
+        self.fees += fee
+        fee_per_unit = fee / abs(signed)
+        lots = self.lots.setdefault(asset, deque())
+        remaining = signed
+        pnl = 0.0
+        entry_notional = 0.0
+        # Close against opposite-direction lots, oldest first, charging both sides' fees pro rata
+        while lots and remaining and (lots[0][0] > 0) != (remaining > 0):
+            lot = lots[0]
+            qty = min(abs(lot[0]), abs(remaining))
+            direction = 1.0 if lot[0] > 0 else -1.0
+            pnl += qty * (price - lot[1]) * direction - qty * (lot[2] + fee_per_unit)
+            entry_notional += qty * lot[1]
+            lot[0] -= qty * direction
+            remaining += qty * direction
+            if abs(lot[0]) < 1e-12:
+                lots.popleft()
+        if abs(remaining) > 1e-12:
+            if str(fill.get("dir") or "").startswith("Close"):
+                # The rest closes a position opened before the tracker started
+                self.unmatched_fills += 1
+                self._book(-abs(remaining) * fee_per_unit)
+            else:
+                lots.append([remaining, price, fee_per_unit])
+        if not entry_notional:
+            return None
+        return self._close(asset, pnl, entry_notional)
+
+    def _book(self, amount: float):
+        self.realized_pnl += amount
+        self.peak_equity = max(self.peak_equity, self.realized_pnl)
+        self.max_drawdown = max(self.max_drawdown, self.peak_equity - self.realized_pnl)
+
+    def _close(self, asset: str, net: float, entry_notional: float) -> dict:
+        self._book(net)
+        self.pnl.add(net)
+        self.returns.add(net / entry_notional)
+        if net > 0:
+            self.wins += 1
+            self.gross_profit += net
+        elif net < 0:
+            self.losses += 1
+            self.gross_loss -= net
+        return {"asset": asset, "pnl": round(net, 6), "return_pct": round(net / entry_notional * 100, 4)}
+
+    def snapshot(self) -> dict:
+        trades = self.pnl.n
+        return {
+            "realized_pnl": round(self.realized_pnl, 4),
+            "fees": round(self.fees, 4),
+            "round_trips": trades,
+            "win_rate": round(self.wins / trades, 4) if trades else None,
+            "avg_trade_pnl": round(self.pnl.mean, 4) if trades else None,
+            "avg_win": round(self.gross_profit / self.wins, 4) if self.wins else None,
+            "avg_loss": round(-self.gross_loss / self.losses, 4) if self.losses else None,
+            "profit_factor": round(self.gross_profit / self.gross_loss, 3) if self.gross_loss else None,
+            "sharpe_ratio": round(self.returns.mean / self.returns.std, 3) if self.returns.std else None,
+            "sortino_ratio": round(self.returns.mean / self.returns.downside_dev, 3) if self.returns.downside_dev else None,
+            "max_drawdown": round(self.max_drawdown, 4),
+            "open_lots": {asset: round(sum(lot[0] for lot in lots), 6) for asset, lots in self.lots.items() if lots},
+            "unmatched_fills": self.unmatched_fills,
+        }
+
+    def _save(self):
+        state = {
+            "lots": {asset: [list(lot) for lot in lots] for asset, lots in self.lots.items() if lots},
+            "realized_pnl": self.realized_pnl,
+            "fees": self.fees,
+            "wins": self.wins,
+            "losses": self.losses,
+            "gross_profit": self.gross_profit,
+            "gross_loss": self.gross_loss,
+            "pnl": self.pnl.to_dict(),
+            "returns": self.returns.to_dict(),
+            "peak_equity": self.peak_equity,
+            "max_drawdown": self.max_drawdown,
+            "unmatched_fills": self.unmatched_fills,
+            "last_time": self.last_time,
+            "last_ids": sorted(self.last_ids),
+        }
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("Could not save performance state to %s: %s", self.path, e)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning("Ignoring unreadable performance state %s: %s", self.path, e)
+            return
+        # Lots saved before opening fees were tracked have no third field
+        self.lots = {asset: deque([[*lot, 0.0][:3] for lot in lots]) for asset, lots in state.get("lots", {}).items()}
+        for key in ("realized_pnl", "fees", "wins", "losses", "gross_profit", "gross_loss", "peak_equity",
+                    "max_drawdown", "unmatched_fills", "last_time"):
+            setattr(self, key, state.get(key, getattr(self, key)))
+        self.pnl = RunningStats(**state.get("pnl", {}))
+        self.returns = RunningStats(**state.get("returns", {}))
+        self.last_ids = set(state.get("last_ids", []))
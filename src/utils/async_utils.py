@@ -0,0 +1,43 @@
+"""Helpers for running per-asset work concurrently inside the trading loop."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def gather_bounded(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    limit: int,
+    on_error: Callable[[T, BaseException], None] | None = None,
+) -> list[R]:
+    """Run ``worker`` for every item with at most ``limit`` in flight.
+
+    A failing item does not cancel the others: its exception is passed to
+    ``on_error`` and it is left out of the result.
+
+    Returns:
+        Results of the successful items, in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    items = list(items)
+    outcomes = await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    results = []
+    for item, outcome in zip(items, outcomes):
+        if isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if on_error is not None:
+                on_error(item, outcome)
+            continue
+        results.append(outcome)
+    return results
@@ -0,0 +1,322 @@
+"""Record a trading loop's external I/O to a capture file and replay it offline."""
+
+from __future__ import annotations
+
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable
+
+import requests
+
+from src.utils.prompt_utils import json_default
+
+# Exchange calls made by the trading loop and the HTTP handlers
+HYPERLIQUID_METHODS = (
+    "get_user_state",
+    "get_current_price",
+    "get_open_interest",
+    "get_funding_rate",
+    "get_open_orders",
+    "get_recent_fills",
+    "get_meta_and_ctxs",
+    "place_buy_order",
+    "place_sell_order",
+    "market_close",
+    "place_take_profit",
+    "place_stop_loss",
+    "cancel_order",
+    "cancel_all_orders",
+)
+
+
+class CaptureMiss(LookupError):
+    """Raised during replay when a call has no recorded response left."""
+
+
+class CaptureExhausted(Exception):
+    """Raised by :meth:`CapturePlayer.start_cycle` once every captured cycle was replayed."""
+
+
+class ReplayedError(RuntimeError):
+    """Stand-in for a recorded exception whose class cannot be rebuilt during replay."""
+
+
+def _open(path: str, mode: str):
+    """Open ``path`` as text, transparently gzip-compressed for ``.gz`` paths."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _call_key(args: tuple, kwargs: dict) -> str:
+    return json.dumps([list(args), kwargs], sort_keys=True, separators=(",", ":"), default=json_default)
+
+
+def _llm_key(args: tuple, kwargs: dict) -> str:
+    """Key an LLM call by its stable parts: model, system prompt hash and the assets it covers.
+
+    The user message embeds timestamps and live prices, so it is not hashed;
+    only the assets it names (``instructions.assets`` or ``asset``) are used.
+    Concurrent shard or thesis calls therefore get their own queues.
+    """
+    payload = args[0] if args else kwargs.get("payload") or {}
+    messages = payload.get("messages") or []
+    system = next((m.get("content") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") for m in messages if m.get("role") == "user"), None)
+    try:
+        context = json.loads(user) if isinstance(user, str) else None
+    except json.JSONDecodeError:
+        context = None
+    assets = None
+    if isinstance(context, dict):
+        assets = (context.get("instructions") or {}).get("assets") or context.get("asset")
+    if isinstance(assets, list):
+        assets = sorted(str(a) for a in assets)
+    digest = hashlib.sha256(str(system).encode("utf-8")).hexdigest()[:16]
+    return json.dumps([payload.get("model"), digest, assets], separators=(",", ":"))
+
+
+class CaptureWriter:
+    """Append one compact JSON record per external call, grouped by cycle markers.
+
+    Records are buffered until :meth:`flush`, which the loop calls at the end
+    of every cycle; :meth:`close` ends a ``.gz`` stream properly. Safe to use
+    from worker threads (LLM calls run via ``asyncio.to_thread``).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cycle = 0
+        self._lock = threading.Lock()
+        self._file = _open(path, "a")
+
+    def _write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":"), default=json_default)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def start_cycle(self, cycle: int):
+        """Mark the start of loop iteration ``cycle`` and flush the previous one."""
+        self.cycle = cycle
+        self._write({"type": "cycle", "cycle": cycle, "started_at": datetime.now(timezone.utc).isoformat()})
+        self.flush()
+
+    def flush(self):
+        """Push buffered records to disk; a gzip stream is sync-flushed so it can be read up to here."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def record(self, source: str, method: str, key: str, result: Any = None, error: BaseException | None = None,
+               elapsed: float = 0.0):
+        """Store the outcome of one call."""
+        entry = {"type": "call", "cycle": self.cycle, "source": source, "method": method, "key": key,
+                 "elapsed": round(elapsed, 6)}
+        if error is not None:
+            entry["error"] = _error_record(error)
+        else:
+            entry["result"] = result
+        self._write(entry)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _error_record(error: BaseException) -> dict:
+    record = {"type": type(error).__name__, "module": type(error).__module__,
+              "qualname": type(error).__qualname__, "message": str(error)}
+    response = getattr(error, "response", None)
+    if isinstance(response, requests.Response):
+        record["response"] = {"status_code": response.status_code, "url": response.url, "text": response.text}
+    return record
+
+
+def _rebuild_error(record: dict) -> Exception:
+    """Recreate a recorded exception as its original class where possible.
+
+    Only classes from modules already imported are considered, so replay
+    takes the same ``except`` branches as the captured run without a capture
+    file being able to import code. HTTP errors get their response back.
+    """
+    message = record.get("message", "")
+    cls = sys.modules.get(record.get("module") or "")
+    for part in (record.get("qualname") or "").split("."):
+        cls = getattr(cls, part, None)
+    kwargs = {}
+    if record.get("response") and isinstance(cls, type) and issubclass(cls, requests.RequestException):
+        response = requests.Response()
+        response.status_code = record["response"].get("status_code")
+        response.url = record["response"].get("url")
+        response._content = (record["response"].get("text") or "").encode("utf-8")
+        response.encoding = "utf-8"
+        kwargs["response"] = response
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        try:
+            return cls(message, **kwargs)
+        except Exception:
+            pass
+    return ReplayedError(f"{record.get('type')}: {message}")
+
+
+class CapturePlayer:
+    """Serve recorded responses back in call order, without touching the network.
+
+    Responses are queued per ``(source, method, key)`` so calls that run
+    concurrently, or in a different order than when recorded, still receive
+    the response recorded for the same arguments. LLM calls are keyed by
+    model, system prompt and assets (see :func:`_llm_key`); repeated calls
+    with the same key, such as corrective retries, replay in recorded order.
+    """
+
+    def __init__(self, path: str, cycles: Iterable[int] | None = None):
+        """Load ``path``; ``cycles`` restricts replay to the given cycle numbers."""
+        selected = set(cycles) if cycles is not None else None
+        self.cycles: deque[int] = deque()
+        self._queues: dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+        self.misses = 0
+        self.served = 0
+        for entry in self._read(path):
+            if selected is not None and entry.get("cycle") not in selected:
+                continue
+            if entry.get("type") == "cycle":
+                self.cycles.append(entry["cycle"])
+            elif entry.get("type") == "call":
+                key = (entry["source"], entry["method"], entry["key"])
+                self._queues.setdefault(key, deque()).append(entry)
+
+    @staticmethod
+    def _read(path: str):
+        """Yield the capture's records, stopping cleanly at a tail cut off by a crash or kill."""
+        with _open(path, "r") as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        if line.endswith("\n"):
+                            raise
+                        logging.warning("Ignoring a truncated last record in %s", path)
+            except EOFError:
+                # A gzip stream that was never closed: everything flushed before the cut is readable
+                logging.warning("%s ends without a gzip end-of-stream marker; replaying what was flushed", path)
+
+    def start_cycle(self) -> int:
+        """Return the next captured cycle number, raising :class:`CaptureExhausted` at the end."""
+        if not self.cycles:
+            raise CaptureExhausted()
+        return self.cycles.popleft()
+
+    def take(self, source: str, method: str, key: str) -> Any:
+        """Return the next recorded result for the call, re-raising recorded failures."""
+        with self._lock:
+            queue = self._queues.get((source, method, key))
+            entry = queue.popleft() if queue else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.served += 1
+        if entry is None:
+            raise CaptureMiss(f"No captured response for {source}.{method}({key})")
+        if "error" in entry:
+            raise _rebuild_error(entry["error"])
+        return entry.get("result")
+
+
+def _wrap_recording(fn: Callable, source: str, method: str, writer: CaptureWriter, key_fn: Callable) -> Callable:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                writer.record(source, method, key_fn(args, kwargs), error=e, elapsed=time.monotonic() - started)
+                raise
+            writer.record(source, method, key_fn(args, kwargs), result=result, elapsed=time.monotonic() - started)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            writer.record(source, method, key_fn(args, kwargs), error=e, elapsed=time.monotonic() - started)
+            raise
+        writer.record(source, method, key_fn(args, kwargs), result=result, elapsed=time.monotonic() - started)
+        return result
+    return wrapper
+
+
+def _wrap_replay(fn: Callable, source: str, method: str, player: CapturePlayer, key_fn: Callable) -> Callable:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            return player.take(source, method, key_fn(args, kwargs))
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return player.take(source, method, key_fn(args, kwargs))
+    return wrapper
+
+
+def _replay_stream(player: CapturePlayer) -> Callable:
+    """Replay ``_post_stream``, feeding the recorded content to ``on_content`` in one delta."""
+    def wrapper(payload, on_content=None):
+        result = player.take("llm", "_post_stream", _llm_key((payload,), {}))
+        content = (((result or {}).get("choices") or [{}])[0].get("message") or {}).get("content")
+        if on_content and content:
+            on_content(content)
+        return result
+    return wrapper
+
+
+def instrument(hyperliquid, taapi, agent, writer: CaptureWriter | None = None, player: CapturePlayer | None = None):
+    """Route the loop's external calls through ``writer`` (capture) or ``player`` (replay).
+
+    Methods are replaced on the instances, so internal calls such as
+    ``TradingAgent._decide`` -> ``_post`` are covered too. Captured sources:
+    Hyperliquid responses, raw Binance kline rows, LLM completions and
+    ``fetch_indicator`` tool results.
+    """
+    targets = [(hyperliquid, "hyperliquid", name, _call_key) for name in HYPERLIQUID_METHODS]
+    targets.append((taapi, "klines", "_fetch_kline_rows", _call_key))
+    targets.append((agent.indicator_calc, "tool", "fetch_value", _call_key))
+    targets.append((agent, "llm", "_post", _llm_key))
+    targets.append((agent, "llm", "_post_stream", _llm_key))
+    for obj, source, name, key_fn in targets:
+        fn = getattr(obj, name, None)
+        if fn is None:
+            continue
+        if writer is not None:
+            setattr(obj, name, _wrap_recording(fn, source, name, writer, key_fn))
+        elif name == "_post_stream":
+            setattr(obj, name, _replay_stream(player))
+        else:
+            setattr(obj, name, _wrap_replay(fn, source, name, player, key_fn))
+    logging.info("Instrumented %d calls for %s", len(targets), "capture" if writer is not None else "replay")
+
+
+def parse_cycles(spec: str | None) -> list[int] | None:
+    """Parse ``"N"`` or ``"N-M"`` into a list of cycle numbers (``None`` selects all)."""
+    if not spec:
+        return None
+    start, _, end = spec.partition("-")
+    return list(range(int(start), int(end or start) + 1))
@@ -0,0 +1,252 @@
+"""Append-only JSONL trade diary with a sidecar offset index."""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Iterable
+
+# offset, length, timestamp, asset, action
+_RECORD = struct.Struct("<QId16s16s")
+_CHUNK_RECORDS = 4096
+
+
+def _key(value) -> bytes:
+    return str(value or "").encode("utf-8")[:16].ljust(16, b"\0")
+
+
+def _entry_time(entry: dict) -> float:
+    """Epoch seconds of an entry's ``timestamp``; naive timestamps are local time."""
+    try:
+        return datetime.fromisoformat(entry["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class _Times:
+    """Sequence view of the index timestamps so :mod:`bisect` can search the file."""
+
+    def __init__(self, store: "DiaryStore", count: int):
+        self.store = store
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, seq: int) -> float:
+        return self.store._records(seq, seq + 1)[0][2]
+
+
+class DiaryStore:
+    """The trade diary as an append-only JSONL file plus a fixed-width index.
+
+    ``append`` only buffers; one writer flushes the buffer in a worker thread
+    every ``flush_seconds``, writing the lines and then their index records
+    (byte offset, length, timestamp, asset, action) to ``<path>.idx``. Reads
+    locate entries through the index, so the cost of a tail or a filtered
+    page grows with the entries returned (and the entries skipped by the
+    filters), not with the size of the diary. Timestamps in the index are
+    kept non-decreasing, which lets time ranges be found by bisection.
+
+    An index that is missing, partial or longer than the diary (e.g. after
+    the diary was truncated) is brought up to date on open by scanning only
+    the unindexed part of the file.
+    """
+
+    def __init__(self, path: str, flush_seconds: float = 0.5):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.flush_seconds = flush_seconds
+        self._pending: list[bytes] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_handle = None
+        self._data = None
+        self._index = None
+        self._count = 0
+        self._end = 0
+        self._last_time = 0.0
+        self._sync_index()
+
+    def _sync_index(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        count = index_size // _RECORD.size
+        end = 0
+        if count:
+            offset, length, self._last_time, _, _ = self._records(count - 1, count)[0]
+            end = offset + length
+        if end > size:
+            count, end, self._last_time = 0, 0, 0.0
+        with open(self.index_path, "ab") as index:
+            index.truncate(count * _RECORD.size)
+        self._count, self._end = count, end
+        if end < size:
+            self._scan(end, size)
+
+    def _scan(self, start: int, size: int):
+        """Index the lines between ``start`` and ``size`` that an earlier run left unindexed."""
+        scanned = 0
+        with open(self.path, "rb") as data, open(self.index_path, "ab") as index:
+            data.seek(start)
+            offset = start
+            for line in data:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    entry = {}
+                index.write(self._pack(offset, len(line), entry))
+                offset += len(line)
+                scanned += 1
+        self._end = offset
+        self._count += scanned
+        if scanned:
+            logging.info("Indexed %d diary entries in %s", scanned, self.path)
+
+    def _pack(self, offset: int, length: int, entry: dict) -> bytes:
+        entry = entry if isinstance(entry, dict) else {}
+        self._last_time = max(self._last_time, _entry_time(entry))
+        return _RECORD.pack(offset, length, self._last_time, _key(entry.get("asset")), _key(entry.get("action")))
+
+    def _records(self, start: int, stop: int) -> list[tuple]:
+        with open(self.index_path, "rb") as index:
+            index.seek(start * _RECORD.size)
+            raw = index.read((stop - start) * _RECORD.size)
+        return list(_RECORD.iter_unpack(raw))
+
+    def append(self, entry: dict):
+        """Buffer ``entry``; it reaches disk on the next flush."""
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._pending_lock:
+            self._pending.append(line)
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._write()
+                return
+            self._flush_handle = loop.call_later(self.flush_seconds, lambda: asyncio.ensure_future(self.flush()))
+
+    def _write(self):
+        with self._pending_lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return
+        if self._data is None:
+            self._data = open(self.path, "ab")
+            self._index = open(self.index_path, "ab")
+        records = []
+        offset = self._end
+        for line in lines:
+            records.append(self._pack(offset, len(line), json.loads(line)))
+            offset += len(line)
+        self._data.write(b"".join(lines))
+        self._data.flush()
+        # Index after data, so a reader never sees a record whose line is not yet written
+        self._index.write(b"".join(records))
+        self._index.flush()
+        self._end = offset
+        self._count += len(lines)
+
+    async def flush(self):
+        """Write buffered entries and their index records."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            try:
+                await asyncio.to_thread(self._write)
+            except OSError as e:
+                logging.warning("Could not write diary %s: %s", self.path, e)
+
+    async def close(self):
+        await self.flush()
+        for handle in (self._data, self._index):
+            if handle is not None:
+                handle.close()
+        self._data = self._index = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _select(self, assets, actions, exclude_actions, since, until, limit, cursor):
+        count = self._count
+        times = _Times(self, count)
+        lo = bisect.bisect_left(times, since) if since is not None else 0
+        hi = bisect.bisect_right(times, until) if until is not None else count
+        if cursor is not None:
+            hi = min(hi, cursor)
+        assets = {_key(a) for a in assets} if assets else None
+        actions = {_key(a) for a in actions} if actions else None
+        excluded = {_key(a) for a in exclude_actions or ()}
+
+        picked = []
+        seq = hi
+        while seq > lo and len(picked) < limit:
+            start = max(lo, seq - _CHUNK_RECORDS)
+            for i, (offset, length, _, asset, action) in reversed(list(enumerate(self._records(start, seq), start))):
+                if assets is not None and asset not in assets:
+                    continue
+                if actions is not None and action not in actions:
+                    continue
+                if action in excluded:
+                    continue
+                picked.append((i, offset, length))
+                if len(picked) >= limit:
+                    break
+            seq = start
+
+        entries = []
+        with open(self.path, "rb") as data:
+            for i, offset, length in reversed(picked):
+                try:
+                    entry = json.loads(os.pread(data.fileno(), length, offset))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                entry["_seq"] = i
+                entries.append(entry)
+        more = len(picked) >= limit and picked[-1][0] > lo
+        return entries, (picked[-1][0] if more else None)
+
+    async def query(self, asset: str | Iterable[str] | None = None, action: str | Iterable[str] | None = None,
+                    since: float | None = None, until: float | None = None, limit: int = 100,
+                    cursor: int | None = None, exclude_actions: Iterable[str] = ()) -> tuple[list[dict], int | None]:
+        """Return the newest matching entries, oldest first, and a cursor for the page before them.
+
+        Args:
+            asset: Asset or assets to keep.
+            action: Action or actions to keep (``buy``, ``hold``, ``reconcile_close``, ...).
+            since: Earliest entry time (epoch seconds, inclusive).
+            until: Latest entry time (epoch seconds, inclusive).
+            limit: Maximum number of entries.
+            cursor: ``next_cursor`` from a previous page; only older entries are returned.
+            exclude_actions: Actions to leave out.
+
+        Returns:
+            ``(entries, next_cursor)``; each entry carries its sequence number
+            as ``_seq``. ``next_cursor`` is ``None`` when no older entries match.
+        """
+        await self.flush()
+        if isinstance(asset, str):
+            asset = [asset]
+        if isinstance(action, str):
+            action = [action]
+        if limit <= 0:
+            return [], cursor
+        return await asyncio.to_thread(self._select, asset, action, exclude_actions, since, until, limit, cursor)
+
+    async def tail(self, limit: int, exclude_actions: Iterable[str] = ()) -> list[dict]:
+        """Return the last ``limit`` entries (oldest first), reading only those lines."""
+        entries, _ = await self.query(limit=limit, exclude_actions=exclude_actions)
+        for entry in entries:
+            entry.pop("_seq", None)
+        return entries
@@ -0,0 +1,183 @@
+"""Live agent events (decisions, orders, fills, reconciles, cycle timing, log lines) for SSE clients."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable
+
+from src.utils.file_tail import read_from
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def format_sse(event_id, event_type: str, payload: dict) -> bytes:
+    """Encode one server-sent event frame."""
+    data = json.dumps(payload, separators=(",", ":"), default=str)
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n".encode("utf-8")
+
+
+def _event(event_type: str, data: dict) -> dict:
+    return {"type": event_type, "time": datetime.now(timezone.utc).isoformat(), "data": data}
+
+
+class _Client:
+    def __init__(self, replay: list[dict], maxsize: int):
+        self.replay = replay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.last_id = 0
+
+    async def stream(self, keepalive: float = 15.0) -> AsyncIterator[dict | None]:
+        """Yield replayed then live events; ``None`` means "send a keepalive"."""
+        for event in self.replay:
+            self.last_id = event["id"]
+            yield event
+        self.replay = []
+        while True:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            # An event published off the loop can reach both the replay and the queue
+            if event["id"] <= self.last_id:
+                continue
+            self.last_id = event["id"]
+            yield event
+
+
+class EventBus:
+    """In-process fan-out of events to streaming clients, with a replay buffer.
+
+    Every event gets an increasing integer id, starting from the process start
+    time in microseconds so ids from an earlier run are always lower than this
+    run's. A client that reconnects with ``Last-Event-ID`` first receives the
+    buffered events after that id, or a ``reset`` event (meaning it should
+    refetch full state) when they have been evicted or the id comes from
+    another run. Each client has a bounded queue; a client that falls
+    behind by more than ``client_queue`` events is disconnected instead of
+    slowing the publisher, and resumes from the buffer when it reconnects.
+    """
+
+    def __init__(self, history: int = 1000, client_queue: int = 256):
+        self.history: deque = deque(maxlen=history)
+        self.client_queue = client_queue
+        self.dropped_clients = 0
+        self._next_id = time.time_ns() // 1000
+        self._clients: set[_Client] = set()
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def publish(self, event_type: str, data: dict) -> dict:
+        """Record an event and deliver it to connected clients; safe from any thread."""
+        event = _event(event_type, data)
+        with self._lock:
+            event["id"] = self._next_id
+            self._next_id += 1
+            self.history.append(event)
+        loop = self._loop
+        if loop is None or not self._clients:
+            return event
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+        return event
+
+    def _deliver(self, event: dict):
+        for client in list(self._clients):
+            try:
+                client.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow: drop what it has queued and end its stream; it resumes via Last-Event-ID
+                self._clients.discard(client)
+                self.dropped_clients += 1
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                client.queue.put_nowait(None)
+
+    def subscribe(self, last_event_id: int | None = None) -> _Client:
+        """Register a client; with ``last_event_id`` the buffered events after it are replayed first."""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            replay = []
+            if last_event_id is not None:
+                oldest = self.history[0]["id"] if self.history else self._next_id
+                stale = last_event_id < oldest - 1 or last_event_id >= self._next_id
+                # An id this run never issued: replay the whole buffer after the reset
+                start = oldest - 1 if last_event_id >= self._next_id else last_event_id
+                replay = [e for e in self.history if e["id"] > start]
+                if stale:
+                    reset = _event("reset", {"reason": "events after the given id are no longer buffered"})
+                    reset["id"] = start
+                    replay.insert(0, reset)
+        client = _Client(replay, self.client_queue)
+        self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client: _Client):
+        self._clients.discard(client)
+
+
+class EventFile:
+    """Append events as JSON lines so another process can stream them (see :func:`follow_event_file`)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def emit(self, event_type: str, data: dict):
+        line = json.dumps(_event(event_type, data), separators=(",", ":"), default=str)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass
+
+
+async def follow_event_file(path: str, offset: int | None, is_disconnected: Callable[[], Awaitable[bool]],
+                            poll_seconds: float = 0.5, keepalive_seconds: float = 15.0) -> AsyncIterator[bytes]:
+    """Yield SSE frames for events appended to an :class:`EventFile` after byte ``offset``.
+
+    Event ids are the byte offset just past each event's line, so resuming
+    from ``Last-Event-ID`` is a single seek. ``offset=None`` starts at the
+    current end of the file. Reading is paced by the consumer, so a slow
+    client only falls behind in the file rather than buffering in memory.
+    """
+    if offset is None:
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+    idle = 0.0
+    while not await is_disconnected():
+        try:
+            data, start, end = await asyncio.to_thread(read_from, path, offset, 256 * 1024, True)
+        except FileNotFoundError:
+            data, start, end = b"", offset, offset
+        if start != offset:
+            yield format_sse(start, "reset", {"reason": "event file was truncated"})
+        offset = end
+        if data:
+            idle = 0.0
+            position = start
+            for line in data.splitlines(keepends=True):
+                position += len(line)
+                try:
+                    event = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                yield format_sse(position, event.get("type", "message"), event)
+            continue
+        await asyncio.sleep(poll_seconds)
+        idle += poll_seconds
+        if idle >= keepalive_seconds:
+            idle = 0.0
+            yield KEEPALIVE
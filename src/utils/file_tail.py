@@ -0,0 +1,69 @@
+"""Bounded reads from the end or an offset of growing log files."""
+
+from __future__ import annotations
+
+import os
+
+_BLOCK = 64 * 1024
+
+
+def file_etag(path: str) -> str | None:
+    """Return a strong ETag derived from the file's size and modification time."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def tail_bytes(path: str, limit: int) -> tuple[bytes, int]:
+    """Return the last ``limit`` bytes of ``path`` and the file size they end at."""
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - limit))
+        return f.read(size - f.tell()), size
+
+
+def tail_lines(path: str, count: int, max_bytes: int = 4 * 1024 * 1024) -> tuple[bytes, int]:
+    """Return the last ``count`` lines of ``path`` by reading blocks backwards from the end.
+
+    At most ``max_bytes`` are read, so a file without newlines still costs a
+    bounded amount. The second value is the file size the lines end at.
+    """
+    if count <= 0:
+        return b"", os.path.getsize(path)
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        data = b""
+        # One newline more than ``count``: the trailing newline ends the last line
+        while pos > 0 and size - pos < max_bytes and data.count(b"\n") <= count:
+            step = min(_BLOCK, pos, max_bytes - (size - pos))
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines(keepends=True)
+    if pos > 0 and lines:
+        # The read started mid-line
+        lines = lines[1:]
+    return b"".join(lines[-count:]), size
+
+
+def read_from(path: str, offset: int, max_bytes: int, whole_lines: bool = False) -> tuple[bytes, int, int]:
+    """Read up to ``max_bytes`` starting at ``offset``.
+
+    Returns ``(data, start, next_offset)``. An offset past the end of the
+    file means it was truncated or rotated since the cursor was issued, so
+    reading restarts at 0. With ``whole_lines`` a trailing partial line is
+    left for the next read, unless it alone fills ``max_bytes``.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        start = offset if 0 <= offset <= size else 0
+        f.seek(start)
+        data = f.read(min(max_bytes, size - start))
+    if whole_lines and data and not data.endswith(b"\n"):
+        cut = data.rfind(b"\n") + 1
+        if cut or len(data) < max_bytes:
+            data = data[:cut]
+    return data, start, start + len(data)
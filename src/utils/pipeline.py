@@ -0,0 +1,100 @@
+"""Staged cycle execution: per-stage timing and per-asset execution lanes."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from src.agent.latency import percentile
+
+
+class StageStats:
+    """Rolling time-in-stage samples plus a count of items currently in the stage."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+        self.completed = 0
+        self.in_flight = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.completed += 1
+
+    def snapshot(self) -> dict:
+        samples = list(self.samples)
+        return {
+            "completed": self.completed,
+            "in_flight": self.in_flight,
+            "p50": round(percentile(samples, 50), 4) if samples else None,
+            "p95": round(percentile(samples, 95), 4) if samples else None,
+            "max": round(max(samples), 4) if samples else None,
+        }
+
+
+class AssetLanes:
+    """Execute work items in FIFO order per asset, with assets running independently.
+
+    Each asset gets a bounded queue and one worker task, created on first
+    use. :meth:`submit` waits while an asset's queue is full, so a stuck
+    exchange call applies backpressure to that asset only. Time spent queued
+    and time spent in ``handler`` are tracked separately.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], maxsize: int = 4):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.queued = StageStats()
+        self.executing = StageStats()
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._busy: set[str] = set()
+
+    def _lane(self, asset: str) -> asyncio.Queue:
+        queue = self._queues.get(asset)
+        if queue is None:
+            queue = self._queues[asset] = asyncio.Queue(maxsize=self.maxsize)
+            self._workers[asset] = asyncio.create_task(self._work(asset, queue))
+        return queue
+
+    async def submit(self, asset: str, item: Any):
+        """Queue ``item`` behind any earlier work for ``asset``."""
+        queue = self._lane(asset)
+        self.queued.in_flight += 1
+        await queue.put((time.monotonic(), item))
+
+    async def _work(self, asset: str, queue: asyncio.Queue):
+        while True:
+            enqueued, item = await queue.get()
+            self.queued.in_flight -= 1
+            started = time.monotonic()
+            self.queued.record(started - enqueued)
+            self._busy.add(asset)
+            self.executing.in_flight += 1
+            try:
+                await self.handler(item)
+            except Exception as e:
+                logging.error("Execution lane %s failed: %s", asset, e)
+            finally:
+                self.executing.in_flight -= 1
+                self._busy.discard(asset)
+                self.executing.record(time.monotonic() - started)
+                queue.task_done()
+
+    def pending_assets(self) -> set[str]:
+        """Assets with work queued or executing."""
+        return {asset for asset, queue in self._queues.items() if queue.qsize()} | set(self._busy)
+
+    async def drain(self):
+        """Wait until every queued item has been handled."""
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+    def snapshot(self) -> dict:
+        return {
+            "queue_depth": {asset: queue.qsize() for asset, queue in self._queues.items()},
+            "executing": sorted(self._busy),
+            "time_queued": self.queued.snapshot(),
+            "time_executing": self.executing.snapshot(),
+        }
@@ -0,0 +1,213 @@
+"""Background-written debug logs with rotation, compressed segments and sampling."""
+
+from __future__ import annotations
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+from datetime import datetime
+
+_logs: dict[str, "RotatingLog"] = {}
+_logs_lock = threading.Lock()
+
+
+class Blob:
+    """Large, repeated text (e.g. the system prompt) that is written once per segment.
+
+    The first record in a segment that carries a given blob is preceded by a
+    ``{"type": "blob", "sha256": ..., "content": ...}`` record; every
+    occurrence is then written as ``{"$blob": sha256}``. Each segment stays
+    self-contained, so a rotated file can be read on its own.
+    """
+
+    __slots__ = ("text", "digest")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RotatingLog:
+    """Append-only log written by one daemon thread.
+
+    :meth:`write` only samples and enqueues; formatting, blob dedup and file
+    I/O happen on the writer thread. When the queue is full the record is
+    dropped and counted rather than blocking the caller. The active file is
+    rotated once it exceeds ``max_bytes`` or is older than ``max_age_seconds``;
+    rotated segments are renamed with a timestamp, compressed (``"gzip"``,
+    ``"zstd"`` when the ``zstandard`` package is installed, or ``None``) and
+    pruned to the newest ``backups``.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50_000_000, max_age_seconds: float | None = 86400,
+                 backups: int = 5, compression: str | None = "gzip", sample_rate: float = 1.0,
+                 queue_size: int = 1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.backups = backups
+        self.compression = compression
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.sampled_out = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = 0.0
+        self._blobs: set[str] = set()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record, force: bool = False) -> bool:
+        """Queue ``record`` (a dict, written as compact JSON, or preformatted text).
+
+        Returns False when the record was sampled out or dropped. ``force``
+        bypasses sampling, for records such as errors that should always be kept.
+        """
+        if not force and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    return
+                self._write(record)
+            except Exception as e:
+                logging.warning("Could not write %s: %s", self.path, e)
+            finally:
+                self._queue.task_done()
+
+    def _encode(self, value):
+        if isinstance(value, Blob):
+            return {"$blob": value.digest}
+        return str(value)
+
+    def _new_blobs(self, value, found: list):
+        """Collect blobs in ``value`` not yet written to the current segment."""
+        if isinstance(value, Blob):
+            if value.digest not in self._blobs and all(b.digest != value.digest for b in found):
+                found.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self._new_blobs(item, found)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._new_blobs(item, found)
+
+    def _write(self, record):
+        self._maybe_rotate()
+        if isinstance(record, str):
+            text = record
+        else:
+            blobs = []
+            self._new_blobs(record, blobs)
+            lines = [json.dumps({"type": "blob", "sha256": b.digest, "content": b.text}, separators=(",", ":"))
+                     for b in blobs]
+            lines.append(json.dumps(record, separators=(",", ":"), default=self._encode))
+            text = "\n".join(lines) + "\n"
+            self._blobs.update(b.digest for b in blobs)
+        self._file.write(text)
+        self._file.flush()
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            self._open()
+        size = self._file.tell()
+        expired = self.max_age_seconds and time.time() - self._opened_at >= self.max_age_seconds
+        if size and (size >= self.max_bytes or expired):
+            self._file.close()
+            self._file = None
+            segment = f"{self.path}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+            try:
+                os.replace(self.path, segment)
+            except FileNotFoundError:
+                # Another process rotated it first
+                segment = None
+            self._open()
+            if segment:
+                self._compress(segment)
+            self._prune()
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        # Age counts from when this process opened the segment
+        self._opened_at = time.time()
+        self._blobs = set()
+
+    def _compress(self, segment: str):
+        compression = self.compression
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                logging.warning("zstandard is not installed; compressing %s with gzip", segment)
+                compression = "gzip"
+            else:
+                with open(segment, "rb") as src, open(f"{segment}.zst", "wb") as dst:
+                    zstandard.ZstdCompressor().copy_stream(src, dst)
+                os.remove(segment)
+                return
+        if compression == "gzip":
+            with open(segment, "rb") as src, gzip.open(f"{segment}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment)
+
+    def _prune(self):
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        segments = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+        for name in segments[:max(0, len(segments) - self.backups)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def config_options(config: dict, sample_rate_key: str) -> dict:
+    """Build :class:`RotatingLog` options from the ``debug_log_*`` settings and a sampling key."""
+    compression = (config.get("debug_log_compression") or "none").lower()
+    return {
+        "max_bytes": config.get("debug_log_max_bytes") or 50_000_000,
+        "max_age_seconds": config.get("debug_log_max_age_seconds") or None,
+        "backups": config.get("debug_log_backups") or 0,
+        "compression": None if compression == "none" else compression,
+        "sample_rate": config.get(sample_rate_key) if config.get(sample_rate_key) is not None else 1.0,
+    }
+
+
+def open_log(path: str, **options) -> RotatingLog:
+    """Return the process-wide :class:`RotatingLog` for ``path``, creating it with ``options``."""
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = RotatingLog(path, **options)
+        return log
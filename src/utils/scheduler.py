@@ -0,0 +1,191 @@
+"""Wall-clock aligned cycle scheduling for the trading loops."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+from src.agent.latency import percentile
+
+
+@dataclass
+class Tick:
+    """One scheduler firing.
+
+    Attributes:
+        scheduled: Epoch seconds of the boundary (including the offset).
+        fired: Epoch seconds at which the wait actually returned.
+        jitter: ``fired - scheduled`` in seconds.
+        skipped: Boundaries passed over because the previous cycle overran.
+    """
+
+    scheduled: float
+    fired: float
+    jitter: float
+    skipped: int
+
+
+class CycleScheduler:
+    """Fire cycles on multiples of the interval since the epoch, plus an offset.
+
+    Sleeping for a fixed interval after each cycle makes the real period
+    ``interval + cycle time`` and lets cycles drift away from candle closes.
+    Here every tick targets the next boundary ``k * interval + offset``
+    instead, so a 5m loop with a 2s offset runs at :00:02, :05:02, ... UTC,
+    just after each 5m candle has closed. A cycle that overruns one or more
+    boundaries waits for the next future one; the missed ticks are counted
+    and logged, never run back to back.
+    """
+
+    def __init__(self, interval_seconds: float, offset_seconds: float = 0.0, window: int = 200):
+        self.interval = float(interval_seconds)
+        self.offset = float(offset_seconds) % self.interval
+        self.last_scheduled: float | None = None
+        self.ticks = 0
+        self.skipped = 0
+        self._jitter: deque = deque(maxlen=window)
+
+    def set_interval(self, interval_seconds: float):
+        """Switch to a new interval; the next tick aligns to its boundaries."""
+        self.interval = float(interval_seconds)
+
+    def next_boundary(self, now: float | None = None) -> float:
+        """Return the first boundary strictly after ``now`` (epoch seconds)."""
+        now = time.time() if now is None else now
+        return (math.floor((now - self.offset) / self.interval) + 1) * self.interval + self.offset
+
+    async def wait(self) -> Tick:
+        """Sleep until the next boundary and return the resulting :class:`Tick`."""
+        target = self.next_boundary()
+        skipped = 0
+        if self.last_scheduled is not None:
+            skipped = max(0, round((target - self.last_scheduled) / self.interval) - 1)
+        if skipped:
+            self.skipped += skipped
+            logging.warning(
+                "Cycle overran its %.0fs interval; skipping %d missed tick(s), next at %s",
+                self.interval, skipped, time.strftime("%H:%M:%S", time.gmtime(target)),
+            )
+        delay = target - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        fired = time.time()
+        tick = Tick(scheduled=target, fired=fired, jitter=fired - target, skipped=skipped)
+        self.last_scheduled = target
+        self.ticks += 1
+        self._jitter.append(tick.jitter)
+        return tick
+
+    def snapshot(self) -> dict:
+        """Return tick counts and wake-up jitter statistics (seconds)."""
+        jitter = list(self._jitter)
+        return {
+            "interval_seconds": self.interval,
+            "offset_seconds": self.offset,
+            "ticks": self.ticks,
+            "skipped_ticks": self.skipped,
+            "next_tick": self.next_boundary(),
+            "jitter": {
+                "p50": round(percentile(jitter, 50), 4) if jitter else None,
+                "p95": round(percentile(jitter, 95), 4) if jitter else None,
+                "max": round(max(jitter), 4) if jitter else None,
+            },
+        }
+
+
+# Candle intervals the adaptive cadence may step between (seconds)
+CADENCE_LADDER = (60, 180, 300, 900, 1800, 3600, 7200, 14400, 86400)
+
+
+def cadence_signals(price_history: dict, market_sections: list, open_orders: list) -> dict:
+    """Compute the cheap local inputs for :class:`AdaptiveCadence`.
+
+    Args:
+        price_history: ``{asset: [{"t": iso, "mid": price}, ...]}`` sampled once per cycle.
+        market_sections: Market data entries with ``current_price`` and ``long_term.atr14``.
+        open_orders: Open orders with ``coin`` and ``trigger_price`` (TP/SL triggers).
+
+    Returns:
+        ``{"vol_ratio", "trigger_distance_pct"}`` where ``vol_ratio`` is the
+        highest per-asset ratio of realized per-minute volatility (from the
+        sampled mids) to the volatility implied by the 4h ATR, and
+        ``trigger_distance_pct`` is the closest TP/SL trigger to its price.
+        Either is ``None`` when there is not enough data.
+    """
+    prices = {m.get("asset"): m.get("current_price") for m in market_sections}
+    vol_ratio = None
+    for section in market_sections:
+        asset, price = section.get("asset"), section.get("current_price")
+        atr = (section.get("long_term") or {}).get("atr14")
+        samples = list(price_history.get(asset) or [])[-20:]
+        if not price or not atr or len(samples) < 3:
+            continue
+        squared, minutes = 0.0, 0.0
+        for prev, cur in zip(samples, samples[1:]):
+            if not prev.get("mid") or not cur.get("mid"):
+                continue
+            dt = (datetime.fromisoformat(cur["t"]) - datetime.fromisoformat(prev["t"])).total_seconds() / 60
+            if dt <= 0:
+                continue
+            squared += math.log(cur["mid"] / prev["mid"]) ** 2
+            minutes += dt
+        if minutes <= 0:
+            continue
+        realized = math.sqrt(squared / minutes)
+        # A 4h ATR spread evenly over 240 one-minute steps
+        implied = (atr / price) / math.sqrt(240)
+        ratio = realized / implied if implied > 0 else None
+        if ratio is not None:
+            vol_ratio = ratio if vol_ratio is None else max(vol_ratio, ratio)
+
+    trigger_distance = None
+    for order in open_orders:
+        price, trigger = prices.get(order.get("coin")), order.get("trigger_price")
+        if price and trigger:
+            distance = abs(price - trigger) / price * 100.0
+            trigger_distance = distance if trigger_distance is None else min(trigger_distance, distance)
+    return {"vol_ratio": vol_ratio, "trigger_distance_pct": trigger_distance}
+
+
+class AdaptiveCadence:
+    """Step the loop interval along :data:`CADENCE_LADDER` from cheap local signals.
+
+    Each cycle moves at most one rung: faster (toward ``min_seconds``) when
+    realized volatility runs well above what the 4h ATR implies or a TP/SL
+    trigger is close to price, slower (toward ``max_seconds``) when realized
+    volatility is well below it, and back toward the base interval otherwise.
+    """
+
+    def __init__(self, base_seconds: float, min_seconds: float, max_seconds: float,
+                 active_ratio: float = 1.5, quiet_ratio: float = 0.5, trigger_pct: float = 0.5):
+        self.base = base_seconds
+        self.ladder = sorted({r for r in CADENCE_LADDER if min_seconds <= r <= max_seconds} | {base_seconds})
+        self.current = base_seconds
+        self.active_ratio = active_ratio
+        self.quiet_ratio = quiet_ratio
+        self.trigger_pct = trigger_pct
+
+    def update(self, signals: dict) -> tuple[float, str | None]:
+        """Return ``(interval_seconds, reason)``; ``reason`` is ``None`` when the interval is unchanged."""
+        ratio, trigger = signals.get("vol_ratio"), signals.get("trigger_distance_pct")
+        index = self.ladder.index(self.current)
+        base_index = self.ladder.index(self.base)
+        if trigger is not None and trigger <= self.trigger_pct:
+            target, reason = index - 1, f"TP/SL trigger {trigger:.2f}% from price"
+        elif ratio is not None and ratio >= self.active_ratio:
+            target, reason = index - 1, f"realized volatility {ratio:.1f}x ATR-implied"
+        elif ratio is not None and ratio <= self.quiet_ratio:
+            target, reason = index + 1, f"realized volatility {ratio:.1f}x ATR-implied"
+        else:
+            target = index + (base_index > index) - (base_index < index)
+            reason = "conditions normal" if ratio is not None else "not enough price history"
+        target = min(max(target, 0), len(self.ladder) - 1)
+        if target == index:
+            return self.current, None
+        previous, self.current = self.current, self.ladder[target]
+        return self.current, f"{previous:.0f}s -> {self.current:.0f}s: {reason}"